@@ -0,0 +1,417 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import argparse
+import gc
+import json
+import platform
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.bench_harness import replicate_dataset
+from benchmarks.mock_server import load_completions
+from eval.json_mode.engine import parse_json_completion
+from eval.metrics import distribution
+from eval.pythonic.engine import (
+    compile_dataset_mock_functions,
+    execute_python_code,
+    import_functions,
+)
+from eval.schemas import FunctionResults, PythonicRow
+from eval.settings import (
+    JSON_SYSTEM_PROMPT_PATH,
+    PYTHONIC_DATA_PATH,
+    PYTHONIC_SYSTEM_PROMPT_PATH,
+)
+from eval.util import (
+    extract_codeblocks,
+    insert_functions_schema,
+    load_pythonic_jsonl,
+    load_system_prompt,
+)
+
+# Example values of the parameter descriptions, such as (e.g., "BankGuard")
+EXAMPLE_PATTERN = re.compile(r'e\.g\.,? "([^"]+)"')
+# Arguments of reference calls for parameters without an example, by JSON type
+PLACEHOLDERS = {
+    "string": "example",
+    "integer": 1,
+    "number": 1.0,
+    "boolean": True,
+    "array": [],
+    "object": {},
+}
+# Calls whose allocations are traced per case, tracing slows calls down several times
+ALLOCATION_SAMPLE = 1000
+
+
+def reference_calls(row: PythonicRow) -> List[Dict[str, Any]]:
+    """
+    Build a deterministic call of each function of a row.
+
+    Arguments are taken from the examples in the parameter descriptions, and fall
+    back to a placeholder of the parameter's type.
+    """
+    calls = []
+    for function in row.function_schema_json:
+        args = {}
+        for name, schema in function.parameters.properties.items():
+            example = EXAMPLE_PATTERN.search(schema.get("description") or "")
+            if example is not None and schema.get("type") == "string":
+                args[name] = example.group(1)
+            else:
+                args[name] = PLACEHOLDERS.get(schema.get("type"), "example")
+        calls.append({"name": function.name, "args": args})
+    return calls
+
+
+def reference_completions(row: PythonicRow) -> Dict[str, str]:
+    """
+    Build a completion of each mode for a row, shaped like typical model output.
+
+    Returns:
+        Dict mapping the mode to the completion
+    """
+    calls = reference_calls(row)
+    code = "\n".join(
+        "result_{} = {}({})".format(
+            i,
+            call["name"],
+            ", ".join(f"{name}={value!r}" for name, value in call["args"].items()),
+        )
+        for i, call in enumerate(calls)
+    )
+    return {
+        "pythonic": (
+            "I will call the functions in order.\n\n```python\n"
+            f"{code}\n```\n\nEach result is stored in a variable."
+        ),
+        "json": f"```json\n{json.dumps(calls, indent=2)}\n```",
+    }
+
+
+def build_inputs(
+    rows: Sequence[PythonicRow], saved: Dict[Tuple[str, str], str]
+) -> List[Dict[str, Any]]:
+    """
+    Pin the inputs of every case for each row.
+
+    Args:
+        rows: Rows of the dataset
+        saved: Completions of previous runs by (mode, user query), used in place of
+            the reference completions when available
+
+    Returns:
+        Per-row inputs
+    """
+    inputs = []
+    for row in rows:
+        completions = reference_completions(row)
+        for mode in completions:
+            completions[mode] = saved.get((mode, row.user_query), completions[mode])
+        code = extract_codeblocks(completions["pythonic"])
+        functions = import_functions(row.mock_functions)
+        # Executed once up front, so that check_score scores realistic results
+        results = execute_python_code(code, functions, timeout=None)
+        inputs.append(
+            {
+                "row": row,
+                "completions": completions,
+                "code": code,
+                "json_schema": json.dumps(
+                    [schema.model_dump() for schema in row.function_schema_json],
+                    indent=4,
+                ),
+                "results": results,
+            }
+        )
+    return inputs
+
+
+def cases(
+    data_path: str, inputs: List[Dict[str, Any]]
+) -> Dict[str, Tuple[Callable, List[tuple]]]:
+    """
+    Define the benchmarked functions and the arguments of each of their calls.
+
+    Returns:
+        Dict mapping the case name to the function and its per-call arguments
+    """
+    pythonic_prompt = load_system_prompt(PYTHONIC_SYSTEM_PROMPT_PATH)
+    json_prompt = load_system_prompt(JSON_SYSTEM_PROMPT_PATH)
+
+    def check_score(results: FunctionResults, values: list, functions: List[str]):
+        # Fresh results build their value index once, as in the pipeline
+        return results.model_copy().check_score(values, functions)
+
+    def insert_schemas(python_schema: str, json_schema: str):
+        insert_functions_schema(pythonic_prompt, python_schema)
+        insert_functions_schema(json_prompt, json_schema)
+
+    return {
+        "import_functions": (
+            import_functions,
+            [(i["row"].mock_functions,) for i in inputs],
+        ),
+        # Functions are imported afresh for every execution, as the sandbox does
+        "execute_python_code": (
+            lambda code, source: execute_python_code(
+                code, import_functions(source), timeout=None
+            ),
+            [(i["code"], i["row"].mock_functions) for i in inputs],
+        ),
+        "check_score": (
+            check_score,
+            [
+                (
+                    i["results"],
+                    i["row"].checklist.values,
+                    i["row"].checklist.functions,
+                )
+                for i in inputs
+            ],
+        ),
+        "parse_json_completion": (
+            parse_json_completion,
+            [(i["completions"]["json"],) for i in inputs],
+        ),
+        "extract_codeblocks": (
+            extract_codeblocks,
+            [(i["completions"]["pythonic"],) for i in inputs],
+        ),
+        "insert_functions_schema": (
+            insert_schemas,
+            [(i["row"].function_schema_python, i["json_schema"]) for i in inputs],
+        ),
+        # A single call loading the whole dataset
+        "load_pythonic_jsonl": (load_pythonic_jsonl, [(data_path,)]),
+    }
+
+
+def measure(
+    function: Callable, calls: List[tuple], repeat: int = 1
+) -> Dict[str, Any]:
+    """
+    Time every call of a function, then trace the allocations of a sample of calls.
+
+    Args:
+        function: The function to benchmark
+        calls: Arguments of each call
+        repeat: Number of times to make every call
+
+    Returns:
+        The latency distribution in microseconds, and the bytes allocated at the
+        peak of a call and the memory blocks it left allocated
+    """
+    timings = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            for args in calls:
+                start = time.perf_counter_ns()
+                function(*args)
+                timings.append((time.perf_counter_ns() - start) / 1000)
+    finally:
+        gc.enable()
+
+    sample = calls[:ALLOCATION_SAMPLE]
+    peaks = []
+    # Outputs are kept alive, so that the blocks they hold count as retained
+    outputs = []
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        for args in sample:
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            outputs.append(function(*args))
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    retained = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+
+    timings.sort()
+    return {
+        "calls": len(timings),
+        "total_ms": sum(timings) / 1000,
+        "latency_us": {
+            **distribution(timings),
+            "min": timings[0],
+            "max": timings[-1],
+        },
+        "peak_bytes": distribution([float(peak) for peak in peaks]),
+        # Blocks of the outputs, and of anything cached or leaked by the calls
+        "retained_blocks": retained / len(sample),
+    }
+
+
+def run_benchmarks(
+    data_path: str,
+    rows: int,
+    names: Optional[List[str]],
+    completions_files: List[str],
+    repeat: int,
+) -> Dict[str, Any]:
+    """
+    Benchmark the engine functions over the rows of a dataset.
+
+    Args:
+        data_path: Dataset the inputs are taken from
+        rows: Number of rows to benchmark, replicating the dataset as needed
+        names: Names of the cases to run (Optional, default: all)
+        completions_files: results.jsonl files of runs whose completions are used
+        repeat: Number of times to make every call
+
+    Returns:
+        Results of each case
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        data_path = replicate_dataset(data_path, rows, directory)
+        dataset = load_pythonic_jsonl(data_path)
+        # Mock functions are compiled ahead of evaluation, and so are they here
+        compile_dataset_mock_functions(row.mock_functions for row in dataset)
+        inputs = build_inputs(dataset, load_completions(completions_files))
+
+        results = {}
+        for name, (function, calls) in cases(data_path, inputs).items():
+            if names and name not in names:
+                continue
+            results[name] = measure(function, calls, repeat)
+            latency = results[name]["latency_us"]
+            print(
+                "{:<24}{:>9} calls  p50 {:>10.1f}us  p99 {:>10.1f}us".format(
+                    name, results[name]["calls"], latency["p50"], latency["p99"]
+                ),
+                file=sys.stderr,
+            )
+    return results
+
+
+def diff(
+    old: Dict[str, Any], new: Dict[str, Any], threshold: float
+) -> Tuple[List[str], List[str]]:
+    """
+    Compare two benchmark outputs.
+
+    Args:
+        old: Benchmark output to compare with
+        new: Benchmark output to compare
+        threshold: Relative change in median latency reported as a regression or
+            an improvement
+
+    Returns:
+        Table lines of the cases of both outputs, and descriptions of the
+        regressions
+    """
+    lines = [
+        "{:<24}{:>12}{:>12}{:>9}{:>14}{:>14}".format(
+            "case", "old p50 us", "new p50 us", "change", "old peak B", "new peak B"
+        )
+    ]
+    regressions = []
+    for name, result in new["cases"].items():
+        previous = old["cases"].get(name)
+        if previous is None:
+            continue
+        old_p50 = previous["latency_us"]["p50"]
+        new_p50 = result["latency_us"]["p50"]
+        change = new_p50 / old_p50 - 1 if old_p50 else 0.0
+        mark = ""
+        if change > threshold:
+            mark = "  slower"
+            regressions.append(f"{name}: p50 {old_p50:.1f}us -> {new_p50:.1f}us")
+        elif change < -threshold:
+            mark = "  faster"
+        lines.append(
+            "{:<24}{:>12.1f}{:>12.1f}{:>+8.1f}%{:>14.0f}{:>14.0f}{}".format(
+                name,
+                old_p50,
+                new_p50,
+                100 * change,
+                previous["peak_bytes"]["mean"],
+                result["peak_bytes"]["mean"],
+                mark,
+            )
+        )
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmark the engine functions on pinned dataset inputs"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run the benchmarks")
+    run.add_argument("--data", default=PYTHONIC_DATA_PATH)
+    run.add_argument(
+        "--rows",
+        type=int,
+        default=None,
+        help="Rows to benchmark, replicating the dataset (e.g. 10000 or 100000)",
+    )
+    run.add_argument("--repeat", type=int, default=1, help="Times to make every call")
+    run.add_argument(
+        "--cases", nargs="*", default=None, help="Cases to run (default: all)"
+    )
+    run.add_argument(
+        "--completions",
+        nargs="*",
+        default=[],
+        help="results.jsonl files of runs whose completions replace the reference ones",
+    )
+    run.add_argument("--output", default=None, help="File to write the results to")
+
+    compare = commands.add_parser("diff", help="Compare two benchmark outputs")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    compare.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative change in median latency to flag",
+    )
+    compare.add_argument(
+        "--fail", action="store_true", help="Exit with status 1 on regressions"
+    )
+    args = parser.parse_args()
+
+    if args.command == "diff":
+        with open(args.old, "r") as f:
+            old = json.load(f)
+        with open(args.new, "r") as f:
+            new = json.load(f)
+        if old["rows"] != new["rows"]:
+            print(f"Warning: comparing {old['rows']} rows with {new['rows']} rows")
+        lines, regressions = diff(old, new, args.threshold)
+        print("\n".join(lines))
+        if regressions and args.fail:
+            sys.exit(1)
+        return
+
+    with open(args.data, "r") as f:
+        dataset_rows = sum(1 for line in f if line.strip())
+    rows = args.rows or dataset_rows
+    results = {
+        "data_path": args.data,
+        "rows": rows,
+        "repeat": args.repeat,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cases": run_benchmarks(
+            args.data, rows, args.cases, args.completions, args.repeat
+        ),
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+from typing import Any, Dict, List, Optional
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+# The eval package is imported once MOCK_SERVER_URL is set, see `run_benchmarks`
+
+# Mock server configuration and evaluation options of each scenario
+SCENARIOS = {
+    # No latency, so the run time is the harness's own overhead
+    "overhead": ({}, {}),
+    "latency": ({"latency": "lognormal:0.2,0.5"}, {}),
+    "errors": ({"latency": "0.05", "error_rate": 0.05, "retry_after": 0.05}, {}),
+    "streaming": (
+        {"latency": "0.05", "tokens_per_second": 500, "trailing_words": 200},
+        {"stream": True},
+    ),
+}
+MODES = ["pythonic", "json"]
+MODEL_NAME = "bench"
+# Mock server settings each scenario starts from
+DEFAULT_CONFIG = {
+    "latency": "0",
+    "tokens_per_second": 0.0,
+    "error_rate": 0.0,
+    "trailing_words": 0,
+    "max_concurrency": 0,
+}
+
+
+async def _http(
+    host: str, port: int, method: str, path: str, body: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Send a request to the mock server's control API."""
+    reader, writer = await asyncio.open_connection(host, port)
+    data = json.dumps(body or {}).encode("utf-8")
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: {host}\r\n"
+        f"Content-Length: {len(data)}\r\n\r\n".encode("latin-1")
+        + data
+    )
+    await writer.drain()
+    headers = {}
+    await reader.readline()
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    payload = json.loads(await reader.readexactly(int(headers["content-length"])))
+    writer.close()
+    return payload
+
+
+async def _wait_for_server(host: str, port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await _http(host, port, "GET", "/health")
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def replicate_dataset(data_path: str, rows: int, directory: str) -> str:
+    """
+    Repeat the rows of a .jsonl dataset up to the given number of rows.
+
+    Returns:
+        Path of the dataset to benchmark with
+    """
+    with open(data_path, "r") as f:
+        lines = [line.rstrip("\n") + "\n" for line in f if line.strip()]
+    if rows == len(lines):
+        return data_path
+    path = os.path.join(directory, f"bench_{rows}.jsonl")
+    with open(path, "w") as f:
+        f.writelines(itertools.islice(itertools.cycle(lines), rows))
+    return path
+
+
+async def run_benchmarks(
+    data_path: str, scenarios: List[str], host: str, port: int
+) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Evaluate every mode of every scenario against a local mock server.
+
+    Args:
+        data_path: Dataset to evaluate
+        scenarios: Names of the scenarios to run
+        host: Host of the mock server
+        port: Port of the mock server
+
+    Returns:
+        Throughput of each mode, by scenario
+    """
+    # Imported here, so that MOCK_SERVER_URL is set before the settings are loaded
+    from eval.cache import CacheMode
+    from eval.json_mode import evaluate_model_json
+    from eval.pythonic import evaluate_model_pythonic
+    from eval.settings import JSON_RESULTS_PATH, PYTHONIC_RESULTS_PATH
+
+    evaluators = {
+        "pythonic": (evaluate_model_pythonic, PYTHONIC_RESULTS_PATH),
+        "json": (evaluate_model_json, JSON_RESULTS_PATH),
+    }
+    with open(data_path, "r") as f:
+        rows = sum(1 for line in f if line.strip())
+
+    server = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        "benchmarks.mock_server",
+        "--host",
+        host,
+        "--port",
+        str(port),
+        "--seed",
+        "0",
+        "--data",
+        data_path,
+    )
+    results = {}
+    try:
+        await _wait_for_server(host, port)
+        for name in scenarios:
+            config, options = SCENARIOS[name]
+            results[name] = {}
+            for mode in MODES:
+                await _http(host, port, "POST", "/config", {**DEFAULT_CONFIG, **config})
+                await _http(host, port, "POST", "/stats/reset")
+
+                evaluate, results_path = evaluators[mode]
+                wall_start = time.perf_counter()
+                cpu_start = time.process_time()
+                metrics = await evaluate(
+                    model_name=MODEL_NAME,
+                    provider="mock",
+                    data_path=data_path,
+                    cache_mode=CacheMode.bypass,
+                    **options,
+                )
+                wall_time = time.perf_counter() - wall_start
+                cpu_time = time.process_time() - cpu_start
+                stats = await _http(host, port, "GET", "/stats")
+
+                results[name][mode] = {
+                    "rows": rows,
+                    "seconds": wall_time,
+                    "rows_per_sec": rows / wall_time,
+                    "ms_per_row": 1000 * wall_time / rows,
+                    "cpu_ms_per_row": 1000 * cpu_time / rows,
+                    "accuracy": metrics["overall_accuracy"],
+                    "errors": len(metrics["errors"]),
+                    "server": stats,
+                }
+                shutil.rmtree(
+                    os.path.join(results_path, f"{MODEL_NAME}_mock"), ignore_errors=True
+                )
+    finally:
+        server.terminate()
+        await server.wait()
+    return results
+
+
+def compare(
+    results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    """
+    Find the runs whose throughput dropped below the baseline.
+
+    Args:
+        results: Benchmark output
+        baseline: Benchmark output to compare with
+        tolerance: Allowed relative drop in rows per second
+
+    Returns:
+        Descriptions of the regressions
+    """
+    regressions = []
+    for name, modes in results["scenarios"].items():
+        for mode, result in modes.items():
+            expected = baseline["scenarios"].get(name, {}).get(mode)
+            if expected is None:
+                continue
+            floor = expected["rows_per_sec"] * (1 - tolerance)
+            if result["rows_per_sec"] < floor:
+                regressions.append(
+                    "{}/{}: {:.1f} rows/s, baseline {:.1f} rows/s".format(
+                        name, mode, result["rows_per_sec"], expected["rows_per_sec"]
+                    )
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the evaluation harness against a local mock server"
+    )
+    parser.add_argument("--data", default="data/eval_alpha.jsonl")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument(
+        "--scenarios", nargs="*", choices=list(SCENARIOS), default=list(SCENARIOS)
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--output", default=None, help="File to write the results to")
+    parser.add_argument(
+        "--compare", default=None, help="Baseline results to compare with"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="Allowed relative drop in rows per second from the baseline",
+    )
+    args = parser.parse_args()
+
+    os.environ["MOCK_SERVER_URL"] = f"http://{args.host}:{args.port}/v1"
+
+    with tempfile.TemporaryDirectory() as directory:
+        data_path = replicate_dataset(args.data, args.rows, directory)
+        scenarios = asyncio.run(
+            run_benchmarks(data_path, args.scenarios, args.host, args.port)
+        )
+
+    results = {
+        "rows": args.rows,
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "scenarios": scenarios,
+    }
+
+    print(f"{'scenario':<12}{'mode':<10}{'rows/s':>10}{'ms/row':>10}{'cpu ms/row':>12}")
+    for name, modes in scenarios.items():
+        for mode, result in modes.items():
+            print(
+                "{:<12}{:<10}{:>10.1f}{:>10.2f}{:>12.2f}".format(
+                    name,
+                    mode,
+                    result["rows_per_sec"],
+                    result["ms_per_row"],
+                    result["cpu_ms_per_row"],
+                )
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Throughput regressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("No throughput regressions")
+
+
+if __name__ == "__main__":
+    main()
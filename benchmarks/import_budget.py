@@ -0,0 +1,112 @@
+from typing import Dict, List, Set, Tuple
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Command line of each scenario, its import time budget in milliseconds, and the
+# modules it must not import. Budgets leave about 2x headroom over a laptop run,
+# the heavy modules are only loaded once a request is actually sent
+SCENARIOS = {
+    "help": (
+        ["run.py", "--help"],
+        150,
+        ["openai", "httpx", "pydantic", "tqdm", "eval.model", "eval.rescore"],
+    ),
+    "pythonic": (
+        ["-c", "import run, eval.pythonic"],
+        500,
+        ["openai", "httpx", "tqdm", "eval.json_mode", "eval.sweep"],
+    ),
+    "json": (["-c", "import run, eval.json_mode"], 500, ["openai", "httpx", "tqdm"]),
+    "rescore": (["-c", "import run, eval.rescore"], 500, ["openai", "httpx"]),
+}
+
+
+def import_times(args: List[str]) -> Dict[str, int]:
+    """
+    Run Python with `-X importtime` and collect the time spent importing each module.
+
+    Args:
+        args: Arguments of the Python command
+
+    Returns:
+        Microseconds spent in each imported module itself, by module name
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_time, _, name = line[len("import time:") :].split("|")
+        if self_time.strip().isdigit():
+            times[name.strip()] = int(self_time)
+    return times
+
+
+def measure(args: List[str], repeat: int, baseline: Set[str]) -> Tuple[float, Set[str]]:
+    """
+    Measure the import time of a command, beyond what the interpreter imports itself.
+
+    Args:
+        args: Arguments of the Python command
+        repeat: Number of runs, the median is reported
+        baseline: Modules imported by the bare interpreter, not counted
+
+    Returns:
+        The median import time in milliseconds, and the modules imported
+    """
+    totals = []
+    modules: Set[str] = set()
+    for _ in range(repeat):
+        times = import_times(args)
+        modules = set(times)
+        totals.append(
+            sum(time for name, time in times.items() if name not in baseline) / 1000
+        )
+    return statistics.median(totals), modules
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check the import time of the CLI against a budget"
+    )
+    parser.add_argument(
+        "--scenarios", nargs="*", choices=list(SCENARIOS), default=list(SCENARIOS)
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per scenario")
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Factor applied to the budgets, for slower machines",
+    )
+    args = parser.parse_args()
+
+    baseline = set(import_times(["-c", "pass"]))
+    failures = []
+    print(f"{'scenario':<12}{'ms':>8}{'budget':>8}")
+    for name in args.scenarios:
+        command, budget, forbidden = SCENARIOS[name]
+        budget *= args.scale
+        elapsed, modules = measure(command, args.repeat, baseline)
+        print(f"{name:<12}{elapsed:>8.1f}{budget:>8.0f}")
+        if elapsed > budget:
+            failures.append(f"{name}: {elapsed:.1f}ms of imports, budget {budget:.0f}ms")
+        for module in forbidden:
+            if module in modules:
+                failures.append(f"{name}: imports {module}")
+
+    if failures:
+        print("Import budget exceeded:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("Within the import budget")
+
+
+if __name__ == "__main__":
+    main()
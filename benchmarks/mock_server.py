@@ -0,0 +1,403 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from http import HTTPStatus
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import re
+import time
+
+from eval.results import read_results
+from eval.settings import PYTHONIC_DATA_PATH
+from eval.util import load_pythonic_jsonl, setup_logger
+
+logger = setup_logger(__name__)
+
+# Completions served for requests matching no row of the dataset, by mode
+CANNED_COMPLETIONS = {
+    "pythonic": "Here is the code:\n\n```python\nresult = None\n```",
+    "json": '```json\n[]\n```',
+}
+# Chatter appended after the completion, as verbose models do
+FILLER = (
+    "The code above calls the available functions in order and stores each "
+    "result so that it can be used by the following calls."
+).split()
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Parse a latency distribution in seconds.
+
+    Args:
+        spec: A fixed latency such as "0.2", "uniform:<low>,<high>" or
+            "lognormal:<median>,<sigma>"
+
+    Returns:
+        Function drawing a latency from the distribution with the given generator
+    """
+    kind, _, params = spec.partition(":")
+    if not params:
+        value = float(kind)
+        return lambda rng: value
+    a, b = (float(param) for param in params.split(","))
+    if kind == "uniform":
+        return lambda rng: rng.uniform(a, b)
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(a), b)
+    raise ValueError(f"Unknown latency distribution '{spec}'")
+
+
+def request_mode(system_prompt: str) -> str:
+    """Tell which evaluation mode a request comes from by its system prompt."""
+    return "json" if "```json" in system_prompt else "pythonic"
+
+
+def _text(message: Dict[str, Any]) -> str:
+    """Text of a chat message, whose content is a string or a list of parts."""
+    content = message["content"]
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") for part in content)
+
+
+def reference_completions(data_path: str) -> Dict[Tuple[str, str], str]:
+    """
+    Build the reference completion of each mode for every row of a dataset.
+
+    Reference completions call each of the row's functions, so runs against the
+    server execute and score them as they would a model's completions.
+
+    Args:
+        data_path: Path to the dataset
+
+    Returns:
+        Dict mapping (mode, user query) to the completion
+    """
+    # Deferred, the engine benchmarks import this module
+    from benchmarks.bench_engine import reference_completions as row_completions
+
+    completions = {}
+    for row in load_pythonic_jsonl(data_path):
+        for mode, completion in row_completions(row).items():
+            completions[(mode, row.user_query)] = completion
+    return completions
+
+
+def load_completions(results_files: Iterable[str]) -> Dict[Tuple[str, str], str]:
+    """
+    Load the completions saved by previous runs to replay them.
+
+    Args:
+        results_files: Paths to results.jsonl files, each next to its manifest.json
+
+    Returns:
+        Dict mapping (mode, user query) to the saved completion
+    """
+    completions = {}
+    for results_file in results_files:
+        manifest_file = os.path.join(os.path.dirname(results_file), "manifest.json")
+        with open(manifest_file, "r") as f:
+            mode = json.load(f)["mode"]
+        for record in read_results(results_file):
+            if record.get("completion") is not None:
+                completions[(mode, record["user_query"])] = record["completion"]
+    return completions
+
+
+class MockServer:
+    """
+    Local stand-in for an OpenAI-compatible chat completions endpoint.
+
+    Replays completions per row, or serves canned ones, after a latency drawn
+    from a configurable distribution, streamed at `tokens_per_second` when asked
+    to. A fraction of requests fails with `error_status`, and at most
+    `max_concurrency` requests are served at once. The configuration can be
+    changed while running with `POST /config`, and request counts are served at
+    `GET /stats`.
+    """
+
+    def __init__(
+        self,
+        completions: Optional[Dict[Tuple[str, str], str]] = None,
+        seed: Optional[int] = None,
+        **config,
+    ):
+        self.completions = completions or {}
+        self.rng = random.Random(seed)
+        self.config = {
+            "latency": "0",
+            "tokens_per_second": 0.0,
+            "error_rate": 0.0,
+            "error_status": 429,
+            "retry_after": 0.1,
+            "trailing_words": 0,
+            "max_concurrency": 0,
+        }
+        self.configure(**config)
+        self.reset_stats()
+
+    def configure(self, **config):
+        """Update the configuration, see `main` for the available settings."""
+        unknown = set(config) - set(self.config)
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+        self.config.update(config)
+        self._latency = parse_latency(str(self.config["latency"]))
+        # Requests over the limit queue, as on a server with a fixed number of slots
+        limit = self.config["max_concurrency"]
+        self._slots = asyncio.Semaphore(limit) if limit else None
+
+    def reset_stats(self):
+        self.stats = {"requests": 0, "errors": 0, "streams": 0, "cancelled": 0}
+
+    async def serve(self, host: str, port: int):
+        """Serve until cancelled."""
+        server = await asyncio.start_server(self.handle, host, port)
+        logger.info(f"Mock server listening on http://{host}:{port}/v1")
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve the requests of a keep-alive connection."""
+        try:
+            while (request := await _read_request(reader)) is not None:
+                await self.route(*request, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(
+        self, method: str, path: str, body: Dict[str, Any], writer: asyncio.StreamWriter
+    ):
+        if method == "POST" and path.endswith("/chat/completions"):
+            if self._slots is None:
+                await self.complete(body, writer)
+            else:
+                async with self._slots:
+                    await self.complete(body, writer)
+        elif method == "GET" and path.endswith("/health"):
+            await _send_json(writer, 200, {"status": "ok"})
+        elif method == "GET" and path.endswith("/stats"):
+            await _send_json(writer, 200, self.stats)
+        elif method == "POST" and path.endswith("/stats/reset"):
+            self.reset_stats()
+            await _send_json(writer, 200, self.stats)
+        elif method == "POST" and path.endswith("/config"):
+            try:
+                self.configure(**body)
+            except ValueError as e:
+                await _send_json(writer, 400, {"error": {"message": str(e)}})
+            else:
+                await _send_json(writer, 200, self.config)
+        elif method == "GET" and path.endswith("/models"):
+            await _send_json(writer, 200, {"object": "list", "data": []})
+        else:
+            await _send_json(writer, 404, {"error": {"message": f"No route {path}"}})
+
+    def completion_text(self, messages: List[Dict[str, Any]]) -> str:
+        system_prompt = next(
+            (_text(m) for m in messages if m["role"] == "system"), ""
+        )
+        user_query = next(
+            (_text(m) for m in reversed(messages) if m["role"] == "user"), ""
+        )
+        mode = request_mode(system_prompt)
+        text = self.completions.get((mode, user_query), CANNED_COMPLETIONS[mode])
+        words = self.config["trailing_words"]
+        if words:
+            text += "\n\n" + " ".join(itertools.islice(itertools.cycle(FILLER), words))
+        return text
+
+    async def complete(self, body: Dict[str, Any], writer: asyncio.StreamWriter):
+        self.stats["requests"] += 1
+        if self.rng.random() < self.config["error_rate"]:
+            self.stats["errors"] += 1
+            status = self.config["error_status"]
+            headers = {}
+            if status == 429:
+                headers["Retry-After"] = str(self.config["retry_after"])
+            await _send_json(
+                writer, status, {"error": {"message": "Injected error"}}, headers
+            )
+            return
+
+        messages = body.get("messages", [])
+        # Split into word-sized tokens, keeping the whitespace
+        tokens = re.findall(r"\s*\S+|\s+", self.completion_text(messages))
+        usage = {
+            "prompt_tokens": sum(len(_text(m)) for m in messages) // 4,
+            "completion_tokens": len(tokens),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        await asyncio.sleep(self._latency(self.rng))
+        if body.get("stream"):
+            await self._stream(body, tokens, usage, writer)
+            return
+
+        tokens_per_second = self.config["tokens_per_second"]
+        if tokens_per_second:
+            await asyncio.sleep(len(tokens) / tokens_per_second)
+        message = {"role": "assistant", "content": "".join(tokens)}
+        await _send_json(
+            writer,
+            200,
+            {
+                **_envelope(body, "chat.completion"),
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                "usage": usage,
+            },
+        )
+
+    async def _stream(
+        self,
+        body: Dict[str, Any],
+        tokens: List[str],
+        usage: Dict[str, int],
+        writer: asyncio.StreamWriter,
+    ):
+        self.stats["streams"] += 1
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        envelope = _envelope(body, "chat.completion.chunk")
+        tokens_per_second = self.config["tokens_per_second"]
+        try:
+            for token in tokens:
+                delta = {"index": 0, "delta": {"content": token}, "finish_reason": None}
+                await _send_event(writer, {**envelope, "choices": [delta]})
+                if tokens_per_second:
+                    await asyncio.sleep(1 / tokens_per_second)
+            done = {"index": 0, "delta": {}, "finish_reason": "stop"}
+            await _send_event(writer, {**envelope, "choices": [done]})
+            if (body.get("stream_options") or {}).get("include_usage"):
+                await _send_event(writer, {**envelope, "choices": [], "usage": usage})
+            await _send_chunk(writer, b"data: [DONE]\n\n")
+            await _send_chunk(writer, b"")
+        except ConnectionError:
+            self.stats["cancelled"] += 1
+            raise
+
+
+def _envelope(body: Dict[str, Any], kind: str) -> Dict[str, Any]:
+    return {
+        "id": f"mock-{time.monotonic_ns()}",
+        "object": kind,
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+    }
+
+
+async def _read_request(
+    reader: asyncio.StreamReader,
+) -> Optional[Tuple[str, str, Dict[str, Any]]]:
+    """Read an HTTP request, None once the client closed the connection."""
+    line = await reader.readline()
+    if not line:
+        return None
+    method, path, _ = line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    body = json.loads(await reader.readexactly(length)) if length else {}
+    return method, path, body
+
+
+async def _send_json(
+    writer: asyncio.StreamWriter,
+    status: int,
+    payload: Any,
+    headers: Optional[Dict[str, str]] = None,
+):
+    data = json.dumps(payload).encode("utf-8")
+    head = f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+    head += "Content-Type: application/json\r\n"
+    head += f"Content-Length: {len(data)}\r\n"
+    for name, value in (headers or {}).items():
+        head += f"{name}: {value}\r\n"
+    writer.write(head.encode("latin-1") + b"\r\n" + data)
+    await writer.drain()
+
+
+async def _send_chunk(writer: asyncio.StreamWriter, data: bytes):
+    writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+    await writer.drain()
+
+
+async def _send_event(writer: asyncio.StreamWriter, payload: Dict[str, Any]):
+    await _send_chunk(writer, b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve an OpenAI-compatible chat completions API for benchmarks"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument(
+        "--latency",
+        default="0",
+        help='Seconds before the first token: "0.2", "uniform:0.1,0.5" or '
+        '"lognormal:<median>,<sigma>"',
+    )
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--retry-after", type=float, default=0.1)
+    parser.add_argument(
+        "--trailing-words",
+        type=int,
+        default=0,
+        help="Words of chatter appended after each completion",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=0,
+        help="Requests served at once, others wait (default: unlimited)",
+    )
+    parser.add_argument(
+        "--data",
+        default=PYTHONIC_DATA_PATH,
+        help="Dataset whose reference completions are served",
+    )
+    parser.add_argument(
+        "--completions",
+        nargs="*",
+        default=[],
+        help="results.jsonl files of previous runs whose completions are replayed "
+        "instead of the reference ones",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockServer(
+        completions={
+            **reference_completions(args.data),
+            **load_completions(args.completions),
+        },
+        seed=args.seed,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        trailing_words=args.trailing_words,
+        max_concurrency=args.max_concurrency,
+    )
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
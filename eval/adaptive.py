@@ -0,0 +1,164 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from statistics import NormalDist
+import math
+import random
+
+from eval.schemas import PythonicRow
+from eval.settings import (
+    ADAPTIVE_CONFIDENCE,
+    ADAPTIVE_MAX_WIDTH,
+    ADAPTIVE_MIN_ROWS,
+    ADAPTIVE_SEED,
+)
+
+
+def wilson_interval(
+    successes: int, n: int, confidence: float = ADAPTIVE_CONFIDENCE
+) -> Tuple[float, float]:
+    """
+    Wilson score interval of a proportion.
+
+    Unlike the normal approximation, it stays within [0, 1] and behaves well with
+    few samples or proportions close to 0 or 1.
+
+    Args:
+        successes: Number of successes
+        n: Number of trials
+        confidence: Confidence level of the interval
+
+    Returns:
+        The lower and upper bounds, (0, 1) without trials
+    """
+    if n == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = successes / n
+    center = (p + z * z / (2 * n)) / (1 + z * z / n)
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def stratified_order(
+    rows: Sequence[PythonicRow], indices: Iterable[int], seed: int = ADAPTIVE_SEED
+) -> List[int]:
+    """
+    Order rows randomly, with every difficulty spread evenly along the order.
+
+    Each difficulty is shuffled on its own, then the difficulties are interleaved in
+    proportion to their size, so any prefix of the order has about the same mix of
+    difficulties as the whole dataset.
+
+    Args:
+        rows: The dataset
+        indices: Indices of the rows to order
+        seed: Seed of the shuffle, the same seed always gives the same order
+
+    Returns:
+        The row indices in evaluation order
+    """
+    rng = random.Random(seed)
+    strata: Dict[str, List[int]] = {}
+    for index in indices:
+        strata.setdefault(rows[index].difficulty, []).append(index)
+
+    keyed = []
+    for difficulty in sorted(strata):
+        stratum = strata[difficulty]
+        rng.shuffle(stratum)
+        # Spread the stratum evenly over [0, 1), with a random tie-break between strata
+        for position, index in enumerate(stratum):
+            keyed.append(((position + rng.random()) / len(stratum), index))
+    keyed.sort()
+    return [index for _, index in keyed]
+
+
+class SequentialStop:
+    """
+    Running confidence interval on strict accuracy that decides when to stop.
+
+    Rows are added as they are scored. After at least `min_rows`, the run can stop
+    once the interval is narrower than `max_width`, or once it lies entirely above
+    or below `threshold`. Accuracies are in percent, as in the evaluation metrics.
+
+    Checking the interval after every row makes it somewhat optimistic, so
+    `min_rows` keeps the earliest, noisiest looks from ending a run.
+    """
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        max_width: float = ADAPTIVE_MAX_WIDTH,
+        confidence: float = ADAPTIVE_CONFIDENCE,
+        min_rows: int = ADAPTIVE_MIN_ROWS,
+        seed: int = ADAPTIVE_SEED,
+    ):
+        self.threshold = threshold
+        self.max_width = max_width
+        self.confidence = confidence
+        self.min_rows = min_rows
+        self.seed = seed
+        self.rows = 0
+        self.correct = 0
+
+    def add(self, correct: bool):
+        """Count a scored row."""
+        self.rows += 1
+        self.correct += int(correct)
+
+    def interval(self) -> Tuple[float, float]:
+        """Current confidence interval on strict accuracy, in percent."""
+        lower, upper = wilson_interval(self.correct, self.rows, self.confidence)
+        return 100 * lower, 100 * upper
+
+    def decision(self) -> Optional[str]:
+        """
+        Tell whether enough rows were scored.
+
+        Returns:
+            "above" or "below" if the interval excludes the threshold, "precise"
+            if the interval is narrower than the target width, None otherwise
+        """
+        if self.rows < self.min_rows:
+            return None
+        lower, upper = self.interval()
+        if self.threshold is not None:
+            if lower > self.threshold:
+                return "above"
+            if upper < self.threshold:
+                return "below"
+        if upper - lower <= self.max_width:
+            return "precise"
+        return None
+
+    def settings(self) -> Dict[str, Any]:
+        """Settings of the stopping rule, recorded in the run manifest."""
+        return {
+            "threshold": self.threshold,
+            "max_width": self.max_width,
+            "confidence": self.confidence,
+            "min_rows": self.min_rows,
+            "seed": self.seed,
+        }
+
+    def report(self, dataset_rows: int) -> Dict[str, Any]:
+        """
+        Summarize the estimate.
+
+        Args:
+            dataset_rows: Number of rows in the dataset
+
+        Returns:
+            The strict accuracy and its interval in percent, the rows used and the
+            decision, None if every row was needed without reaching one
+        """
+        lower, upper = self.interval()
+        return {
+            "strict_accuracy": 100 * self.correct / self.rows if self.rows else 0.0,
+            "lower_bound": lower,
+            "upper_bound": upper,
+            "confidence": self.confidence,
+            "threshold": self.threshold,
+            "rows_used": self.rows,
+            "dataset_rows": dataset_rows,
+            "decision": self.decision(),
+        }
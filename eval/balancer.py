@@ -0,0 +1,188 @@
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
+from contextlib import asynccontextmanager
+import asyncio
+import time
+
+from eval.concurrency import classify_error
+from eval.settings import (
+    REPLICA_EJECT_FAILURES,
+    REPLICA_EJECT_TIME,
+    REPLICA_HEALTH_INTERVAL,
+    REPLICA_HEALTH_TIMEOUT,
+)
+from eval.transport import http_client
+from eval.util import setup_logger
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = setup_logger(__name__)
+
+
+class Replica:
+    """One endpoint of a provider, with its client and request statistics."""
+
+    def __init__(self, url: str, api_key: str):
+        self.url = url
+        self.api_key = api_key
+        self._client: Optional["AsyncOpenAI"] = None
+        self._transport = None
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until: Optional[float] = None
+        self.latency = 0.0
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        """Client of the replica, over the shared connection pool of the running loop."""
+        transport = http_client()
+        if self._transport is not transport:
+            from openai import AsyncOpenAI
+
+            # Retries are handled by the scheduler
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.url,
+                max_retries=0,
+                http_client=transport,
+            )
+            self._transport = transport
+        return self._client
+
+    @property
+    def ejected(self) -> bool:
+        return self.ejected_until is not None
+
+    def eject(self, reason: str):
+        self.ejected_until = time.monotonic() + REPLICA_EJECT_TIME
+        self.ejections += 1
+        logger.warning(f"Ejecting replica {self.url}: {reason}")
+
+    def readmit(self):
+        self.ejected_until = None
+        self.consecutive_failures = 0
+        logger.info(f"Replica {self.url} is healthy again")
+
+    def stats(self) -> Dict[str, Any]:
+        succeeded = self.requests - self.failures
+        return {
+            "url": self.url,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "mean_latency": self.latency / succeeded if succeeded else None,
+        }
+
+
+class ReplicaPool:
+    """
+    Balances the requests to a provider across its replicas.
+
+    Each request goes to the healthy replica with the fewest outstanding requests.
+    A replica failing REPLICA_EJECT_FAILURES requests in a row, with server or
+    connection errors, is ejected for at least REPLICA_EJECT_TIME seconds. It is
+    readmitted once a health check succeeds. With several replicas, every replica
+    is health-checked every REPLICA_HEALTH_INTERVAL seconds in the background. If
+    all replicas are ejected, requests still go to the least loaded one rather
+    than failing outright.
+    """
+
+    def __init__(self, provider: str, urls: Union[str, List[str]], api_key: str):
+        self.provider = provider
+        if isinstance(urls, str):
+            urls = [urls]
+        self.replicas = [Replica(url, api_key) for url in urls]
+        self._health_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.replicas)
+
+    def _pick(self) -> Replica:
+        candidates = [r for r in self.replicas if not r.ejected] or self.replicas
+        # Ties go to the replica that served the fewest requests
+        return min(candidates, key=lambda r: (r.outstanding, r.requests))
+
+    def _ensure_health_checks(self):
+        if len(self.replicas) < 2:
+            return
+        loop = asyncio.get_running_loop()
+        task = self._health_task
+        # Tasks do not outlive their event loop, each `asyncio.run` starts its own
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._health_task = loop.create_task(self._check_health())
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        Pick a replica for one request and record the outcome of the request.
+
+        Yields:
+            The replica to send the request to
+        """
+        self._ensure_health_checks()
+        replica = self._pick()
+        replica.outstanding += 1
+        replica.requests += 1
+        start = time.perf_counter()
+        try:
+            yield replica
+        except Exception as e:
+            retryable, throttled, _ = classify_error(e)
+            # Throttling is the provider pacing us, not a sign of an unhealthy replica
+            if retryable and not throttled:
+                replica.failures += 1
+                replica.consecutive_failures += 1
+                if (
+                    replica.consecutive_failures >= REPLICA_EJECT_FAILURES
+                    and not replica.ejected
+                    and len(self.replicas) > 1
+                ):
+                    replica.eject(f"{replica.consecutive_failures} failures in a row")
+            raise
+        else:
+            replica.consecutive_failures = 0
+            replica.latency += time.perf_counter() - start
+        finally:
+            replica.outstanding -= 1
+
+    async def _probe(self, replica: Replica) -> bool:
+        try:
+            await asyncio.wait_for(
+                replica.client.models.list(), timeout=REPLICA_HEALTH_TIMEOUT
+            )
+            return True
+        except Exception:
+            return False
+
+    async def _check_health(self):
+        while True:
+            await asyncio.sleep(REPLICA_HEALTH_INTERVAL)
+            healthy = await asyncio.gather(*(self._probe(r) for r in self.replicas))
+            now = time.monotonic()
+            for replica, ok in zip(self.replicas, healthy):
+                if not ok and not replica.ejected:
+                    replica.eject("health check failed")
+                elif ok and replica.ejected and now >= replica.ejected_until:
+                    replica.readmit()
+
+    def log_stats(self):
+        """Log the requests, failures and latency of each replica."""
+        if len(self.replicas) < 2:
+            return
+        for replica in self.replicas:
+            stats = replica.stats()
+            latency = stats["mean_latency"]
+            logger.info(
+                "Provider '{}' replica {}: {} requests, {} failures, {} ejections, "
+                "mean latency {}".format(
+                    self.provider,
+                    replica.url,
+                    stats["requests"],
+                    stats["failures"],
+                    stats["ejections"],
+                    "n/a" if latency is None else f"{latency:.2f}s",
+                )
+            )
@@ -0,0 +1,165 @@
+from typing import Optional
+from enum import Enum
+import hashlib
+import json
+import os
+import time
+
+from eval.settings import (
+    COMPLETION_CACHE_PATH,
+    COMPLETION_CACHE_MAX_BYTES,
+    COMPLETION_CACHE_MAX_AGE,
+)
+from eval.util import atomic_write, setup_logger
+
+logger = setup_logger(__name__)
+
+
+class CacheMode(Enum):
+    """How the completion cache is used during a run."""
+
+    use = "use"  # Serve hits, store misses
+    refresh = "refresh"  # Treat every lookup as a miss and overwrite the entry
+    bypass = "bypass"  # Neither read nor write the cache
+    only = "only"  # Serve hits only, fail on misses instead of calling the provider
+
+
+class CacheMissError(Exception):
+    """Raised when a completion is not cached and the cache mode forbids requests."""
+
+    pass
+
+
+class CompletionCache:
+    """
+    Content-addressed on-disk cache of model completions.
+
+    Each entry is stored in its own file named after the hash of every input that
+    affects the completion. Entries are written to a temporary file and atomically
+    renamed into place, so concurrent writers never expose partial entries.
+    Entries older than `max_age` seconds are dropped, and the oldest ones are
+    evicted once the cache grows beyond `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        path: str = COMPLETION_CACHE_PATH,
+        mode: CacheMode = CacheMode.use,
+        max_bytes: int = COMPLETION_CACHE_MAX_BYTES,
+        max_age: float = COMPLETION_CACHE_MAX_AGE,
+    ):
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+
+        if self.mode != CacheMode.bypass:
+            os.makedirs(self.path, exist_ok=True)
+            self.evict()
+
+    @staticmethod
+    def key(
+        model_name: str,
+        provider: str,
+        system_prompt: str,
+        user_query: str,
+        temperature: float,
+        stop: Optional[str] = None,
+    ) -> str:
+        """Hash every input that affects a completion into a cache key."""
+        inputs = [model_name, provider, system_prompt, user_query, temperature]
+        if stop is not None:
+            inputs.append(stop)
+        payload = json.dumps(inputs)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key + ".json")
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached completion.
+
+        Args:
+            key: The cache key of the request
+
+        Returns:
+            The cached completion, or None on a miss
+        """
+        if self.mode == CacheMode.bypass:
+            return None
+        if self.mode == CacheMode.refresh:
+            self.misses += 1
+            return None
+
+        try:
+            with open(self._entry_path(key), "r") as f:
+                entry = json.load(f)
+            completion = entry["completion"]
+            expired = time.time() - entry["created"] > self.max_age
+        except (OSError, ValueError, LookupError, TypeError):
+            # Missing or malformed entries are misses
+            expired = True
+
+        if expired:
+            self.misses += 1
+            if self.mode == CacheMode.only:
+                raise CacheMissError(f"Completion '{key}' is not cached")
+            return None
+
+        self.hits += 1
+        return completion
+
+    def put(self, key: str, completion: str):
+        """
+        Store a completion.
+
+        Args:
+            key: The cache key of the request
+            completion: The completion to store
+        """
+        if self.mode in (CacheMode.bypass, CacheMode.only):
+            return
+
+        entry = {"created": time.time(), "completion": completion}
+        atomic_write(self._entry_path(key), json.dumps(entry).encode("utf-8"))
+
+    def evict(self):
+        """Remove expired entries, then the oldest ones until under `max_bytes`."""
+        now = time.time()
+        entries = []
+        for directory, _, files in os.walk(self.path):
+            for name in files:
+                entry_path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(entry_path)
+                except FileNotFoundError:
+                    continue
+                # Stale temporary files are left behind by interrupted writers
+                expired = now - stat.st_mtime > self.max_age
+                if expired or (name.endswith(".tmp") and now - stat.st_mtime > 3600):
+                    _unlink(entry_path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, entry_path in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            _unlink(entry_path)
+            size -= entry_size
+
+    def log_stats(self):
+        """Log the hit and miss counts of the run."""
+        if self.mode != CacheMode.bypass:
+            logger.info(f"Completion cache: {self.hits} hits, {self.misses} misses")
+
+
+def _unlink(path: str):
+    # Another process may have evicted the same entry
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
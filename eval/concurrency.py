@@ -0,0 +1,143 @@
+from typing import Optional, Tuple
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+import asyncio
+import random
+import time
+
+from eval.settings import (
+    ADAPTIVE_INITIAL_CONCURRENCY,
+    ADAPTIVE_LATENCY_TOLERANCE,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+)
+
+
+class AdaptiveLimiter:
+    """
+    Additive-increase/multiplicative-decrease limit on in-flight requests.
+
+    The limit grows by about one request per window of successful requests while
+    latency stays healthy, holds when the short-term latency climbs above the
+    long-term trend (requests are queueing on the server), and halves on throttling
+    or server errors. A `Retry-After` from the provider pauses new requests.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        initial_limit: int = ADAPTIVE_INITIAL_CONCURRENCY,
+        latency_tolerance: float = ADAPTIVE_LATENCY_TOLERANCE,
+    ):
+        self.max_limit = max_limit
+        self.limit = float(max(1, min(initial_limit, max_limit)))
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.throttled = 0
+        self.retries = 0
+
+        self._condition = asyncio.Condition()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._short_latency: Optional[float] = None
+        self._long_latency: Optional[float] = None
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one in-flight request slot."""
+        async with self._condition:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    # Wake up when the pause ends, or earlier if notified
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), pause)
+                    except asyncio.TimeoutError:
+                        pass
+                elif self.in_flight < int(self.limit):
+                    break
+                else:
+                    await self._condition.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def on_success(self, latency: float):
+        """Record a successful request and grow the limit if latency is healthy."""
+        if self._short_latency is None:
+            self._short_latency = self._long_latency = latency
+        else:
+            self._short_latency += 0.3 * (latency - self._short_latency)
+            self._long_latency += 0.02 * (latency - self._long_latency)
+
+        if self._short_latency <= self._long_latency * self.latency_tolerance:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def on_failure(self, retry_after: Optional[float] = None, throttled: bool = False):
+        """Record a throttled or failed request and back off."""
+        now = time.monotonic()
+        self.retries += 1
+        if throttled:
+            self.throttled += 1
+        if retry_after:
+            self._paused_until = max(self._paused_until, now + retry_after)
+
+        # Failures of requests sent in the same window only count once
+        window = self._long_latency or RETRY_BASE_DELAY
+        if now - self._last_decrease >= window:
+            self.limit = max(1.0, self.limit / 2)
+            self._last_decrease = now
+
+
+def classify_error(error: Exception) -> Tuple[bool, bool, Optional[float]]:
+    """
+    Decide whether a failed request can be retried.
+
+    Args:
+        error: The exception raised by the request
+
+    Returns:
+        Tuple of whether to retry, whether the provider throttled the request,
+        and the delay in seconds requested through `Retry-After`, if any
+    """
+    # Deferred so that importing the scheduler does not load the OpenAI SDK
+    import openai
+
+    if isinstance(error, openai.APIStatusError):
+        status = error.status_code
+        retryable = status in (408, 409, 429) or status >= 500
+        return retryable, status == 429, _retry_after(error.response.headers)
+    if isinstance(error, (openai.APIConnectionError, asyncio.TimeoutError)):
+        return True, False, None
+    return False, False, None
+
+
+def _retry_after(headers) -> Optional[float]:
+    """Parse the delay requested by `Retry-After` or `Retry-After-Ms` headers."""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given retry attempt."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt))
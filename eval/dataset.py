@@ -0,0 +1,213 @@
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+from collections import OrderedDict
+import argparse
+import json
+import mmap
+import os
+import struct
+import threading
+
+from pydantic import TypeAdapter
+from pydantic_core import PydanticUndefined
+
+from eval.schemas import PythonicRow
+from eval.settings import DATASET_ROW_CACHE_SIZE
+from eval.util import setup_logger
+
+logger = setup_logger(__name__)
+
+# Layout of an indexed dataset file:
+#   magic | uint32 header length | header JSON | field blobs ... | offsets | trailer
+# Every field of every row is stored as its own JSON blob. The offsets are a flat
+# array of uint64 with one entry per (row, field) plus a final end offset, and the
+# trailer holds the position of the offsets and the number of rows.
+MAGIC = b"DPABIDX1"
+_TRAILER = struct.Struct("<QQ")
+
+# Validators for each row field, used to validate a field on first access
+_FIELD_ADAPTERS = {
+    name: TypeAdapter(field.annotation) for name, field in PythonicRow.model_fields.items()
+}
+
+
+def is_indexed_dataset(file_path: str) -> bool:
+    """Check whether a file is an indexed dataset."""
+    with open(file_path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def build_indexed_dataset(jsonl_path: str, output_path: str) -> int:
+    """
+    Convert a pythonic .jsonl file to an indexed dataset.
+
+    Rows are validated once while converting and streamed to the output, so the
+    source file is never fully held in memory.
+
+    Args:
+        jsonl_path: Path to the .jsonl file
+        output_path: Path of the indexed dataset to write
+
+    Returns:
+        Number of rows written
+    """
+    fields = list(PythonicRow.model_fields)
+    header = json.dumps({"fields": fields}).encode("utf-8")
+    offsets = []
+
+    tmp_path = output_path + ".tmp"
+    with open(jsonl_path, "r") as source, open(tmp_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        for line in source:
+            if not line.strip():  # Skip empty lines
+                continue
+            data = json.loads(line)
+            PythonicRow(**data)
+            for name in fields:
+                offsets.append(f.tell())
+                if name in data:
+                    f.write(json.dumps(data[name], ensure_ascii=False).encode("utf-8"))
+        offsets.append(f.tell())
+
+        index_offset = f.tell()
+        f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        f.write(_TRAILER.pack(index_offset, (len(offsets) - 1) // len(fields)))
+    os.replace(tmp_path, output_path)
+
+    return (len(offsets) - 1) // len(fields)
+
+
+class LazyRow:
+    """
+    A row of an indexed dataset.
+
+    Exposes the same fields as PythonicRow, but each field is only deserialized and
+    validated the first time it is accessed, so fields a mode never touches cost nothing.
+    """
+
+    __slots__ = ("_dataset", "_index", "_values")
+
+    def __init__(self, dataset: "IndexedDataset", index: int):
+        self._dataset = dataset
+        self._index = index
+        self._values: Dict[str, Any] = {}
+
+    def __getattr__(self, name: str) -> Any:
+        if name not in _FIELD_ADAPTERS:
+            raise AttributeError(name)
+        values = self._values
+        if name not in values:
+            values[name] = self._dataset.field(self._index, name)
+        return values[name]
+
+    def to_row(self) -> PythonicRow:
+        """Build the fully validated PythonicRow."""
+        return PythonicRow(
+            **{name: getattr(self, name) for name in self._dataset.fields}
+        )
+
+    def model_dump(self, mode: str = "python") -> Dict[str, Any]:
+        """Dump the fields like `PythonicRow.model_dump`, without building the row."""
+        return {
+            name: _FIELD_ADAPTERS[name].dump_python(getattr(self, name), mode=mode)
+            for name in self._dataset.fields
+        }
+
+
+class IndexedDataset(Sequence):
+    """
+    Memory-mapped indexed dataset with lazily validated rows.
+
+    Opening the dataset only reads the header and trailer; rows are materialized as
+    LazyRow objects on access, and the most recently used ones are kept in memory.
+    """
+
+    def __init__(self, file_path: str, cache_size: int = DATASET_ROW_CACHE_SIZE):
+        self.file_path = file_path
+        with open(file_path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"'{file_path}' is not an indexed dataset")
+        (header_length,) = struct.unpack_from("<I", self._mmap, len(MAGIC))
+        header_start = len(MAGIC) + 4
+        header = json.loads(self._mmap[header_start : header_start + header_length])
+
+        self.fields: List[str] = header["fields"]
+        self._field_positions = {name: i for i, name in enumerate(self.fields)}
+        self._index_offset, self._length = _TRAILER.unpack_from(
+            self._mmap, len(self._mmap) - _TRAILER.size
+        )
+
+        self._cache_size = cache_size
+        self._cache: "OrderedDict[int, LazyRow]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[LazyRow, List[LazyRow]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("dataset index out of range")
+
+        with self._lock:
+            row = self._cache.get(index)
+            if row is not None:
+                self._cache.move_to_end(index)
+                return row
+            row = LazyRow(self, index)
+            self._cache[index] = row
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+            return row
+
+    def __iter__(self) -> Iterator[LazyRow]:
+        for index in range(self._length):
+            yield self[index]
+
+    def raw_field(self, index: int, name: str) -> Optional[bytes]:
+        """
+        Get the serialized JSON of a row field without deserializing it.
+
+        Returns:
+            The JSON bytes, or None if the row does not have the field
+        """
+        position = index * len(self.fields) + self._field_positions[name]
+        start, end = struct.unpack_from(
+            "<QQ", self._mmap, self._index_offset + 8 * position
+        )
+        return self._mmap[start:end] if end > start else None
+
+    def field(self, index: int, name: str) -> Any:
+        """Deserialize and validate a row field."""
+        raw = self.raw_field(index, name)
+        if raw is None:
+            default = PythonicRow.model_fields[name].default
+            if default is PydanticUndefined:
+                raise ValueError(f"Row {index} is missing required field '{name}'")
+            return default
+        return _FIELD_ADAPTERS[name].validate_json(raw)
+
+    def close(self):
+        """Unmap the dataset file."""
+        self._mmap.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert a pythonic .jsonl dataset to an indexed dataset"
+    )
+    parser.add_argument("jsonl_path")
+    parser.add_argument("output_path", nargs="?")
+    args = parser.parse_args()
+
+    output_path = args.output_path or os.path.splitext(args.jsonl_path)[0] + ".dpab"
+    count = build_indexed_dataset(args.jsonl_path, output_path)
+    logger.info(f"Wrote {count} rows to '{output_path}'")
+
+
+if __name__ == "__main__":
+    main()
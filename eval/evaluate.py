@@ -1,8 +1,15 @@
 from enum import Enum
+from typing import TYPE_CHECKING, Optional, Sequence, Tuple
 
-from eval.pythonic import evaluate_model_pythonic
-from eval.json_mode import evaluate_model_json
-from eval.settings import SHOW_COMPLETION_IN_EVAL
+from eval.cache import CacheMode
+from eval.settings import SHOW_COMPLETION_IN_EVAL, PYTHONIC_DATA_PATH
+
+# Each mode is imported when it is evaluated, so a run only loads its own mode
+if TYPE_CHECKING:
+    from eval.adaptive import SequentialStop
+    from eval.model import RequestScheduler
+    from eval.pythonic.sandbox import SandboxPool
+    from eval.schemas import PythonicRow
 
 
 class EvaluationMode(Enum):
@@ -17,19 +24,62 @@ def evaluate_model(
     provider: str,
     mode: EvaluationMode,
     strict: bool = False,
+    data_path: str = PYTHONIC_DATA_PATH,
     show_completion: bool = SHOW_COMPLETION_IN_EVAL,
+    concurrency: Optional[int] = None,
+    cache_mode: CacheMode = CacheMode.use,
+    resume: bool = False,
+    stream: bool = False,
+    hedge: Optional[float] = None,
+    stopping: Optional["SequentialStop"] = None,
+    prefix_cache: bool = False,
+    cache_hints: bool = False,
+    shard: Optional[Tuple[int, int]] = None,
+    rows: Optional[Sequence["PythonicRow"]] = None,
+    scheduler: Optional["RequestScheduler"] = None,
+    sandbox: Optional["SandboxPool"] = None,
 ):
     if mode == EvaluationMode.json:
+        from eval.json_mode import evaluate_model_json
+
         return evaluate_model_json(
             model_name=model_name,
             provider=provider,
             show_completion=show_completion,
             strict=strict,
+            data_path=data_path,
+            concurrency=concurrency,
+            cache_mode=cache_mode,
+            resume=resume,
+            stream=stream,
+            hedge=hedge,
+            stopping=stopping,
+            prefix_cache=prefix_cache,
+            cache_hints=cache_hints,
+            shard=shard,
+            rows=rows,
+            scheduler=scheduler,
+            sandbox=sandbox,
         )
     elif mode == EvaluationMode.pythonic:
+        from eval.pythonic import evaluate_model_pythonic
+
         return evaluate_model_pythonic(
             model_name=model_name,
             provider=provider,
             show_completion=show_completion,
             strict=strict,
+            data_path=data_path,
+            concurrency=concurrency,
+            cache_mode=cache_mode,
+            resume=resume,
+            stream=stream,
+            hedge=hedge,
+            stopping=stopping,
+            prefix_cache=prefix_cache,
+            cache_hints=cache_hints,
+            shard=shard,
+            rows=rows,
+            scheduler=scheduler,
+            sandbox=sandbox,
         )
@@ -1,8 +1,12 @@
 import json
-from typing import Dict, Any, List, Callable
+import signal
+import threading
+import traceback
+from typing import Dict, Any, List, Callable, Optional
 
 from eval.schemas import FunctionResults
-from eval.pythonic.engine import execute_python_code, import_functions
+from eval.pythonic.engine import DANGEROUS_BUILTINS, TimeoutError, import_functions
+from eval.settings import JSON_CALL_TIMEOUT
 from eval.util import setup_logger
 
 logger = setup_logger(__name__)
@@ -32,12 +36,120 @@ def parse_json_completion(completion: str) -> List[Dict[str, Any]]:
             raise ValueError("Could not parse JSON array from completion")
 
 
+class JsonArrayStream:
+    """
+    Incrementally find the end of the function calls of a streamed completion.
+
+    A completion that starts with a JSON array is complete once the array is
+    closed, any other completion once the first ```json block is closed.
+    `feed` is called with the whole completion received so far and only scans the
+    text added since the previous call.
+    """
+
+    OPEN = "```json"
+    CLOSE = "```"
+
+    def __init__(self):
+        self._fenced: Optional[bool] = None
+        self._body: Optional[int] = None  # Start of the fenced block's content
+        self._scanned = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text: str) -> Optional[int]:
+        """
+        Args:
+            text: The completion received so far
+
+        Returns:
+            The offset just past the array or closing fence once complete, else None
+        """
+        if self._fenced is None:
+            stripped = text.lstrip()
+            if not stripped:
+                return None
+            self._fenced = not stripped.startswith("[")
+            self._scanned = len(text) - len(stripped)
+        if self._fenced:
+            return self._feed_fenced(text)
+        return self._feed_array(text)
+
+    def _feed_fenced(self, text: str) -> Optional[int]:
+        if self._body is None:
+            start = text.find(self.OPEN, max(0, self._scanned - len(self.OPEN) + 1))
+            if start == -1:
+                self._scanned = len(text)
+                return None
+            self._body = self._scanned = start + len(self.OPEN)
+
+        end = text.find(self.CLOSE, max(self._body, self._scanned - len(self.CLOSE) + 1))
+        if end == -1:
+            self._scanned = len(text)
+            return None
+        return end + len(self.CLOSE)
+
+    def _feed_array(self, text: str) -> Optional[int]:
+        for position in range(self._scanned, len(text)):
+            char = text[position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "[{":
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    return position + 1
+        self._scanned = len(text)
+        return None
+
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError("Function call exceeded timeout limit.")
+
+
+def _call_with_timeout(func: Callable, kwargs: Dict[str, Any], timeout: Optional[float]):
+    """
+    Call a function, interrupting it after `timeout` seconds.
+
+    Calls can only be interrupted on the main thread of a process, as in sandbox
+    workers; elsewhere the caller is responsible for preempting runaway calls.
+    """
+    if (
+        not timeout
+        or not hasattr(signal, "setitimer")
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        return func(**kwargs)
+
+    previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(**kwargs)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
 def execute_json_function_calls(
-    function_calls: List[Dict[str, Any]], functions: List[Callable]
+    function_calls: List[Dict[str, Any]],
+    functions: List[Callable],
+    timeout: Optional[float] = JSON_CALL_TIMEOUT,
 ) -> FunctionResults:
     """
     Execute function calls specified in JSON format using mock functions.
 
+    Each call is dispatched directly to the mock function of the same name with the
+    parsed arguments, and its return value is recorded as `result_<i>`. Execution
+    stops at the first failing call, as if the calls were run as consecutive statements.
+
     Args:
         function_calls: List of dictionaries containing function calls in format:
             {
@@ -48,34 +160,44 @@ def execute_json_function_calls(
                 }
             }
         functions: List of function implementations
+        timeout: Maximum time in seconds for each call. (Optional, default: JSON_CALL_TIMEOUT)
 
     Returns:
         FunctionResults containing execution results
     """
-    python_code = []
-    call_counter = 0
-
-    for call_dict in function_calls:
-        # Get function name and arguments from the new format
-        func_name = call_dict["name"]
-        params = call_dict["args"]
-
-        # Build argument string from the params dictionary
-        arg_parts = []
-
-        # Handle text parameter as a string
-        for param_name, param_value in params.items():
-            if isinstance(param_value, str):
-                arg_parts.append(f"{param_name}='{param_value}'")
-            else:
-                arg_parts.append(f"{param_name}={repr(param_value)}")
-
-        arg_string = ", ".join(arg_parts)
-        var_name = f"result_{call_counter}"
-        python_code.append(f"{var_name} = {func_name}({arg_string})")
-        call_counter += 1
-
-    # Join all function calls with newlines
-    final_code = "\n".join(python_code)
-    # Execute the generated Python code using execute_python_code
-    return execute_python_code(final_code, functions)
+    # Get function names and arguments from the new format
+    calls = [(call_dict["name"], call_dict["args"]) for call_dict in function_calls]
+
+    for func_name, _ in calls:
+        if func_name in DANGEROUS_BUILTINS:
+            return FunctionResults(
+                function_results={},
+                variables={},
+                errors=[
+                    f"NotAllowedError: Usage of dangerous builtin '{func_name}' is not allowed"
+                ],
+            )
+
+    functions_by_name = {func.__name__: func for func in functions}
+    function_to_variable = {}
+    variables = {}
+    errors = []
+
+    for call_counter, (func_name, params) in enumerate(calls):
+        function_to_variable.setdefault(func_name, []).append(f"result_{call_counter}")
+
+    for call_counter, (func_name, params) in enumerate(calls):
+        try:
+            func = functions_by_name.get(func_name)
+            if func is None:
+                raise NameError(f"name '{func_name}' is not defined")
+            value = _call_with_timeout(func, params, timeout)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}")
+            break
+        if not callable(value):
+            variables[f"result_{call_counter}"] = value
+
+    return FunctionResults(
+        function_results=function_to_variable, variables=variables, errors=errors
+    )
@@ -0,0 +1,196 @@
+from typing import Any, Dict, List, Optional, Sequence
+import json
+import os
+
+from eval.metrics import summarize_run, write_summary
+from eval.results import RESUME_KEYS, file_hash, read_results
+from eval.shard import row_id, shard_indices
+from eval.util import atomic_write, load_pythonic_jsonl, setup_logger
+
+logger = setup_logger(__name__)
+
+
+def _read_manifest(shard_dir: str) -> Dict[str, Any]:
+    manifest_file = os.path.join(shard_dir, "manifest.json")
+    if not os.path.exists(manifest_file):
+        raise ValueError(f"No run manifest in '{shard_dir}'")
+    with open(manifest_file, "r") as f:
+        manifest = json.load(f)
+    if manifest.get("shard") is None:
+        raise ValueError(f"'{shard_dir}' is not the run of a shard")
+    return manifest
+
+
+def _read_missing(shard_dir: str) -> List[Dict[str, Any]]:
+    """Read the missing functions and values of a shard's rows."""
+    missing_file = os.path.join(shard_dir, "eval_missing.json")
+    if not os.path.exists(missing_file):
+        return []
+    with open(missing_file, "r") as f:
+        return json.load(f)
+
+
+def _check_score(record: Dict[str, Any], strict: bool) -> Optional[str]:
+    """Tell why a record's score is inconsistent with the record, None if it is not."""
+    score = record.get("score")
+    if not isinstance(score, (int, float)) or not 0 <= score <= 1:
+        return f"score {score!r} is not between 0 and 1"
+    if strict and score not in (0, 1):
+        return f"score {score} of a strict run is neither 0 nor 1"
+    if score and str(record.get("results", "")).startswith("Error processing row"):
+        return f"score {score} of a row that could not be executed is not 0"
+    return None
+
+
+def merge_shards(
+    shard_dirs: Sequence[str], output_path: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Combine the results of every shard of a run into a single run.
+
+    The shards must come from the same run settings, model, provider, dataset and
+    prompt, and together cover every row of the dataset exactly once, each row
+    matching the dataset's content. Rows keep the score of their shard, which was
+    computed from the execution results themselves, while the saved results are
+    only their JSON serialization. The merged run has the same outputs as a regular
+    run: manifest, results, missing functions and values, and summary.
+
+    Raises:
+        ValueError: If the shards cannot be merged, or a row's score disagrees with
+            its record, such as a non-binary score in strict mode
+
+    Args:
+        shard_dirs: Run directories of the shards, one per shard
+        output_path: Directory to write the merged run to (Optional, default: the
+            run directory containing the first shard)
+
+    Returns:
+        Dict containing evaluation metrics:
+        {
+            "total_examples": int,
+            "overall_accuracy": float,
+            "errors": List[str]
+        }
+    """
+    if not shard_dirs:
+        raise ValueError("No shards to merge")
+    manifests = [_read_manifest(shard_dir) for shard_dir in shard_dirs]
+    first = manifests[0]
+    count = first["shard"][1]
+
+    shards: Dict[int, str] = {}
+    for shard_dir, manifest in zip(shard_dirs, manifests):
+        mismatched = [
+            key
+            for key in RESUME_KEYS
+            if key != "shard" and manifest.get(key) != first.get(key)
+        ]
+        if mismatched:
+            raise ValueError(
+                "Cannot merge '{}' with '{}', {} changed".format(
+                    shard_dir, shard_dirs[0], ", ".join(mismatched)
+                )
+            )
+        index, shard_count = manifest["shard"]
+        if shard_count != count:
+            raise ValueError(
+                f"'{shard_dir}' is a shard of {shard_count} shards, not {count}"
+            )
+        if index in shards:
+            raise ValueError(
+                f"Shard {index}/{count} is both in '{shards[index]}' and '{shard_dir}'"
+            )
+        shards[index] = shard_dir
+    absent = [str(index) for index in range(1, count + 1) if index not in shards]
+    if absent:
+        raise ValueError("Missing shards {} of {}".format(", ".join(absent), count))
+
+    data_path = first["data_path"]
+    if file_hash(data_path) != first["dataset_hash"]:
+        raise ValueError(f"Dataset '{data_path}' changed since the shards were run")
+    rows = load_pythonic_jsonl(data_path)
+    strict = first["strict"]
+
+    logger.info(
+        "Merging {} shards ({} mode, model '{}' with provider '{}')".format(
+            count, first["mode"], first["model_name"], first["provider"]
+        )
+    )
+
+    # Every row is hashed once, not again for each shard and record
+    ids = [row_id(row) for row in rows]
+    records: List[Dict[str, Any]] = []
+    missing: List[Dict[str, Any]] = []
+    errors = []
+    wall_time = 0.0
+    for index in sorted(shards):
+        shard_dir = shards[index]
+        expected = set(shard_indices(rows, (index, count), ids))
+        seen = set()
+        for record in read_results(os.path.join(shard_dir, "results.jsonl")):
+            position = record.get("index")
+            if position not in expected or position in seen:
+                raise ValueError(
+                    "Row {} in '{}' is not expected in shard {}/{}".format(
+                        position, shard_dir, index, count
+                    )
+                )
+            if record.get("row_id") != ids[position]:
+                raise ValueError(
+                    f"Row {position} in '{shard_dir}' differs from the dataset row"
+                )
+            inconsistent = _check_score(record, strict)
+            if inconsistent is not None:
+                raise ValueError(f"Row {position} in '{shard_dir}': {inconsistent}")
+            seen.add(position)
+            if str(record.get("results", "")).startswith("Error processing row"):
+                errors.append(record["results"])
+            records.append(record)
+        missing.extend(
+            entry for entry in _read_missing(shard_dir) if entry["index"] in seen
+        )
+
+        unevaluated = sorted(expected - seen)
+        if unevaluated:
+            raise ValueError(
+                "Shard {}/{} in '{}' lacks {} rows (first: {}), resume it to "
+                "evaluate them".format(
+                    index, count, shard_dir, len(unevaluated), unevaluated[0]
+                )
+            )
+        summary_file = os.path.join(shard_dir, "summary.json")
+        if os.path.exists(summary_file):
+            with open(summary_file, "r") as f:
+                # Shards run side by side, the merged run lasts as long as the slowest
+                wall_time = max(wall_time, json.load(f)["wall_time"])
+
+    if output_path is None:
+        output_path = os.path.dirname(os.path.normpath(shard_dirs[0]))
+    os.makedirs(output_path, exist_ok=True)
+    records.sort(key=lambda record: record["index"])
+    missing.sort(key=lambda entry: entry["index"])
+
+    manifest = {key: value for key, value in first.items() if key != "shard"}
+    manifest["merged_from"] = [shards[index] for index in sorted(shards)]
+    atomic_write(
+        os.path.join(output_path, "manifest.json"),
+        json.dumps(manifest, indent=2).encode("utf-8"),
+    )
+    atomic_write(
+        os.path.join(output_path, "results.jsonl"),
+        "".join(json.dumps(record) + "\n" for record in records).encode("utf-8"),
+    )
+    with open(os.path.join(output_path, "eval_missing.json"), "w") as f:
+        json.dump(missing, f, indent=2, default=str)
+
+    summary = summarize_run(records, first["model_name"], first["provider"], wall_time)
+    summary["shards"] = count
+    write_summary(summary, os.path.join(output_path, "summary.json"))
+
+    correct = sum(record["score"] for record in records)
+    logger.info(f"correct: {correct}")
+    return {
+        "total_examples": len(records),
+        "overall_accuracy": round(correct / len(records) * 100, 2) if records else 0,
+        "errors": errors,
+    }
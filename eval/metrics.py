@@ -0,0 +1,136 @@
+from typing import Any, Dict, List, Optional, Sequence
+import json
+import math
+
+from eval.settings import LATENCY_PERCENTILES, TOKEN_PRICES
+from eval.util import atomic_write, setup_logger
+
+logger = setup_logger(__name__)
+
+# Timings of each result record that are summarized with percentiles
+TIMING_FIELDS = [
+    "generation_time",
+    "ttft",
+    "queue_time",
+    "execution_time",
+    "scoring_time",
+]
+
+# Models whose missing prices were already reported, see `token_prices`
+_UNPRICED = set()
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """
+    Compute a percentile of sorted values with linear interpolation.
+
+    Args:
+        values: The values, sorted in ascending order
+        q: The percentile, between 0 and 100
+
+    Returns:
+        The percentile
+    """
+    position = (len(values) - 1) * q / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def distribution(values: List[float]) -> Optional[Dict[str, float]]:
+    """Summarize values with their mean and LATENCY_PERCENTILES, None if there are none."""
+    if not values:
+        return None
+    values = sorted(values)
+    summary = {"mean": sum(values) / len(values)}
+    for q in LATENCY_PERCENTILES:
+        summary[f"p{q}"] = percentile(values, q)
+    return summary
+
+
+def token_prices(model_name: str, provider: str) -> Optional[tuple]:
+    """Look up the (prompt, completion) prices of a model, None if unknown."""
+    model = f"{provider}:{model_name}"
+    prices = TOKEN_PRICES.get(model, TOKEN_PRICES.get(provider))
+    if prices is None and model not in _UNPRICED:
+        _UNPRICED.add(model)
+        logger.warning(
+            f"No token prices for '{model}', add them to TOKEN_PRICES in "
+            "eval/settings.py to estimate the cost of its runs"
+        )
+    return prices
+
+
+def summarize_run(
+    records: List[Dict[str, Any]],
+    model_name: str,
+    provider: str,
+    wall_time: float,
+    failed_requests: int = 0,
+) -> Dict[str, Any]:
+    """
+    Summarize the latency, token usage, throughput and cost of a run.
+
+    Args:
+        records: Result records of the rows evaluated in this run
+        model_name: Name of the evaluated model
+        provider: Provider used
+        wall_time: Duration of the run in seconds
+        failed_requests: Number of rows whose completion request failed
+
+    Returns:
+        The run summary
+    """
+    # Cached completions were not generated by this run
+    generated = [r for r in records if r.get("generation_time") is not None]
+    prompt_tokens = sum(r.get("prompt_tokens") or 0 for r in generated)
+    completion_tokens = sum(r.get("completion_tokens") or 0 for r in generated)
+
+    prices = token_prices(model_name, provider)
+    cost = None
+    if prices is not None:
+        cost = (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1e6
+
+    summary = {
+        "model_name": model_name,
+        "provider": provider,
+        "rows": len(records),
+        "requests": len(generated),
+        "cached": len(records) - len(generated),
+        "failed_requests": failed_requests,
+        "hedged": sum(1 for r in generated if r.get("hedge") is not None),
+        "hedges_won": sum(1 for r in generated if r.get("hedge") == "hedge"),
+        "wall_time": wall_time,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "tokens_per_second": completion_tokens / wall_time if wall_time > 0 else 0.0,
+        "estimated_cost": cost,
+    }
+    for field in TIMING_FIELDS:
+        summary[field] = distribution(
+            [r[field] for r in records if r.get(field) is not None]
+        )
+    return summary
+
+
+def write_summary(summary: Dict[str, Any], summary_file: str):
+    """Write a run summary to file and log its headline numbers."""
+    atomic_write(summary_file, json.dumps(summary, indent=2).encode("utf-8"))
+
+    latency = summary["generation_time"]
+    if latency is not None:
+        logger.info(
+            "Latency {}: {}".format(
+                "/".join(f"p{q}" for q in LATENCY_PERCENTILES),
+                " / ".join(f"{latency[f'p{q}']:.2f}s" for q in LATENCY_PERCENTILES),
+            )
+        )
+    cost = summary["estimated_cost"]
+    logger.info(
+        "{} prompt + {} completion tokens, {:.1f} tokens/s, estimated cost {}".format(
+            summary["prompt_tokens"],
+            summary["completion_tokens"],
+            summary["tokens_per_second"],
+            "unknown" if cost is None else f"${cost:.4f}",
+        )
+    )
@@ -1,60 +1,498 @@
-from openai import OpenAI
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Counter,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from collections import deque
 import asyncio
+import time
 
-from eval.settings import PROVIDER_URLS
+from eval import profiling
+from eval.balancer import ReplicaPool
+from eval.cache import CompletionCache
+from eval.concurrency import AdaptiveLimiter, backoff_delay, classify_error
+from eval.metrics import percentile
+from eval.schemas import Completion
+from eval.settings import (
+    ADAPTIVE_INITIAL_CONCURRENCY,
+    HEDGE_MAX_RATIO,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_WINDOW,
+    PROVIDER_URLS,
+    MAX_CONCURRENCY,
+    PROVIDER_CONCURRENCY,
+    REQUEST_MAX_RETRIES,
+    REQUEST_DEADLINE,
+    TEMPERATURE,
+)
+from eval.transport import reserve_connections
+from eval.util import setup_logger
 
-# Initialize OpenAI clients for each provider
-CLIENTS = {}
-for provider, (url, api_key) in PROVIDER_URLS.items():
-    CLIENTS[provider] = OpenAI(api_key=api_key, base_url=url)
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
 
+logger = setup_logger(__name__)
 
-def get_completion(
-    model_name: str, provider: str, system_prompt: str, user_query: str
-) -> str:
+# Replicas of the providers used so far, see `get_replicas`
+REPLICAS: Dict[str, ReplicaPool] = {}
+
+
+def get_replicas(provider: str) -> ReplicaPool:
+    """
+    Get the replicas of a provider, set up on first use.
+
+    Args:
+        provider: The provider to get the replicas of
+
+    Returns:
+        The provider's replica pool
+    """
+    replicas = REPLICAS.get(provider)
+    if replicas is None:
+        if provider not in PROVIDER_URLS:
+            raise ValueError(f"Provider '{provider}' not recognized.")
+        urls, api_key = PROVIDER_URLS[provider]
+        replicas = REPLICAS[provider] = ReplicaPool(provider, urls, api_key)
+    return replicas
+
+
+def replica_count(provider: str) -> int:
+    """Number of replicas of a provider, without setting them up."""
+    urls = PROVIDER_URLS.get(provider, ("",))[0]
+    return 1 if isinstance(urls, str) else len(urls)
+
+
+# Called with the text streamed so far, returns the offset where the needed part ends
+StopFn = Callable[[str], Optional[int]]
+
+
+async def get_completion(
+    model_name: str,
+    provider: str,
+    system_prompt: str,
+    user_query: str,
+    temperature: float = TEMPERATURE,
+    stop_at: Optional[StopFn] = None,
+    cache_prefix: Optional[int] = None,
+) -> Completion:
     """
     Get a completion from a model for a given provider.
 
+    With `stop_at`, the completion is streamed and the request is cancelled as soon
+    as `stop_at` reports that the part of the completion that is needed has arrived,
+    so no time or output tokens are spent on anything the model writes after it.
+    Providers with several replicas send it to the least loaded healthy one.
+
     Args:
         model_name: The name of the model to use
         provider: The provider to use
         system_prompt: The system prompt to use
         user_query: The user query to use
+        temperature: The sampling temperature to use
+        stop_at: Incremental parser of the streamed text (Optional)
+        cache_prefix: Length of the leading part of the system prompt shared by
+            other requests, marked as cacheable for providers with prompt caching
+            (Optional)
 
     Returns:
         The completion from the model
     """
-    client = CLIENTS.get(provider)
-    if not client:
-        raise ValueError(f"Provider '{provider}' not recognized.")
+    replicas = get_replicas(provider)
 
     # Create the messages for the chat completion
+    system_content: Union[str, List[Dict[str, Any]]] = system_prompt
+    if cache_prefix:
+        system_content = [
+            {
+                "type": "text",
+                "text": system_prompt[:cache_prefix],
+                "cache_control": {"type": "ephemeral"},
+            },
+            {"type": "text", "text": system_prompt[cache_prefix:]},
+        ]
     messages = [
-        {"role": "system", "content": system_prompt},
+        {"role": "system", "content": system_content},
         {"role": "user", "content": user_query},
     ]
 
-    # Make the API call to get the completion
-    response = client.chat.completions.create(
-        model=model_name, messages=messages, temperature=0.0
+    async with replicas.acquire() as replica:
+        return await _request_completion(
+            replica.client, model_name, messages, temperature, stop_at
+        )
+
+
+async def _request_completion(
+    client: "AsyncOpenAI",
+    model_name: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    stop_at: Optional[StopFn],
+) -> Completion:
+    start = time.perf_counter()
+    if stop_at is None:
+        # Make the API call to get the completion
+        response = await client.chat.completions.create(
+            model=model_name, messages=messages, temperature=temperature
+        )
+
+        # Extract and return the assistant's reply
+        usage = response.usage
+        return Completion(
+            text=response.choices[0].message.content,
+            total_time=time.perf_counter() - start,
+            prompt_tokens=usage.prompt_tokens if usage else None,
+            completion_tokens=usage.completion_tokens if usage else None,
+        )
+
+    stream = await client.chat.completions.create(
+        model=model_name,
+        messages=messages,
+        temperature=temperature,
+        stream=True,
+        # Usage is reported by a final chunk, after the last part of the text
+        stream_options={"include_usage": True},
     )
+    text = ""
+    ttft = None
+    end = None
+    usage = None
+    chunks = 0
+    try:
+        async for chunk in stream:
+            usage = chunk.usage or usage
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            chunks += 1
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            text += chunk.choices[0].delta.content
+            end = stop_at(text)
+            if end is not None:
+                break
+    finally:
+        # Closing the response cancels the generation
+        await stream.close()
+
+    return Completion(
+        text=text[:end] if end is not None else text,
+        ttft=ttft,
+        total_time=time.perf_counter() - start,
+        stopped_early=end is not None,
+        prompt_tokens=usage.prompt_tokens if usage else None,
+        completion_tokens=usage.completion_tokens if usage else chunks,
+    )
+
+
+class RequestScheduler:
+    """
+    Sliding-window scheduler for completion requests.
+
+    Requests to each provider go through an AdaptiveLimiter shared by every stream
+    using the scheduler, which starts low and grows up to `provider_limits[provider]`
+    per replica while the provider keeps up. A stream keeps up to `max_concurrency`
+    requests in flight, or as many as the limiters of the providers it has
+    requested allow if that is more, so every replica can be kept busy. A slot is
+    refilled as soon as any request finishes, so a single slow completion never
+    holds back the others. Cached completions are served without taking a slot.
+
+    Requests with a "stream_parser" are streamed and stop at the end of the first
+    part the parser accepts, see `get_completion`. Throttled, timed out and
+    server-side failures are retried with jittered
+    exponential backoff, honoring `Retry-After`, until `max_retries` is reached or
+    the request runs past `deadline` seconds.
+
+    With `hedge_percentile`, a request still running after that percentile of the
+    provider's recent latencies is duplicated, and the first answer is used. At
+    temperature 0 both answers are interchangeable. At most `hedge_max_ratio` of
+    a provider's requests are hedged, so slow providers are not flooded.
 
-    # Extract and return the assistant's reply
-    return response.choices[0].message.content
-
-
-async def get_completions_batch(requests):
-    loop = asyncio.get_running_loop()
-    tasks = []
-    for r in requests:
-        tasks.append(
-            loop.run_in_executor(
-                None,
-                get_completion,
-                r["model_name"],
-                r["provider"],
-                r["system_prompt"],
-                r["user_query"],
+    The shared connection pool keeps a connection open for every request that may
+    be in flight to the providers used. `providers` lists those known upfront, so
+    the pool is sized for them before the first request opens it.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENCY,
+        provider_limits: Optional[Dict[str, int]] = None,
+        cache: Optional[CompletionCache] = None,
+        max_retries: int = REQUEST_MAX_RETRIES,
+        deadline: float = REQUEST_DEADLINE,
+        hedge_percentile: Optional[float] = None,
+        hedge_max_ratio: float = HEDGE_MAX_RATIO,
+        providers: Iterable[str] = (),
+    ):
+        self.cache = cache
+        self.max_retries = max_retries
+        self.deadline = deadline
+        # Explicit provider overrides may widen the window
+        self.max_concurrency = max([max_concurrency, *(provider_limits or {}).values()])
+        self.provider_limits = {**PROVIDER_CONCURRENCY, **(provider_limits or {})}
+        self._limiters: Dict[str, AdaptiveLimiter] = {}
+        self.hedge_percentile = hedge_percentile
+        self.hedge_max_ratio = hedge_max_ratio
+        # Latencies of the latest completions, from which the hedge delay is taken
+        self._latencies: Dict[str, Deque[float]] = {}
+        self.requests: Counter = Counter()
+        self.hedged: Counter = Counter()
+        self.hedges_won: Counter = Counter()
+        # Connections kept open for the requests that may be in flight
+        self._connections = 0
+        # Set up the known providers before the first request opens the connection pool
+        for provider in providers:
+            self._limiter(provider)
+
+    def _limiter(self, provider: str) -> AdaptiveLimiter:
+        if provider not in self._limiters:
+            limit = self.provider_limits.get(provider, self.max_concurrency)
+            # Provider limits hold per replica
+            replicas = replica_count(provider)
+            self._limiters[provider] = AdaptiveLimiter(
+                limit * replicas, ADAPTIVE_INITIAL_CONCURRENCY * replicas
             )
-        )
-    return await asyncio.gather(*tasks)
+            connections = limit * replicas
+            if self.hedge_percentile is not None:
+                connections += int(connections * self.hedge_max_ratio) + 1
+            self._connections += connections
+            reserve_connections(self._connections)
+        return self._limiters[provider]
+
+    def _hedge_delay(self, provider: str) -> Optional[float]:
+        """Time after which a request to the provider is hedged, None to not hedge."""
+        latencies = self._latencies.get(provider)
+        if (
+            self.hedge_percentile is None
+            or latencies is None
+            or len(latencies) < HEDGE_MIN_SAMPLES
+        ):
+            return None
+        return percentile(sorted(latencies), self.hedge_percentile)
+
+    async def _complete(self, request: Dict[str, Any]) -> Completion:
+        """Get a completion, hedging it if it is slower than usual."""
+        provider = request["provider"]
+        parser = request.get("stream_parser")
+
+        def attempt() -> Awaitable[Completion]:
+            return get_completion(
+                request["model_name"],
+                provider,
+                request["system_prompt"],
+                request["user_query"],
+                stop_at=parser().feed if parser else None,
+                cache_prefix=request.get("cache_prefix"),
+            )
+
+        self.requests[provider] += 1
+        delay = self._hedge_delay(provider)
+        if delay is None:
+            completion = await attempt()
+        else:
+            completion = await self._hedged(attempt, provider, delay)
+        latencies = self._latencies.setdefault(provider, deque(maxlen=HEDGE_WINDOW))
+        latencies.append(completion.total_time)
+        return completion
+
+    async def _hedged(
+        self, attempt: Callable[[], Awaitable[Completion]], provider: str, delay: float
+    ) -> Completion:
+        """
+        Send a duplicate request if the first one is still running after `delay`.
+
+        The first successful answer wins and the other request is cancelled. The
+        duplicate goes to the least loaded replica, which is another replica than
+        the first request's whenever the provider has several.
+        """
+        start = time.perf_counter()
+        primary = asyncio.ensure_future(attempt())
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            # Hedges are capped to a share of the provider's requests
+            budget = self.hedge_max_ratio * self.requests[provider]
+            if done or self.hedged[provider] >= budget:
+                return await primary
+
+            self.hedged[provider] += 1
+            offset = time.perf_counter() - start
+            hedge = asyncio.ensure_future(attempt())
+            tasks.add(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        continue
+                    completion = task.result()
+                    if task is hedge:
+                        self.hedges_won[provider] += 1
+                        completion.hedge = "hedge"
+                        # Timings count from the first request
+                        completion.total_time += offset
+                        if completion.ttft is not None:
+                            completion.ttft += offset
+                    else:
+                        completion.hedge = "primary"
+                    return completion
+            # Both requests failed
+            raise primary.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _request(self, request: Dict[str, Any]) -> Completion:
+        """Get a completion from the provider, retrying transient failures."""
+        loop = asyncio.get_running_loop()
+        limiter = self._limiter(request["provider"])
+        row = request.get("row_index")
+        deadline = loop.time() + self.deadline
+        attempt = 0
+        queue_time = 0.0
+        while True:
+            queued = time.perf_counter_ns()
+            async with limiter.slot():
+                acquired = time.perf_counter_ns()
+                profiling.record("queue", queued, acquired, {"row": row})
+                queue_time += (acquired - queued) / 1e9
+                start = loop.time()
+                try:
+                    with profiling.span("request", row=row, attempt=attempt):
+                        completion = await asyncio.wait_for(
+                            self._complete(request),
+                            timeout=max(deadline - start, 0),
+                        )
+                except Exception as e:
+                    retryable, throttled, retry_after = classify_error(e)
+                    if not retryable:
+                        raise
+                    limiter.on_failure(retry_after, throttled)
+                    error = e
+                else:
+                    limiter.on_success(loop.time() - start)
+                    completion.queue_time = queue_time
+                    return completion
+
+            delay = retry_after or backoff_delay(attempt)
+            attempt += 1
+            if attempt > self.max_retries or loop.time() + delay >= deadline:
+                raise error
+            logger.debug(
+                f"Retrying request in {delay:.1f}s after {type(error).__name__}: {error}"
+            )
+            with profiling.span("backoff", row=row, attempt=attempt):
+                await asyncio.sleep(delay)
+
+    async def submit(self, request: Dict[str, Any]) -> Completion:
+        """
+        Get a completion for a single request once its provider has a free slot.
+
+        Args:
+            request: Dict with "model_name", "provider", "system_prompt" and
+                "user_query", and optionally the "stream_parser" class used to stop
+                streamed completions early, the "cache_prefix" length of the system
+                prompt to mark as cacheable and the "row_index" to tag profiling
+                spans with
+
+        Returns:
+            The completion from the model
+        """
+        key = None
+        parser = request.get("stream_parser")
+        if self.cache is not None:
+            key = CompletionCache.key(
+                request["model_name"],
+                request["provider"],
+                request["system_prompt"],
+                request["user_query"],
+                TEMPERATURE,
+                # Completions cut short by a parser are cached apart from full ones
+                stop=parser.__name__ if parser else None,
+            )
+            with profiling.span("cache_lookup", row=request.get("row_index")):
+                text = self.cache.get(key)
+            if text is not None:
+                return Completion(text=text)
+
+        completion = await self._request(request)
+
+        if key is not None and completion.text is not None:
+            self.cache.put(key, completion.text)
+        return completion
+
+    async def stream(
+        self, requests: Iterable[Dict[str, Any]]
+    ) -> AsyncIterator[Tuple[int, Union[Completion, Exception]]]:
+        """
+        Run requests with bounded concurrency and yield them as they complete.
+
+        The `requests` iterable is consumed lazily, one item per free slot.
+
+        Args:
+            requests: Requests in the format accepted by `submit`
+
+        Yields:
+            Tuples of (request index, completion), where the completion is the
+            raised exception if the request failed
+        """
+        queued = enumerate(requests)
+        pending: Dict[asyncio.Task, int] = {}
+        # Most requests each provider requested so far can have in flight
+        caps: Dict[str, int] = {}
+        window = self.max_concurrency
+
+        def fill():
+            nonlocal window
+            while len(pending) < window:
+                item = next(queued, None)
+                if item is None:
+                    return
+                index, request = item
+                provider = request["provider"]
+                if provider not in caps:
+                    caps[provider] = self._limiter(provider).max_limit
+                    window = max(self.max_concurrency, sum(caps.values()))
+                pending[asyncio.create_task(self.submit(request))] = index
+
+        fill()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                finished = [(pending.pop(task), task) for task in done]
+                # Refill the window before handing results to the consumer
+                fill()
+                for index, task in finished:
+                    exception = task.exception()
+                    yield index, exception if exception else task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def log_stats(self):
+        """Log the final concurrency limit and retry counts of each provider."""
+        for provider, limiter in self._limiters.items():
+            logger.info(
+                f"Provider '{provider}': concurrency limit {int(limiter.limit)}, "
+                f"{limiter.retries} retries, {limiter.throttled} throttled"
+            )
+            if self.hedged[provider]:
+                logger.info(
+                    f"Provider '{provider}': {self.hedged[provider]} of "
+                    f"{self.requests[provider]} requests hedged, "
+                    f"{self.hedges_won[provider]} won by the hedge"
+                )
+            if provider in REPLICAS:
+                REPLICAS[provider].log_stats()
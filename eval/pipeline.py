@@ -0,0 +1,432 @@
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
+import os
+import time
+
+from eval import profiling
+from eval.adaptive import SequentialStop, stratified_order
+from eval.metrics import summarize_run, write_summary
+from eval.results import ResultsLog
+from eval.schemas import Completion, FunctionResults, PythonicRow
+from eval.settings import EXECUTION_WORKERS, PIPELINE_QUEUE_SIZE
+from eval.shard import row_id, shard_indices
+from eval.util import setup_logger
+
+if TYPE_CHECKING:
+    from eval.model import RequestScheduler
+
+logger = setup_logger(__name__)
+
+# Marks the end of a stage's input
+_DONE = object()
+# Stands in for the completion of a row whose request failed
+_NO_COMPLETION = object()
+
+RequestFn = Callable[[PythonicRow], Dict[str, Any]]
+ExecuteFn = Callable[[PythonicRow, str], Tuple[Dict[str, Any], FunctionResults]]
+ErrorFn = Callable[[PythonicRow, str, Exception], Dict[str, Any]]
+
+
+async def run_pipeline(
+    rows: Sequence[PythonicRow],
+    build_request: RequestFn,
+    execute: ExecuteFn,
+    scheduler: "RequestScheduler",
+    results_file: str,
+    manifest: Dict[str, Any],
+    strict: bool = False,
+    show_completion: bool = False,
+    on_error: Optional[ErrorFn] = None,
+    resume: bool = False,
+    stopping: Optional[SequentialStop] = None,
+    group_by: Optional[Callable[[PythonicRow], Hashable]] = None,
+    shard: Optional[Tuple[int, int]] = None,
+    indices: Optional[Sequence[int]] = None,
+) -> Dict[str, Any]:
+    """
+    Evaluate rows through overlapping generation, execution, scoring and writing stages.
+
+    Completions are queued for execution as soon as they arrive, execution runs in
+    worker threads off the event loop, and scored rows are appended to the results
+    log by a dedicated writer, so network I/O, sandbox execution and disk writes
+    all overlap. Results are written in completion order, tagged with their row index
+    and flushed one by one, so a resumed run only evaluates the rows missing from the
+    log. A row whose completion request fails after every retry scores zero and is
+    not written, so resuming the run requests it again.
+
+    Every record carries the row's token usage, request latency, queue wait,
+    execution and scoring times. Once the run is done, the functions and values
+    missing from each row are written to `eval_missing.json` next to the results,
+    and the latency percentiles, throughput and cost of the rows evaluated by this
+    run to `summary.json`.
+
+    With `stopping`, rows are evaluated in a random order stratified by difficulty,
+    and no new requests are sent once the stopping rule is satisfied. The rows
+    already in flight are still scored, and the metrics cover the rows used.
+
+    With `group_by`, rows sharing a key are requested one after the other, so
+    their prompts reach the provider while its cache of their common prefix is
+    warm. Groups keep the order of their first row, and the stratified order of
+    `stopping` takes precedence.
+
+    With `shard`, only the rows of that shard are evaluated, and the metrics cover
+    them alone. Every record carries the content hash of its row as "row_id", so
+    the results of all shards can be merged and checked, see `eval.merge`.
+
+    Args:
+        rows: The rows to evaluate
+        build_request: Builds the completion request of a row
+        execute: Mode-specific function that turns a row and its completion into
+            a partial result record and the FunctionResults to score
+        scheduler: Scheduler used to issue the completion requests, or any object
+            with a compatible `stream` method
+        results_file: Path of the results .jsonl file to write
+        manifest: Description of the run, see `build_manifest`
+        strict: Whether to only count fully correct rows
+        show_completion: Whether to log model completions
+        on_error: Builds the result record for a row whose execution raised (Optional,
+            by default such rows are not written)
+        resume: Whether to keep the rows already in the results log of a matching run
+        stopping: Sequential stopping rule to evaluate only as many rows as needed
+            (Optional, default: evaluate every row)
+        group_by: Key of a row, rows with equal keys are evaluated together
+            (Optional, default: dataset order)
+        shard: The shard to evaluate, counting from 1, and the number of shards
+            (Optional, default: every row)
+        indices: Positions of the rows to evaluate, the metrics cover them alone
+            (Optional, default: every row)
+
+    Returns:
+        Dict containing evaluation metrics, with the "adaptive" report of the
+        stopping rule when one is used:
+        {
+            "total_examples": int,
+            "overall_accuracy": float,
+            "errors": List[str]
+        }
+    """
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    if indices is None:
+        indices = range(len(rows))
+    if shard is not None:
+        manifest = {**manifest, "shard": list(shard)}
+        in_shard = set(shard_indices(rows, shard))
+        indices = [index for index in indices if index in in_shard]
+    total = len(indices)
+    errors = []
+    written = []
+    failed_requests = 0
+
+    if stopping is not None:
+        manifest = {**manifest, "adaptive": stopping.settings()}
+    log = ResultsLog(results_file, manifest, resume=resume)
+    missing_file = os.path.join(os.path.dirname(results_file), "eval_missing.json")
+    missing = _read_missing(missing_file, log.completed) if resume else []
+    correct = sum(record["score"] for record in log.completed.values())
+    if log.completed:
+        logger.info(f"Resuming run with {len(log.completed)} completed rows")
+
+    # Rows still to evaluate, requests are built lazily as the scheduler frees up slots
+    pending = [index for index in indices if index not in log.completed]
+    mode = manifest["mode"]
+    if stopping is not None:
+        pending = stratified_order(rows, pending, stopping.seed)
+        for record in log.completed.values():
+            stopping.add(strictly_correct(record["score"]))
+    elif group_by is not None:
+        pending = _grouped(rows, pending, group_by)
+
+    def requests():
+        for index in pending:
+            if stopping is not None and stopping.decision() is not None:
+                return
+            with profiling.span("build_request", row=index):
+                request = build_request(rows[index])
+            yield {**request, "row_index": index}
+
+    execute_queue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+    score_queue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+    write_queue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+
+    async def generate():
+        async for position, completion in scheduler.stream(requests()):
+            index = pending[position]
+            if isinstance(completion, Exception):
+                # Rows without a completion are not logged, so a resumed run retries them
+                await score_queue.put((index, _NO_COMPLETION, None, completion))
+                continue
+            if show_completion:
+                logger.info(f"Completion:\n{completion.text}")
+            await execute_queue.put((index, completion))
+        for _ in range(EXECUTION_WORKERS):
+            await execute_queue.put(_DONE)
+
+    async def run_execution(executor: ThreadPoolExecutor):
+        while (item := await execute_queue.get()) is not _DONE:
+            index, completion = item
+            row = rows[index]
+            try:
+                outcome = await loop.run_in_executor(
+                    executor, _execute, execute, row, completion.text, index, mode
+                )
+                await score_queue.put((index, completion, outcome, None))
+            except Exception as e:
+                await score_queue.put((index, completion, None, e))
+        await score_queue.put(_DONE)
+
+    async def score():
+        nonlocal correct, failed_requests
+        # Deferred, tqdm takes longer to import than most of the harness
+        from tqdm import tqdm
+
+        remaining = EXECUTION_WORKERS
+        with tqdm(
+            total=total, initial=total - len(pending), desc="Processing Rows"
+        ) as progress:
+            while remaining:
+                item = await score_queue.get()
+                if item is _DONE:
+                    remaining -= 1
+                    continue
+                progress.update(1)
+                index, completion, outcome, error = item
+                row = rows[index]
+
+                if completion is _NO_COMPLETION:
+                    failed_requests += 1
+                    errors.append(
+                        f"Error requesting completion for row {index}: {error}"
+                    )
+                    # Counted as a row scoring zero, as in runs without stopping
+                    if stopping is not None:
+                        stopping.add(False)
+                    continue
+                if error is None:
+                    try:
+                        scored = _score(row, index, completion, outcome, strict)
+                    except Exception as e:
+                        # Results that cannot be compared or serialized only fail
+                        # their own row, like a completion that cannot be executed
+                        error = e
+                if error is not None:
+                    errors.append(f"Error processing row: {str(error)}")
+                    if stopping is not None:
+                        stopping.add(False)
+                    if on_error is not None:
+                        record = on_error(row, completion.text, error)
+                        await write_queue.put(
+                            {
+                                "index": index,
+                                "row_id": row_id(row),
+                                **record,
+                                "completion": completion.text,
+                                **_metrics(completion),
+                            }
+                        )
+                    continue
+
+                record, fully_correct, missing_entry = scored
+                if stopping is not None:
+                    stopping.add(fully_correct)
+                if missing_entry is not None:
+                    missing.append(missing_entry)
+                correct += record["score"]
+                await write_queue.put(record)
+        await write_queue.put(_DONE)
+
+    async def write(writer: ThreadPoolExecutor):
+        while (record := await write_queue.get()) is not _DONE:
+            with profiling.span("write", row=record["index"]):
+                await loop.run_in_executor(writer, log.append, record)
+            written.append(record)
+
+    try:
+        with ThreadPoolExecutor(EXECUTION_WORKERS) as executor, ThreadPoolExecutor(
+            1
+        ) as writer, profiling.tags(mode=mode):
+            await _run_stages(
+                generate(),
+                *(run_execution(executor) for _ in range(EXECUTION_WORKERS)),
+                score(),
+                write(writer),
+            )
+    finally:
+        log.close()
+
+        # Save missing functions and values of every row to file
+        missing.sort(key=lambda entry: entry["index"])
+        with open(missing_file, "w") as f:
+            json.dump(missing, f, indent=2, default=str)
+
+        summary = summarize_run(
+            written,
+            manifest["model_name"],
+            manifest["provider"],
+            time.perf_counter() - started,
+            failed_requests,
+        )
+        if stopping is not None:
+            summary["adaptive"] = stopping.report(total)
+        write_summary(
+            summary, os.path.join(os.path.dirname(results_file), "summary.json")
+        )
+
+    # Calculate metrics
+    logger.info(f"correct: {correct}")
+    evaluated = total if stopping is None else stopping.rows
+    overall_accuracy = correct / evaluated if evaluated > 0 else 0
+    overall_accuracy = round(overall_accuracy * 100, 2)
+
+    metrics = {
+        "total_examples": evaluated,
+        "overall_accuracy": overall_accuracy,
+        "errors": errors,
+    }
+    if stopping is not None:
+        metrics["adaptive"] = stopping.report(total)
+        logger.info(
+            "Strict accuracy {:.1f}% ({:.0%} CI {:.1f}-{:.1f}%) from {} of {} rows, "
+            "decision: {}".format(
+                metrics["adaptive"]["strict_accuracy"],
+                stopping.confidence,
+                *stopping.interval(),
+                stopping.rows,
+                total,
+                metrics["adaptive"]["decision"] or "none",
+            )
+        )
+    return metrics
+
+
+def _execute(
+    execute: ExecuteFn, row: PythonicRow, completion: str, index: int, mode: str
+) -> Tuple[Tuple[Dict[str, Any], FunctionResults], float]:
+    """Execute a completion in a worker thread and measure how long it took."""
+    # Tags do not follow the work to executor threads, so set them here
+    with profiling.tags(row=index, mode=mode), profiling.span("execute"):
+        start = time.perf_counter()
+        outcome = execute(row, completion)
+        return outcome, time.perf_counter() - start
+
+
+def _score(
+    row: PythonicRow,
+    index: int,
+    completion: Completion,
+    outcome: Tuple[Tuple[Dict[str, Any], FunctionResults], float],
+    strict: bool,
+) -> Tuple[Dict[str, Any], bool, Optional[Dict[str, Any]]]:
+    """
+    Score an executed row and build its result record.
+
+    Args:
+        row: The row
+        index: Position of the row in the dataset
+        completion: The row's completion
+        outcome: The partial record and execution results of the completion, and
+            the execution time
+        strict: Whether only fully correct rows score
+
+    Returns:
+        The result record, whether the row is fully correct, and the row's missing
+        functions and values (None if nothing is missing)
+    """
+    (record, result), execution_time = outcome
+
+    # Check if required functions were called with correct values
+    scoring_start = time.perf_counter()
+    with profiling.span("score", row=index):
+        score, missing_values, missing_functions = result.score_with_missing(
+            row.checklist.values, row.checklist.functions
+        )
+    scoring_time = time.perf_counter() - scoring_start
+
+    missing_entry = None
+    if missing_values or missing_functions:
+        missing_entry = {
+            "index": index,
+            "missing_functions": missing_functions,
+            "missing_values": missing_values,
+        }
+    fully_correct = strictly_correct(score)
+    if strict:
+        score = 1 if fully_correct else 0
+
+    record = {
+        "index": index,
+        "row_id": row_id(row),
+        **record,
+        "score": score,
+        "results": result.model_dump_json(),
+        "expected": row.checklist.model_dump_json(),
+        "user_query": row.user_query,
+        "functions": row.function_schema_python,
+        "completion": completion.text,
+        **_metrics(completion),
+        "execution_time": execution_time,
+        "scoring_time": scoring_time,
+    }
+    return record, fully_correct, missing_entry
+
+
+def _grouped(
+    rows: Sequence[PythonicRow],
+    indices: List[int],
+    key: Callable[[PythonicRow], Hashable],
+) -> List[int]:
+    """Order row indices so rows with the same key are adjacent."""
+    groups: Dict[Hashable, List[int]] = {}
+    for index in indices:
+        groups.setdefault(key(rows[index]), []).append(index)
+    return [index for group in groups.values() for index in group]
+
+
+def strictly_correct(score: float) -> bool:
+    """Whether a row's score counts as fully correct."""
+    return score >= 0.99 and score < 1.01
+
+
+def _metrics(completion: Completion) -> Dict[str, Any]:
+    """Timings and token usage of a completion to store with its result record."""
+    return {
+        "prompt_tokens": completion.prompt_tokens,
+        "completion_tokens": completion.completion_tokens,
+        "ttft": completion.ttft,
+        "generation_time": completion.total_time,
+        "queue_time": completion.queue_time,
+        "stopped_early": completion.stopped_early,
+        "hedge": completion.hedge,
+    }
+
+
+def _read_missing(
+    missing_file: str, completed: Dict[int, Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """Read the missing functions and values of rows completed by a previous run."""
+    if not os.path.exists(missing_file):
+        return []
+    with open(missing_file, "r") as f:
+        return [entry for entry in json.load(f) if entry["index"] in completed]
+
+
+async def _run_stages(*stages):
+    """Run pipeline stages concurrently, cancelling all of them if one fails."""
+    tasks = [asyncio.create_task(stage) for stage in stages]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,216 @@
+from typing import Any, Dict, List, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import json
+import os
+import threading
+import time
+
+from eval.metrics import percentile
+from eval.util import atomic_write, setup_logger
+
+logger = setup_logger(__name__)
+
+# Profiling is off unless enabled, spans then cost a single global lookup
+_enabled = False
+_events: List[Dict[str, Any]] = []
+_lock = threading.Lock()
+_tags: ContextVar[Dict[str, Any]] = ContextVar("profiling_tags", default={})
+
+
+def enable():
+    """Start recording spans."""
+    global _enabled
+    _enabled = True
+
+
+def is_enabled() -> bool:
+    """Check whether spans are being recorded."""
+    return _enabled
+
+
+class _Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name: str, args: Dict[str, Any]):
+        self.name = name
+        self.args = args
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, self.start, time.perf_counter_ns(), self.args)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str, **args):
+    """
+    Time a block of code as a named stage.
+
+    Args:
+        name: Name of the stage
+        **args: Extra details to attach to the span, such as the row index
+
+    Returns:
+        A context manager recording the span, or a shared no-op one when disabled
+    """
+    if not _enabled:
+        return _NOOP
+    return _Span(name, args)
+
+
+@contextmanager
+def _tagged(values: Dict[str, Any]):
+    token = _tags.set({**_tags.get(), **values})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def tags(**values):
+    """
+    Attach details to every span recorded in the current context.
+
+    Tasks created inside the block inherit the tags, threads do not.
+    """
+    if not _enabled:
+        return _NOOP
+    return _tagged(values)
+
+
+def record(
+    name: str,
+    start_ns: int,
+    end_ns: int,
+    args: Optional[Dict[str, Any]] = None,
+    pid: Optional[int] = None,
+):
+    """
+    Record a span measured elsewhere with `time.perf_counter_ns`.
+
+    The clock is shared by every process on the machine, so spans measured by the
+    sandbox workers line up with those of the evaluation process.
+
+    Args:
+        name: Name of the stage
+        start_ns: Start of the span
+        end_ns: End of the span
+        args: Extra details to attach to the span
+        pid: Process that ran the stage (Optional, default: this process)
+    """
+    if not _enabled:
+        return
+
+    if pid is not None:
+        tid = pid
+    else:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        # Coroutines interleave on the event loop thread, so each task gets its own track
+        tid = id(task) if task is not None else threading.get_ident()
+
+    event = {
+        "name": name,
+        "ph": "X",
+        "ts": start_ns / 1000,
+        "dur": (end_ns - start_ns) / 1000,
+        "pid": pid or os.getpid(),
+        "tid": tid,
+        "args": {**_tags.get(), **(args or {})},
+    }
+    with _lock:
+        _events.append(event)
+
+
+def stage_summary(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Aggregate spans by stage.
+
+    Args:
+        events: Recorded trace events
+
+    Returns:
+        Per-stage count, total, mean, p95 and max duration in milliseconds, sorted
+        by total duration
+    """
+    durations: Dict[str, List[float]] = {}
+    for event in events:
+        durations.setdefault(event["name"], []).append(event["dur"] / 1000)
+
+    summary = []
+    for name, values in durations.items():
+        values.sort()
+        summary.append(
+            {
+                "stage": name,
+                "count": len(values),
+                "total_ms": sum(values),
+                "mean_ms": sum(values) / len(values),
+                "p95_ms": percentile(values, 95),
+                "max_ms": values[-1],
+            }
+        )
+    summary.sort(key=lambda entry: entry["total_ms"], reverse=True)
+    return summary
+
+
+def export(directory: str):
+    """
+    Write the recorded spans and forget them.
+
+    Writes `trace.json` in Chrome trace-event format, which can be opened with
+    chrome://tracing or Perfetto, and the per-stage summary to `profile.json`.
+
+    Args:
+        directory: Directory to write the files to
+    """
+    if not _enabled:
+        return
+    with _lock:
+        events = list(_events)
+        _events.clear()
+
+    trace = {"traceEvents": events, "displayTimeUnit": "ms"}
+    atomic_write(
+        os.path.join(directory, "trace.json"), json.dumps(trace).encode("utf-8")
+    )
+    summary = stage_summary(events)
+    atomic_write(
+        os.path.join(directory, "profile.json"),
+        json.dumps(summary, indent=2).encode("utf-8"),
+    )
+
+    lines = [
+        "{:<24}{:>8}{:>12}{:>10}{:>10}".format(
+            "stage", "count", "total ms", "mean ms", "p95 ms"
+        )
+    ]
+    for entry in summary:
+        lines.append(
+            "{:<24}{:>8}{:>12.1f}{:>10.2f}{:>10.2f}".format(
+                entry["stage"],
+                entry["count"],
+                entry["total_ms"],
+                entry["mean_ms"],
+                entry["p95_ms"],
+            )
+        )
+    logger.info("Profile:\n" + "\n".join(lines))
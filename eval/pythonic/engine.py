@@ -1,11 +1,35 @@
-from typing import List, Callable, Dict, Any
+from typing import List, Callable, Dict, Any, Iterable, NamedTuple, Optional, Tuple
 import ast
-from types import FunctionType
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from types import CodeType, FunctionType
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from importlib.util import MAGIC_NUMBER
 import builtins
+import hashlib
+import marshal
+import os
+import traceback
 
-from eval.settings import CODE_EXECUTION_TIMEOUT
+from eval.settings import (
+    CODE_EXECUTION_TIMEOUT,
+    CODE_ANALYSIS_CACHE_SIZE,
+    MOCK_FUNCTIONS_CACHE_PATH,
+    MOCK_FUNCTIONS_CACHE_SIZE,
+)
 from eval.schemas import FunctionResults
+from eval.util import atomic_write
+
+# Builtins that executed code is not allowed to use by default
+DANGEROUS_BUILTINS = ["exec", "eval", "execfile", "compile", "exit", "input"]
+
+# Typing names available to mock functions and executed code
+TYPING_NAMESPACE: Dict[str, Any] = {}
+exec(
+    "from typing import List, Dict, Any, Union, Tuple, Callable, Optional",
+    TYPING_NAMESPACE,
+)
+del TYPING_NAMESPACE["__builtins__"]
 
 
 # Define custom exceptions
@@ -21,28 +45,170 @@ class TimeoutError(Exception):
     pass
 
 
+@lru_cache(maxsize=MOCK_FUNCTIONS_CACHE_SIZE)
+def compile_mock_functions(mock_functions: str) -> CodeType:
+    """
+    Compile mock functions to a code object.
+
+    Code objects are cached in memory and marshalled to disk, keyed by a hash of the
+    source and the interpreter's bytecode version, so each mock module is compiled once.
+
+    Args:
+        mock_functions: Source of the mock functions
+
+    Returns:
+        The compiled module code
+    """
+    key = hashlib.sha256(MAGIC_NUMBER + mock_functions.encode("utf-8")).hexdigest()
+    cache_path = os.path.join(MOCK_FUNCTIONS_CACHE_PATH, key + ".marshal")
+    try:
+        with open(cache_path, "rb") as f:
+            return marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    code = compile(mock_functions, "<mock_functions>", "exec")
+    try:
+        atomic_write(cache_path, marshal.dumps(code))
+    except OSError:
+        pass
+    return code
+
+
+def compile_dataset_mock_functions(mock_functions: Iterable[str]) -> int:
+    """
+    Compile the mock functions of the rows of a dataset ahead of evaluation.
+
+    Rows are read until MOCK_FUNCTIONS_CACHE_SIZE distinct modules are compiled, as
+    many as are kept in memory. Modules past that would only evict the first ones,
+    and are compiled on first use instead.
+
+    Args:
+        mock_functions: Source of the mock functions of each row
+
+    Returns:
+        Number of distinct mock modules compiled
+    """
+    seen = set()
+    for source in mock_functions:
+        if len(seen) >= MOCK_FUNCTIONS_CACHE_SIZE:
+            break
+        if source not in seen:
+            seen.add(source)
+            compile_mock_functions(source)
+    return len(seen)
+
+
 def import_functions(mock_functions: str) -> List[Callable]:
     """
     Import mock functions from a string containing function definitions and return them as callable functions.
+    Every call returns functions bound to a fresh namespace.
     """
-    namespace = {}
-    import_string = (
-        "from typing import List, Dict, Any, Union, Tuple, Callable, Optional"
-    )
-    exec(import_string, namespace)
-    exec(mock_functions, namespace)
+    namespace = dict(TYPING_NAMESPACE)
+    exec(compile_mock_functions(mock_functions), namespace)
     functions = [obj for obj in namespace.values() if isinstance(obj, FunctionType)]
     if not functions:
         raise ValueError("No functions found in the provided mock functions string")
     return functions
 
 
+class CodeAnalysis(NamedTuple):
+    """Result of analyzing code before execution."""
+
+    # First dangerous builtin used by the code, if any
+    violation: Optional[str]
+    # Function names mapped to the variables their results are assigned to
+    function_to_variable: Dict[str, Tuple[str, ...]]
+    # Code object compiled from the analyzed tree, None if the code is not allowed
+    code: Optional[CodeType]
+
+
+def _map_function_calls(node: ast.AST, function_to_variable: Dict[str, List[str]]):
+    """Record the variables the function calls in an AST node are assigned to."""
+    if isinstance(node, ast.Assign):
+        # Handle direct assignments
+        if isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Name):
+            func_name = node.value.func.id
+            var_name = node.targets[0].id
+            function_to_variable.setdefault(func_name, []).append(var_name)
+        # Handle dictionary literals with function calls
+        elif isinstance(node.value, ast.Dict):
+            var_name = node.targets[0].id
+            for key, value in zip(node.value.keys, node.value.values):
+                if isinstance(value, ast.Call) and isinstance(value.func, ast.Name):
+                    func_name = value.func.id
+                    if isinstance(key, ast.Constant):
+                        full_var_name = f"{var_name}[{repr(key.value)}]"
+                    else:
+                        full_var_name = var_name
+                    function_to_variable.setdefault(func_name, []).append(
+                        full_var_name
+                    )
+        # Handle dictionary and list comprehensions
+        elif isinstance(node.value, (ast.DictComp, ast.ListComp)):
+            for subnode in ast.walk(node.value):
+                if isinstance(subnode, ast.Call) and isinstance(subnode.func, ast.Name):
+                    func_name = subnode.func.id
+                    var_name = node.targets[0].id
+                    function_to_variable.setdefault(func_name, []).append(var_name)
+    # Handle function definitions
+    elif isinstance(node, ast.FunctionDef):
+        for subnode in ast.walk(node):
+            if isinstance(subnode, ast.Call) and isinstance(subnode.func, ast.Name):
+                func_name = subnode.func.id
+                var_name = f"{node.name}:internal"
+                function_to_variable.setdefault(func_name, []).append(var_name)
+
+
+@lru_cache(maxsize=CODE_ANALYSIS_CACHE_SIZE)
+def analyze_code(code: str, dangerous_builtins: Tuple[str, ...] = ()) -> CodeAnalysis:
+    """
+    Parse code once to check for dangerous builtins, map function calls to the
+    variables they are assigned to, and compile it.
+
+    Results are memoized, so the same code is only analyzed once per process.
+
+    Args:
+        code: The Python code (in string format) to analyze
+        dangerous_builtins: Names the code is not allowed to use. (Optional, default: ())
+
+    Returns:
+        CodeAnalysis: The safety verdict, the call to variable map and the compiled code
+    """
+    tree = ast.parse(code)
+    function_to_variable = {}
+    mapping_error = None
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id in dangerous_builtins:
+            return CodeAnalysis(violation=node.id, function_to_variable={}, code=None)
+        if mapping_error is None:
+            try:
+                _map_function_calls(node, function_to_variable)
+            except Exception as e:
+                # Dangerous builtins take precedence, keep looking for them
+                mapping_error = e
+
+    if mapping_error is not None:
+        raise mapping_error
+
+    return CodeAnalysis(
+        violation=None,
+        function_to_variable={
+            func_name: tuple(var_names)
+            for func_name, var_names in function_to_variable.items()
+        },
+        code=compile(tree, "<string>", "exec"),
+    )
+
+
 def execute_python_code(
     code: str,
     functions: List[Callable] = [],
     context_variables: Dict[str, Any] = {},
     safe: bool = True,
     excluded_builtins: List[str] = [],
+    timeout: Optional[float] = CODE_EXECUTION_TIMEOUT,
 ) -> FunctionResults:
     """
     Execute Python code with given functions and context variables, and return the results.
@@ -52,98 +218,46 @@ def execute_python_code(
         context_variables: A dictionary of variables to be added to the execution environment. (Optional, default: {})
         safe: Whether to check for dangerous builtins and prevent execution if found. (Optional, default: True)
         excluded_builtins: A list of builtins to be excluded from the execution environment. (Optional, default: [])
+        timeout: Maximum time in seconds for code execution, or None to run in the calling thread without a limit. (Optional, default: CODE_EXECUTION_TIMEOUT)
     Returns:
         FunctionResults: An object containing the results of the code execution.
     """
-    # Initialize environment with default builtins
-    env = {"__builtins__": builtins.__dict__.copy()}
-
     if safe:
         # Define dangerous builtins
-        if not excluded_builtins:
-            dangerous_builtins = [
-                "exec",
-                "eval",
-                "execfile",
-                "compile",
-                "exit",
-                "input",
-            ]
-        else:
-            dangerous_builtins = excluded_builtins
-
-        # Check for dangerous builtin usage
-        tree = ast.parse(code)
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Name) and node.id in dangerous_builtins:
-                return FunctionResults(
-                    function_results={},
-                    variables={},
-                    errors=[
-                        f"NotAllowedError: Usage of dangerous builtin '{node.id}' is not allowed"
-                    ],
-                )
-
-        # Filter out dangerous builtins from environment
-        env["__builtins__"] = {
+        dangerous_builtins = tuple(excluded_builtins or DANGEROUS_BUILTINS)
+    else:
+        dangerous_builtins = ()
+
+    # Check for dangerous builtin usage and map function calls in a single pass
+    analysis = analyze_code(code, dangerous_builtins)
+    if analysis.violation is not None:
+        return FunctionResults(
+            function_results={},
+            variables={},
+            errors=[
+                f"NotAllowedError: Usage of dangerous builtin '{analysis.violation}' is not allowed"
+            ],
+        )
+
+    # Initialize environment with default builtins, filtering out dangerous ones
+    env = {
+        "__builtins__": {
             k: v for k, v in builtins.__dict__.items() if k not in dangerous_builtins
         }
+    }
 
     # Import typing functions and add context variables
-    import_string = (
-        "from typing import List, Dict, Any, Union, Tuple, Callable, Optional"
-    )
-    exec(import_string, env)
+    env.update(TYPING_NAMESPACE)
     env.update(context_variables)
 
     # Record initial environment keys
     initial_keys = set(env.keys())
 
     # Dictionary to hold function call results mapped to variable names
-    function_to_variable = {}
-
-    # Parse AST to map function calls to their assignment variables
-    tree = ast.parse(code)
-    for node in ast.walk(tree):
-        if isinstance(node, ast.Assign):
-            # Handle direct assignments
-            if isinstance(node.value, ast.Call) and isinstance(
-                node.value.func, ast.Name
-            ):
-                func_name = node.value.func.id
-                var_name = node.targets[0].id
-                function_to_variable.setdefault(func_name, []).append(var_name)
-            # Handle dictionary literals with function calls
-            elif isinstance(node.value, ast.Dict):
-                var_name = node.targets[0].id
-                for key, value in zip(node.value.keys, node.value.values):
-                    if isinstance(value, ast.Call) and isinstance(value.func, ast.Name):
-                        func_name = value.func.id
-                        if isinstance(key, ast.Constant):
-                            full_var_name = f"{var_name}[{repr(key.value)}]"
-                        elif isinstance(key, ast.Constant):
-                            full_var_name = f"{var_name}[{repr(key.value)}]"
-                        else:
-                            full_var_name = var_name
-                        function_to_variable.setdefault(func_name, []).append(
-                            full_var_name
-                        )
-            # Handle dictionary and list comprehensions
-            elif isinstance(node.value, (ast.DictComp, ast.ListComp)):
-                for subnode in ast.walk(node.value):
-                    if isinstance(subnode, ast.Call) and isinstance(
-                        subnode.func, ast.Name
-                    ):
-                        func_name = subnode.func.id
-                        var_name = node.targets[0].id
-                        function_to_variable.setdefault(func_name, []).append(var_name)
-        # Handle function definitions
-        elif isinstance(node, ast.FunctionDef):
-            for subnode in ast.walk(node):
-                if isinstance(subnode, ast.Call) and isinstance(subnode.func, ast.Name):
-                    func_name = subnode.func.id
-                    var_name = f"{node.name}:internal"
-                    function_to_variable.setdefault(func_name, []).append(var_name)
+    function_to_variable = {
+        func_name: list(var_names)
+        for func_name, var_names in analysis.function_to_variable.items()
+    }
 
     # Wrap the provided functions to capture their return values
     def make_wrapper(func_name, func):
@@ -157,24 +271,29 @@ def execute_python_code(
 
     errors = []
 
-    try:
-        with ThreadPoolExecutor() as executor:
-            future = executor.submit(exec, code, env)
-            try:
-                future.result(timeout=CODE_EXECUTION_TIMEOUT)
-            except TimeoutError:
-                errors.append("Code execution exceeded timeout limit.")
-            except Exception as e:
-                import traceback
-
-                errors.append(f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}")
-    except Exception as e:
-        errors.append(str(e))
+    if timeout is None:
+        # The caller is responsible for preempting runaway code
+        try:
+            exec(analysis.code, env)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}")
+    else:
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(exec, analysis.code, env)
+        try:
+            future.result(timeout=timeout)
+        except FutureTimeoutError:
+            errors.append("Code execution exceeded timeout limit.")
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}")
+        finally:
+            # Threads cannot be killed, so do not wait for a runaway one
+            executor.shutdown(wait=False)
 
     # Collect variables defined in the code
     variables = {
         k: v
-        for k, v in env.items()
+        for k, v in list(env.items())
         if k not in initial_keys and not k.startswith("__") and not callable(v)
     }
 
@@ -1,35 +1,91 @@
-from typing import Dict, Any
-from tqdm import tqdm
-from eval.pythonic.engine import import_functions, execute_python_code
-from eval.model import get_completions_batch
-import json
+from typing import Dict, Any, Optional, Sequence, Tuple
+from contextlib import AsyncExitStack
+from functools import partial
+from eval.pythonic.engine import compile_dataset_mock_functions
+from eval.pythonic.sandbox import SandboxPool
+from eval import profiling, transport
+from eval.adaptive import SequentialStop
+from eval.cache import CacheMode, CompletionCache
+from eval.model import RequestScheduler
+from eval.pipeline import run_pipeline
+from eval.results import build_manifest
+from eval.schemas import FunctionResults, PythonicRow
+from eval.shard import shard_dirname
 import os
 
 from eval.settings import (
     PYTHONIC_DATA_PATH,
     PYTHONIC_SYSTEM_PROMPT_PATH,
     SHOW_COMPLETION_IN_EVAL,
-    BATCH_SIZE,
     PYTHONIC_RESULTS_PATH,
 )
 from eval.util import (
     load_pythonic_jsonl,
     extract_codeblocks,
+    CodeBlockStream,
     load_system_prompt,
     insert_functions_schema,
     setup_logger,
+    split_functions_schema,
 )
 
 # Set up logger using the utility function
 logger = setup_logger(__name__)
 
 
+def extract_code(completion: str) -> str:
+    """Extract code from completion if needed."""
+    return extract_codeblocks(completion) if "```" in completion else completion
+
+
+def execute_completion(
+    sandbox: SandboxPool, row: PythonicRow, completion: str
+) -> Tuple[Dict[str, Any], FunctionResults]:
+    """
+    Execute the code in a completion with the row's mock functions.
+
+    Args:
+        sandbox: The sandbox to execute the code in
+        row: The row the completion was generated for
+        completion: The model completion
+
+    Returns:
+        The partial result record and the execution results to score
+    """
+    code = extract_code(completion)
+    return {"code": code}, sandbox.execute(code, row.mock_functions)
+
+
+def error_record(row: PythonicRow, completion: str, error: Exception) -> Dict[str, Any]:
+    """Build the result record for a row whose execution failed."""
+    return {
+        "code": extract_code(completion),
+        "score": 0.0,
+        "results": f"Error processing row: {str(error)}",
+        "expected": row.checklist.model_dump_json(),
+        "user_query": row.user_query,
+        "functions": row.function_schema_python,
+    }
+
+
 async def evaluate_model_pythonic(
     model_name: str,
     provider: str,
     strict: bool = False,
     data_path: str = PYTHONIC_DATA_PATH,
     show_completion: bool = SHOW_COMPLETION_IN_EVAL,
+    concurrency: Optional[int] = None,
+    cache_mode: CacheMode = CacheMode.use,
+    resume: bool = False,
+    stream: bool = False,
+    hedge: Optional[float] = None,
+    stopping: Optional[SequentialStop] = None,
+    prefix_cache: bool = False,
+    cache_hints: bool = False,
+    shard: Optional[Tuple[int, int]] = None,
+    rows: Optional[Sequence[PythonicRow]] = None,
+    scheduler: Optional[RequestScheduler] = None,
+    sandbox: Optional[SandboxPool] = None,
 ) -> Dict[str, Any]:
     """
     Evaluate a model's function calling capabilities using the pythonic.jsonl dataset.
@@ -38,6 +94,18 @@ async def evaluate_model_pythonic(
         model_name: Name of the model to evaluate
         provider: Provider to use
         data_path: Path to the pythonic.jsonl file
+        concurrency: Maximum in-flight requests for the provider (Optional, default: PROVIDER_CONCURRENCY)
+        cache_mode: How to use the completion cache (Optional, default: CacheMode.use)
+        resume: Whether to skip the rows already completed by a matching previous run (Optional, default: False)
+        stream: Whether to stream completions and stop them once the first code block calling a function is complete (Optional, default: False)
+        hedge: Latency percentile after which slow requests are duplicated (Optional, default: no hedging)
+        stopping: Sequential stopping rule to only evaluate as many rows as needed (Optional, default: evaluate every row)
+        prefix_cache: Whether to put the functions schema after the static instructions and evaluate rows sharing a schema together (Optional, default: False)
+        cache_hints: Whether to also mark the static instructions as cacheable for providers with prompt caching (Optional, default: False)
+        shard: The shard to evaluate, counting from 1, and the number of shards, written to a subdirectory of the run (Optional, default: every row)
+        rows: Rows of `data_path`, already loaded by the caller (Optional, default: loaded here)
+        scheduler: Scheduler shared with other runs, whose cache is used instead of `cache_mode` (Optional, default: a scheduler of this run)
+        sandbox: Sandbox shared with other runs, for which the caller compiles the mock functions (Optional, default: a sandbox of this run)
 
     Returns:
         Dict containing evaluation metrics:
@@ -59,110 +127,92 @@ async def evaluate_model_pythonic(
         os.makedirs(PYTHONIC_RESULTS_PATH)
 
     run_path = PYTHONIC_RESULTS_PATH + "/" + model_name + "_" + provider
+    if shard is not None:
+        run_path += "/" + shard_dirname(shard)
     if not os.path.exists(run_path):
         os.makedirs(run_path)
 
     # Load evaluation data
-    rows = load_pythonic_jsonl(data_path)
-
-    # Initialize metrics
-    total = len(rows)
-    correct = 0
-    errors = []
-    results = []
+    if rows is None:
+        with profiling.span("load_dataset"):
+            rows = load_pythonic_jsonl(data_path)
 
     # Load system prompt
     system_prompt = load_system_prompt(PYTHONIC_SYSTEM_PROMPT_PATH)
+    # Static instructions shared by every row, and the template completed per row
+    static_prompt, row_prompt = "", system_prompt
+    # Cache hints mark the static instructions, which requires them to come first
+    prefix_cache = prefix_cache or cache_hints
+    if prefix_cache:
+        static_prompt, row_prompt = split_functions_schema(system_prompt)
+
+    # Requests are built lazily as the scheduler frees up slots
+    def build_request(row: PythonicRow) -> Dict[str, Any]:
+        return {
+            "model_name": model_name,
+            "provider": provider,
+            # Insert functions schema into system prompt
+            "system_prompt": static_prompt
+            + insert_functions_schema(row_prompt, row.function_schema_python),
+            "user_query": row.user_query,
+            "stream_parser": CodeBlockStream if stream else None,
+            "cache_prefix": len(static_prompt) if cache_hints else None,
+        }
 
-    # Evaluate each example
-    for i in tqdm(range(0, len(rows), BATCH_SIZE), desc="Processing Batches"):
-        batch = rows[i : i + BATCH_SIZE]
+    with profiling.span("build_manifest"):
+        manifest = build_manifest(
+            "pythonic",
+            model_name,
+            provider,
+            strict,
+            data_path,
+            system_prompt,
+            stream,
+            prefix_cache,
+        )
 
-        requests = []
-        for row in batch:
-            functions = import_functions(row.mock_functions)
-            # Insert functions schema into system prompt
-            inserted_system_prompt = insert_functions_schema(
-                system_prompt, row.function_schema_python
-            )
-            requests.append(
-                {
-                    "model_name": model_name,
-                    "provider": provider,
-                    "system_prompt": inserted_system_prompt,
-                    "user_query": row.user_query,
-                    "functions": functions,
-                }
+    # A shared scheduler and sandbox are set up and reported on by the caller
+    owns_setup = scheduler is None and sandbox is None
+    if scheduler is None:
+        scheduler = RequestScheduler(
+            provider_limits={provider: concurrency} if concurrency else None,
+            cache=CompletionCache(mode=cache_mode),
+            hedge_percentile=hedge,
+            providers=[provider],
+        )
+
+    async with AsyncExitStack() as stack:
+        if owns_setup:
+            # The connections were opened for this evaluation only
+            stack.push_async_callback(transport.aclose)
+        if sandbox is None:
+            # Compile every row's mock functions once, the sandbox workers load them from the cache
+            with profiling.span("compile_mock_functions"):
+                compile_dataset_mock_functions(row.mock_functions for row in rows)
+            sandbox = stack.enter_context(
+                SandboxPool(mock_functions=(row.mock_functions for row in rows))
             )
-        try:
-            completions = await get_completions_batch(requests)
-        except Exception as e:
-            raise RuntimeError("Error processing batch: {}".format(e))
-
-        for j, completion in enumerate(completions):
-            row = batch[j]
-            code = None
-            try:
-                if show_completion:
-                    logger.info(f"Completion: {completion}")
-
-                # Extract code from completion if needed
-                code = (
-                    extract_codeblocks(completion)
-                    if "```" in completion
-                    else completion
-                )
-
-                # Execute the code with mock functions
-                function_result = execute_python_code(code, requests[j]["functions"])
-
-                # Check if required functions were called
-                score = function_result.check_score(
-                    row.checklist.values, row.checklist.functions
-                )
-
-                if strict:
-                    score = 1 if score >= 0.99 and score < 1.01 else 0
-
-                correct += score
-
-                results.append(
-                    {
-                        "code": code,
-                        "score": score,
-                        "results": function_result.model_dump_json(),
-                        "expected": row.checklist.model_dump_json(),
-                        "user_query": row.user_query,
-                        "functions": row.function_schema_python,
-                    }
-                )
-
-            except Exception as e:
-                errors.append(f"Error processing row: {str(e)}")
-
-                results.append(
-                    {
-                        "code": code,
-                        "score": 0.0,
-                        "results": f"Error processing row: {str(e)}",
-                        "expected": row.checklist.model_dump_json(),
-                        "user_query": row.user_query,
-                        "functions": row.function_schema_python,
-                    }
-                )
-
-    # Calculate metrics
-    logger.info(f"correct: {correct}")
-    overall_accuracy = correct / total if total > 0 else 0
-    overall_accuracy = round(overall_accuracy * 100, 2)
-
-    # Save results
-    with open(run_path + "/results.jsonl", "w") as f:
-        for result in results:
-            f.write(json.dumps(result) + "\n")
+        metrics = await run_pipeline(
+            rows,
+            build_request,
+            partial(execute_completion, sandbox),
+            scheduler,
+            run_path + "/results.jsonl",
+            manifest,
+            strict=strict,
+            show_completion=show_completion,
+            resume=resume,
+            stopping=stopping,
+            # Rows with the same functions share the longest prompt prefix
+            group_by=(lambda row: row.function_schema_python)
+            if prefix_cache
+            else None,
+            shard=shard,
+            on_error=error_record,
+        )
+    if owns_setup:
+        scheduler.cache.log_stats()
+        scheduler.log_stats()
+        profiling.export(run_path)
 
-    return {
-        "total_examples": total,
-        "overall_accuracy": overall_accuracy,
-        "errors": errors,
-    }
+    return metrics
@@ -0,0 +1,297 @@
+from typing import Any, Dict, Iterable, List, Tuple
+import multiprocessing
+import pickle
+import queue
+import signal
+import time
+
+from eval import profiling
+from eval.settings import (
+    CODE_EXECUTION_TIMEOUT,
+    SANDBOX_WORKERS,
+    SANDBOX_CPU_LIMIT,
+    SANDBOX_MEMORY_LIMIT,
+    SANDBOX_PRELOAD_LIMIT,
+)
+from eval.schemas import FunctionResults
+from eval.util import setup_logger
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+logger = setup_logger(__name__)
+
+
+class SandboxError(Exception):
+    """An exception of a sandbox worker that could not be sent to the parent process."""
+
+
+def _context() -> multiprocessing.context.BaseContext:
+    # Workers are respawned while the event loop and executor threads are running,
+    # so fork from a clean server process instead of from the evaluation process
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["eval.pythonic.engine", "eval.json_mode.engine"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def _set_limit(limit: int, soft: int):
+    _, hard = resource.getrlimit(limit)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(limit, (soft, hard))
+
+
+def _portable(variables: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace values that cannot be sent to the parent process with their repr."""
+    portable = {}
+    for name, value in variables.items():
+        try:
+            # Classes defined by the executed code pickle fine but cannot be loaded elsewhere
+            pickle.loads(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+            portable[name] = value
+        except Exception:
+            portable[name] = repr(value)
+    return portable
+
+
+def _portable_error(error: BaseException) -> BaseException:
+    """Replace an exception that cannot be sent to the parent process."""
+    try:
+        pickle.loads(pickle.dumps(error, pickle.HIGHEST_PROTOCOL))
+        return error
+    except Exception:
+        return SandboxError(f"{type(error).__name__}: {str(error)}")
+
+
+def _worker_main(conn, mock_functions: List[str], cpu_limit: int, memory_limit: int):
+    """Execute jobs received over `conn` until told to stop."""
+    from eval.pythonic.engine import (
+        compile_mock_functions,
+        execute_python_code,
+        import_functions,
+    )
+    from eval.json_mode.engine import execute_json_function_calls
+
+    # The parent handles interrupts and kills workers when needed
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if resource is not None and memory_limit:
+        _set_limit(resource.RLIMIT_AS, memory_limit)
+
+    # Pre-warm the compiled mock functions this worker is likely to need
+    for source in mock_functions:
+        try:
+            compile_mock_functions(source)
+        except Exception:
+            pass
+
+    # Start-up time does not count towards the first execution's timeout
+    conn.send_bytes(b"")
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+
+        kind, payload, source = job
+        spans = []
+        outcome, error = None, None
+        try:
+            # Every execution gets a fresh namespace of mock functions
+            start = time.perf_counter_ns()
+            functions = import_functions(source)
+            spans.append(("import_functions", start, time.perf_counter_ns()))
+
+            if resource is not None and cpu_limit:
+                usage = resource.getrusage(resource.RUSAGE_SELF)
+                used = int(usage.ru_utime + usage.ru_stime) + 1
+                _set_limit(resource.RLIMIT_CPU, used + cpu_limit)
+
+            start = time.perf_counter_ns()
+            if kind == "json":
+                result = execute_json_function_calls(payload, functions)
+            else:
+                result = execute_python_code(payload, functions, timeout=None)
+            spans.append((f"execute_{kind}", start, time.perf_counter_ns()))
+            outcome = (
+                result.function_results,
+                _portable(result.variables),
+                result.errors,
+            )
+        except BaseException as e:
+            # Exceptions of the executed code are already in the results, anything
+            # else, such as code that does not parse, is raised again in the parent
+            error = _portable_error(e)
+
+        conn.send_bytes(pickle.dumps((outcome, error, spans), pickle.HIGHEST_PROTOCOL))
+
+
+class _Worker:
+    """A sandbox worker process and the parent's end of its pipe."""
+
+    def __init__(self, context, mock_functions, cpu_limit, memory_limit):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, mock_functions, cpu_limit, memory_limit),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def wait_ready(self):
+        if not self.ready:
+            with profiling.span("sandbox_start"):
+                self.conn.recv_bytes()
+            self.ready = True
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class SandboxPool:
+    """
+    Pool of pre-forked worker processes that execute untrusted code.
+
+    Workers start with up to SANDBOX_PRELOAD_LIMIT compiled mock modules loaded,
+    give every execution a fresh namespace of mock functions, run one execution at
+    a time under per-execution CPU and memory rlimits, and send back a pickled
+    FunctionResults. Exceptions of the executed code are part of the results,
+    while any other exception, such as code that does not parse, is raised again by
+    `execute` as if the code had run in this process. A worker that exceeds the
+    timeout or dies is killed and replaced, so runaway code never stalls the run.
+    `execute` is thread-safe and blocks until the execution finishes, so the pool
+    scales across cores when called from several threads.
+    """
+
+    def __init__(
+        self,
+        workers: int = SANDBOX_WORKERS,
+        mock_functions: Iterable[str] = (),
+        timeout: float = CODE_EXECUTION_TIMEOUT,
+        cpu_limit: int = SANDBOX_CPU_LIMIT,
+        memory_limit: int = SANDBOX_MEMORY_LIMIT,
+    ):
+        self.timeout = timeout
+        self._context = _context()
+        # Stop reading rows once enough distinct modules are found
+        preload: List[str] = []
+        seen = set()
+        for source in mock_functions:
+            if len(preload) >= SANDBOX_PRELOAD_LIMIT:
+                break
+            if source not in seen:
+                seen.add(source)
+                preload.append(source)
+        self._worker_args = (preload, cpu_limit, memory_limit)
+        self._workers = [self._spawn() for _ in range(workers)]
+        self._idle = queue.Queue()
+        for worker in self._workers:
+            self._idle.put(worker)
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._context, *self._worker_args)
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        worker.kill()
+        replacement = self._spawn()
+        self._workers[self._workers.index(worker)] = replacement
+        return replacement
+
+    def execute(self, code: str, mock_functions: str) -> FunctionResults:
+        """
+        Execute code in a worker with the given mock functions available.
+
+        Args:
+            code: The Python code to execute
+            mock_functions: Source of the mock functions to make available
+
+        Returns:
+            FunctionResults: An object containing the results of the code execution.
+
+        Raises:
+            Exception: Any exception outside of the executed code, such as a
+                SyntaxError for code that does not parse
+        """
+        return self._run(("python", code, mock_functions))
+
+    def execute_json(
+        self, function_calls: List[Dict[str, Any]], mock_functions: str
+    ) -> FunctionResults:
+        """
+        Dispatch function calls specified in JSON format to mock functions in a worker.
+
+        Args:
+            function_calls: Function calls in the format of `execute_json_function_calls`
+            mock_functions: Source of the mock functions to call
+
+        Returns:
+            FunctionResults: An object containing the results of the function calls.
+
+        Raises:
+            Exception: Any exception outside of the called functions, such as a
+                TypeError for calls that are not a list
+        """
+        return self._run(("json", function_calls, mock_functions))
+
+    def _run(self, job: Tuple[str, Any, str]) -> FunctionResults:
+        worker = self._idle.get()
+        try:
+            worker.wait_ready()
+            worker.conn.send(job)
+            if not worker.conn.poll(self.timeout):
+                worker = self._replace(worker)
+                return _failed("Code execution exceeded timeout limit.")
+            outcome, error, spans = pickle.loads(worker.conn.recv_bytes())
+        except (EOFError, OSError):
+            worker.process.join(timeout=1)
+            exitcode = worker.process.exitcode
+            worker = self._replace(worker)
+            if exitcode == -getattr(signal, "SIGXCPU", 0):
+                return _failed("Code execution exceeded CPU limit.")
+            return _failed(f"Sandbox worker exited with code {exitcode}.")
+        finally:
+            self._idle.put(worker)
+
+        # Stages timed inside the worker
+        for name, start, end in spans:
+            profiling.record(name, start, end, pid=worker.process.pid)
+
+        if error is not None:
+            raise error
+        function_results, variables, errors = outcome
+        return FunctionResults(
+            function_results=function_results, variables=variables, errors=errors
+        )
+
+    def close(self):
+        """Stop all workers."""
+        for worker in self._workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=1)
+            if worker.process.is_alive():
+                worker.kill()
+
+    def __enter__(self) -> "SandboxPool":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _failed(error: str) -> FunctionResults:
+    return FunctionResults(function_results={}, variables={}, errors=[error])
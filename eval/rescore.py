@@ -0,0 +1,135 @@
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Tuple, Union
+from functools import partial
+import json
+import os
+
+from eval import profiling
+from eval.json_mode import eval as json_mode
+from eval.pipeline import run_pipeline
+from eval.pythonic import eval as pythonic
+from eval.pythonic.engine import compile_dataset_mock_functions
+from eval.pythonic.sandbox import SandboxPool
+from eval.results import file_hash, read_results, scoring_settings
+from eval.schemas import Completion
+from eval.util import load_pythonic_jsonl, setup_logger
+
+logger = setup_logger(__name__)
+
+# Execution and error record builders of each mode, by manifest mode
+MODES = {
+    "pythonic": (pythonic.execute_completion, pythonic.error_record),
+    "json": (json_mode.execute_completion, json_mode.error_record),
+}
+
+
+class SavedCompletions:
+    """Serves the completions saved by a previous run in place of a RequestScheduler."""
+
+    def __init__(self, records: Iterable[Dict[str, Any]]):
+        self.completions = {
+            record["index"]: Completion(
+                text=record["completion"],
+                stopped_early=record.get("stopped_early", False),
+            )
+            for record in records
+            if record.get("completion") is not None
+        }
+
+    async def stream(
+        self, requests: Iterable[Dict[str, Any]]
+    ) -> AsyncIterator[Tuple[int, Union[Completion, Exception]]]:
+        """Yield the saved completion of each request's row, in order."""
+        for position, request in enumerate(requests):
+            index = request["row_index"]
+            completion = self.completions.get(index)
+            if completion is None:
+                yield position, KeyError(f"No saved completion for row {index}")
+            else:
+                yield position, completion
+
+
+async def rescore_run(
+    run_dir: str, strict: Optional[bool] = None, resume: bool = False
+) -> Dict[str, Any]:
+    """
+    Execute and score the completions saved by a previous run again.
+
+    No provider is called: the saved completions go through the same execution,
+    scoring and writing stages as a regular run, in parallel across the sandbox
+    workers. The results are written to `<run_dir>/rescore`, leaving the original
+    run untouched. Runs stopped early by an adaptive evaluation are rescored over
+    the rows they evaluated.
+
+    Args:
+        run_dir: Directory of the run to rescore
+        strict: Whether to only count fully correct rows (Optional, default: as in the run)
+        resume: Whether to skip the rows already rescored by an interrupted rescore
+
+    Returns:
+        Dict containing evaluation metrics:
+        {
+            "total_examples": int,
+            "overall_accuracy": float,
+            "errors": List[str]
+        }
+    """
+    with open(os.path.join(run_dir, "manifest.json"), "r") as f:
+        manifest = json.load(f)
+    if manifest["mode"] not in MODES:
+        raise ValueError(f"Cannot rescore runs of mode '{manifest['mode']}'")
+    if file_hash(manifest["data_path"]) != manifest["dataset_hash"]:
+        raise ValueError(
+            "Dataset '{}' changed since the run in '{}'".format(
+                manifest["data_path"], run_dir
+            )
+        )
+    execute_completion, error_record = MODES[manifest["mode"]]
+
+    logger.info(
+        "Rescoring run in '{}' ({} mode, model '{}' with provider '{}')".format(
+            run_dir, manifest["mode"], manifest["model_name"], manifest["provider"]
+        )
+    )
+
+    records = read_results(os.path.join(run_dir, "results.jsonl"))
+    completions = SavedCompletions(records)
+    if not completions.completions:
+        raise ValueError(f"No completions saved in '{run_dir}'")
+    # A run stopped early only evaluated the rows in its log
+    indices = None
+    if "adaptive" in manifest:
+        indices = sorted(record["index"] for record in records)
+
+    # Generation settings come from the run, scoring settings from the current setup
+    manifest = {
+        **manifest,
+        "strict": manifest["strict"] if strict is None else strict,
+        "settings": {**manifest["settings"], **scoring_settings()},
+        "rescored_from": run_dir,
+    }
+
+    rescore_path = os.path.join(run_dir, "rescore")
+    os.makedirs(rescore_path, exist_ok=True)
+
+    with profiling.span("load_dataset"):
+        rows = load_pythonic_jsonl(manifest["data_path"])
+    with profiling.span("compile_mock_functions"):
+        compile_dataset_mock_functions(row.mock_functions for row in rows)
+
+    with SandboxPool(mock_functions=(row.mock_functions for row in rows)) as sandbox:
+        metrics = await run_pipeline(
+            rows,
+            lambda row: {},
+            partial(execute_completion, sandbox),
+            completions,
+            os.path.join(rescore_path, "results.jsonl"),
+            manifest,
+            strict=manifest["strict"],
+            resume=resume,
+            on_error=error_record,
+            shard=tuple(manifest["shard"]) if manifest.get("shard") else None,
+            indices=indices,
+        )
+    profiling.export(rescore_path)
+
+    return metrics
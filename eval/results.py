@@ -0,0 +1,160 @@
+from typing import Any, Dict, List
+import hashlib
+import json
+import os
+
+from eval.settings import (
+    TEMPERATURE,
+    FLOAT_TOLERANCE,
+    CODE_EXECUTION_TIMEOUT,
+    JSON_CALL_TIMEOUT,
+)
+from eval.util import atomic_write, setup_logger
+
+logger = setup_logger(__name__)
+
+# Manifest entries that must match for a run to be resumed
+RESUME_KEYS = [
+    "mode",
+    "model_name",
+    "provider",
+    "strict",
+    "dataset_hash",
+    "prompt_hash",
+    "settings",
+    "shard",
+]
+
+
+def file_hash(file_path: str) -> str:
+    """Compute the SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def text_hash(text: str) -> str:
+    """Compute the SHA-256 of a string."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def build_manifest(
+    mode: str,
+    model_name: str,
+    provider: str,
+    strict: bool,
+    data_path: str,
+    system_prompt: str,
+    stream: bool = False,
+    prefix_cache: bool = False,
+) -> Dict[str, Any]:
+    """
+    Describe everything that affects the results of a run.
+
+    Args:
+        mode: The evaluation mode
+        model_name: Name of the model being evaluated
+        provider: Provider being used
+        strict: Whether only fully correct rows are counted
+        data_path: Path to the dataset
+        system_prompt: The system prompt template
+        stream: Whether completions are streamed and stopped early
+        prefix_cache: Whether the functions schema is moved after the static instructions
+
+    Returns:
+        The run manifest
+    """
+    settings = {"temperature": TEMPERATURE, "stream": stream, **scoring_settings()}
+    # Only recorded when enabled, so runs from before the option still resume
+    if prefix_cache:
+        settings["prefix_cache"] = True
+    return {
+        "mode": mode,
+        "model_name": model_name,
+        "provider": provider,
+        "strict": strict,
+        "data_path": data_path,
+        "dataset_hash": file_hash(data_path),
+        "prompt_hash": text_hash(system_prompt),
+        "settings": settings,
+    }
+
+
+def scoring_settings() -> Dict[str, Any]:
+    """Settings that affect how completions are executed and scored."""
+    return {
+        "float_tolerance": FLOAT_TOLERANCE,
+        "code_execution_timeout": CODE_EXECUTION_TIMEOUT,
+        "json_call_timeout": JSON_CALL_TIMEOUT,
+    }
+
+
+def read_results(results_file: str) -> List[Dict[str, Any]]:
+    """
+    Read the records of a results log, skipping a partially written last line.
+
+    Args:
+        results_file: Path to the results .jsonl file
+
+    Returns:
+        The result records, or an empty list if the file does not exist
+    """
+    records = []
+    if not os.path.exists(results_file):
+        return records
+    with open(results_file, "r") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logger.warning("Skipping incomplete record in '{}'".format(results_file))
+    return records
+
+
+class ResultsLog:
+    """
+    Append-only log of result records with a manifest describing the run.
+
+    Every record is flushed as soon as it is appended, so an interrupted run keeps
+    every finished row. When resuming, the manifest of the previous run must match,
+    and the rows already in the log are reported as completed.
+    """
+
+    def __init__(self, results_file: str, manifest: Dict[str, Any], resume: bool = False):
+        self.results_file = results_file
+        self.manifest_file = os.path.join(os.path.dirname(results_file), "manifest.json")
+        self.completed: Dict[int, Dict[str, Any]] = {}
+
+        if resume and os.path.exists(self.manifest_file):
+            with open(self.manifest_file, "r") as f:
+                previous = json.load(f)
+            mismatched = [
+                key for key in RESUME_KEYS if previous.get(key) != manifest.get(key)
+            ]
+            if mismatched:
+                raise ValueError(
+                    "Cannot resume run in '{}', {} changed".format(
+                        os.path.dirname(results_file), ", ".join(mismatched)
+                    )
+                )
+            for record in read_results(results_file):
+                if "index" in record:
+                    self.completed[record["index"]] = record
+
+        atomic_write(self.manifest_file, json.dumps(manifest, indent=2).encode("utf-8"))
+
+        # Rewrite the completed rows so appends never follow a partial line
+        lines = [json.dumps(record) + "\n" for record in self.completed.values()]
+        atomic_write(results_file, "".join(lines).encode("utf-8"))
+        self._file = open(results_file, "a")
+
+    def append(self, record: Dict[str, Any]):
+        """Append a record and flush it to disk."""
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def close(self):
+        """Close the log file."""
+        self._file.close()
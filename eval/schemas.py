@@ -1,7 +1,9 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 from enum import Enum
+import bisect
+import math
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
 from eval.settings import FLOAT_TOLERANCE
 
@@ -26,6 +28,77 @@ class OpenAIFunction(BaseModel):
     parameters: OpenAIParameter
 
 
+def values_match(value1: Any, value2: Any) -> bool:
+    """Check if two values match, considering tolerance for floats."""
+    if isinstance(value1, float) and isinstance(value2, float):
+        return abs(value1 - value2) <= FLOAT_TOLERANCE
+    return value1 == value2
+
+
+def _canonical(value: Any) -> Any:
+    """
+    Build a hashable key for a value such that equal values get equal keys.
+
+    Raises:
+        TypeError: If the value contains an unhashable object of an unknown type
+    """
+    if isinstance(value, list):
+        return ("list", tuple(_canonical(item) for item in value))
+    if isinstance(value, tuple):
+        return ("tuple", tuple(_canonical(item) for item in value))
+    if isinstance(value, (set, frozenset)):
+        return ("set", frozenset(_canonical(item) for item in value))
+    if isinstance(value, dict):
+        return (
+            "dict",
+            frozenset((_canonical(k), _canonical(v)) for k, v in value.items()),
+        )
+    hash(value)
+    return value
+
+
+class ValueIndex:
+    """
+    Index of the variable values of an execution, for matching expected values.
+
+    Values are bucketed by a canonical hashable key, and floats are also kept sorted
+    so matches within FLOAT_TOLERANCE are found by bisection. Values that cannot be
+    canonicalized are compared linearly. Every candidate is confirmed with
+    `values_match`, so matching is identical to comparing against every value.
+    """
+
+    def __init__(self, values: Iterable[Any]):
+        self._values = list(values)
+        self._buckets: Dict[Any, List[Any]] = {}
+        self._unindexed: List[Any] = []
+        floats = []
+        for value in self._values:
+            if isinstance(value, float) and not math.isnan(value):
+                floats.append(value)
+            try:
+                self._buckets.setdefault(_canonical(value), []).append(value)
+            except TypeError:
+                self._unindexed.append(value)
+        self._floats = sorted(floats)
+
+    def contains(self, value: Any) -> bool:
+        """Check if any indexed value matches the given value."""
+        if isinstance(value, float) and not math.isnan(value):
+            start = bisect.bisect_left(self._floats, value - FLOAT_TOLERANCE)
+            end = bisect.bisect_right(self._floats, value + FLOAT_TOLERANCE)
+            if any(values_match(value, other) for other in self._floats[start:end]):
+                return True
+
+        try:
+            candidates = self._buckets.get(_canonical(value), [])
+        except TypeError:
+            # Unhashable expected values can only be compared with every value
+            candidates = self._values
+        else:
+            candidates = candidates + self._unindexed
+        return any(values_match(value, other) for other in candidates)
+
+
 class FunctionResults(BaseModel):
     """Results from executing functions, including return values, variables and errors."""
 
@@ -33,6 +106,8 @@ class FunctionResults(BaseModel):
     variables: Dict[str, Any]
     errors: List[str]
 
+    _value_index: Optional[ValueIndex] = PrivateAttr(default=None)
+
     def check_score(self, values_list: List[Any], functions_list: List[str]) -> float:
         """
         Calculate a score based on presence of values and functions in results.
@@ -45,20 +120,30 @@ class FunctionResults(BaseModel):
         Returns:
             float: Score between 0 and 1, where 1 means all values and functions present
         """
+        return self.score_with_missing(values_list, functions_list)[0]
+
+    def score_with_missing(
+        self, values_list: List[Any], functions_list: List[str]
+    ) -> Tuple[float, List[Any], List[str]]:
+        """
+        Calculate the score of `check_score` along with what is missing from the results.
+
+        Args:
+            values_list: The values to search for
+            functions_list: The functions to search for
 
-        def values_match(value1: Any, value2: Any) -> bool:
-            """Check if two values match, considering tolerance for floats."""
-            if isinstance(value1, float) and isinstance(value2, float):
-                return abs(value1 - value2) <= FLOAT_TOLERANCE
-            return value1 == value2
+        Returns:
+            Tuple of the score, the missing values and the missing functions
+        """
+        # Index the variables once per execution
+        if self._value_index is None:
+            self._value_index = ValueIndex(self.variables.values())
 
         # Count matching values and track missing ones
         missing_values = []
         matching_values = 0
         for value in values_list:
-            if any(
-                values_match(value, var_value) for var_value in self.variables.values()
-            ):
+            if self._value_index.contains(value):
                 matching_values += 1
             else:
                 missing_values.append(value)
@@ -71,23 +156,16 @@ class FunctionResults(BaseModel):
         missing_functions = []
         matching_functions = 0
         for function in functions_list:
-            if function in self.function_results.keys():
+            if function in self.function_results:
                 matching_functions += 1
             else:
                 missing_functions.append(function)
 
-        # Save missing functions and values to file
-        with open("results/eval_missing.json", "w") as f:
-            import json
-
-            json.dump({"missing_functions": missing_functions}, f, indent=2)
-            json.dump({"missing_values": missing_values}, f, indent=2)
-
         functions_score = 0.5 * (
             matching_functions / len(functions_list) if functions_list else 1.0
         )
 
-        return values_score + functions_score
+        return values_score + functions_score, missing_values, missing_functions
 
 
 class Checklist(BaseModel):
@@ -120,6 +198,33 @@ class PythonicRow(BaseModel):
     checklist: Checklist
 
 
+class Completion(BaseModel):
+    """
+    A model completion, how long it took to generate and the tokens it used.
+
+    Attributes:
+        text: The completion text
+        ttft: Seconds until the first token was received, only known when streaming
+        total_time: Seconds until the completion was received, None if it was cached
+        queue_time: Seconds spent waiting for a provider slot, including retries
+        stopped_early: Whether the request was cancelled once the needed part arrived
+        prompt_tokens: Prompt tokens reported by the provider
+        completion_tokens: Completion tokens reported by the provider, or the number
+            of streamed chunks if the request was stopped before they were reported
+        hedge: Which request answered first if the request was hedged, "primary" or
+            "hedge", None if it was not
+    """
+
+    text: Optional[str]
+    ttft: Optional[float] = None
+    total_time: Optional[float] = None
+    queue_time: Optional[float] = None
+    stopped_early: bool = False
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    hedge: Optional[str] = None
+
+
 class EvalMode(str, Enum):
     """Evaluation mode for function calling."""
 
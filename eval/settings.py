@@ -7,29 +7,99 @@ load_dotenv()
 # General settings
 SHOW_COMPLETION_IN_EVAL = False
 
+# Generation settings
+TEMPERATURE = 0.0
+
 # Pythonic settings
 PYTHONIC_DATA_PATH = "data/eval_alpha.jsonl"
 PYTHONIC_SYSTEM_PROMPT_PATH = "eval/pythonic/system_prompt.txt"
 PYTHONIC_RESULTS_PATH = "results/pythonic"
 FLOAT_TOLERANCE = 1e-6
-BATCH_SIZE = 8
+DATASET_ROW_CACHE_SIZE = 4096  # Maximum number of rows of an indexed dataset kept in memory
 CODE_EXECUTION_TIMEOUT = 30  # Maximum time in seconds for code execution
+SANDBOX_WORKERS = os.cpu_count() or 4  # Number of sandbox worker processes
+SANDBOX_CPU_LIMIT = CODE_EXECUTION_TIMEOUT  # Maximum CPU seconds per code execution
+SANDBOX_MEMORY_LIMIT = 2 * 1024**3  # Maximum address space in bytes of a sandbox worker
+SANDBOX_PRELOAD_LIMIT = 1024  # Maximum number of mock modules a worker loads at start-up
+CODE_ANALYSIS_CACHE_SIZE = 4096  # Maximum number of analyzed code snippets kept in memory
+MOCK_FUNCTIONS_CACHE_PATH = ".cache/mock_functions"
+MOCK_FUNCTIONS_CACHE_SIZE = 4096  # Maximum number of compiled mock modules kept in memory
 
 # Json mode settings
 JSON_SYSTEM_PROMPT_PATH = "eval/json_mode/system_prompt.txt"
 JSON_RESULTS_PATH = "results/json_mode"
+JSON_CALL_TIMEOUT = 5  # Maximum time in seconds for each function call
+
+# Adaptive evaluation settings
+ADAPTIVE_CONFIDENCE = 0.95  # Confidence level of the interval on strict accuracy
+ADAPTIVE_MAX_WIDTH = 10.0  # Interval width in accuracy points at which an adaptive run stops
+ADAPTIVE_MIN_ROWS = 30  # Rows scored before an adaptive run may stop
+ADAPTIVE_SEED = 0  # Seed of the order rows are evaluated in
+
+# Sweep settings
+SWEEP_RESULTS_PATH = "results/sweep"
+
+# Request scheduling settings
+MAX_CONCURRENCY = 32  # Maximum number of in-flight requests per evaluation run
+PROVIDER_CONCURRENCY = {  # Maximum number of in-flight requests per provider replica
+    "lm_studio": 4,
+    "ollama": 4,
+    "vllm": 32,
+    "openrouter": 16,
+    "mock": 64,
+}
+ADAPTIVE_INITIAL_CONCURRENCY = 4  # In-flight requests per provider before the limit adapts
+ADAPTIVE_LATENCY_TOLERANCE = 1.5  # Latency increase over the trend that stops the limit growing
+REQUEST_MAX_RETRIES = 6  # Maximum number of retries of a failed request
+REQUEST_DEADLINE = 600  # Maximum time in seconds for a request, including retries
+RETRY_BASE_DELAY = 1.0  # Base delay in seconds of the exponential retry backoff
+RETRY_MAX_DELAY = 60.0  # Maximum delay in seconds between two retries
+HEDGE_PERCENTILE = 95  # Latency percentile after which --hedge duplicates a request
+HEDGE_MAX_RATIO = 0.1  # Maximum share of a provider's requests that are hedged
+HEDGE_MIN_SAMPLES = 20  # Completed requests needed before hedging a provider's requests
+HEDGE_WINDOW = 500  # Number of latest latencies the hedging percentile is taken from
 
-# Provider settings
-LM_STUDIO_URL = "http://localhost:1234/v1"
-OLLAMA_URL = "http://localhost:11434/v1"
-VLLM_URL = "http://localhost:8000/v1"
+# Pipeline settings
+EXECUTION_WORKERS = os.cpu_count() or 4  # Number of concurrent code executions
+PIPELINE_QUEUE_SIZE = 64  # Maximum number of rows waiting between two stages
+
+# Run summary settings
+LATENCY_PERCENTILES = (50, 95, 99)
+TOKEN_PRICES = {  # Estimated USD per million (prompt, completion) tokens, by "provider" or "provider:model"
+    "lm_studio": (0.0, 0.0),
+    "ollama": (0.0, 0.0),
+    "vllm": (0.0, 0.0),
+    "mock": (0.0, 0.0),
+    "openrouter:anthropic/claude-3.5-sonnet": (3.0, 15.0),  # Default model of run.py
+}
+
+# Completion cache settings
+COMPLETION_CACHE_PATH = ".cache/completions"
+COMPLETION_CACHE_MAX_BYTES = 512 * 1024 * 1024  # Maximum total size of cached entries
+COMPLETION_CACHE_MAX_AGE = 30 * 24 * 3600  # Maximum age in seconds of a cached entry
+
+# Provider settings, comma-separated URLs list the replicas of a local provider
+LM_STUDIO_URL = os.getenv("LM_STUDIO_URL", "http://localhost:1234/v1")
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/v1")
+VLLM_URL = os.getenv("VLLM_URL", "http://localhost:8000/v1")
 OPENROUTER_URL = "https://openrouter.ai/api/v1"
+MOCK_SERVER_URL = os.getenv("MOCK_SERVER_URL", "http://localhost:8100/v1")  # benchmarks/mock_server.py
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
 
-PROVIDER_URLS = {
-    "lm_studio": (LM_STUDIO_URL, "api_key"),
-    "ollama": (OLLAMA_URL, "api_key"),
-    "vllm": (VLLM_URL, "api_key"),
+PROVIDER_URLS = {  # (URL or list of replica URLs, API key) by provider
+    "lm_studio": (LM_STUDIO_URL.split(","), "api_key"),
+    "ollama": (OLLAMA_URL.split(","), "api_key"),
+    "vllm": (VLLM_URL.split(","), "api_key"),
     "openrouter": (OPENROUTER_URL, OPENROUTER_API_KEY),
+    "mock": (MOCK_SERVER_URL.split(","), "api_key"),
 }
+REPLICA_EJECT_FAILURES = 3  # Consecutive failed requests that take a replica out of rotation
+REPLICA_EJECT_TIME = 30  # Minimum time in seconds an ejected replica stays out of rotation
+REPLICA_HEALTH_INTERVAL = 10  # Time in seconds between health checks of the replicas
+REPLICA_HEALTH_TIMEOUT = 5  # Maximum time in seconds for a replica to answer a health check
+
+# HTTP connection settings, one connection pool is shared by every provider
+HTTP_MAX_CONNECTIONS = None  # Maximum open connections, None to only bound them by the scheduler
+HTTP_KEEPALIVE_EXPIRY = 60  # Time in seconds an idle connection stays open for reuse
+HTTP2 = os.getenv("HTTP2", "1") != "0"  # Negotiate HTTP/2 with endpoints supporting it, requires h2
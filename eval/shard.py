@@ -0,0 +1,75 @@
+from typing import List, Optional, Sequence, Tuple
+import hashlib
+import json
+
+from eval.schemas import PythonicRow
+
+# Hex digits of the content hash identifying a row
+ROW_ID_LENGTH = 16
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """
+    Parse a shard given as "i/N", the i-th of N shards counting from 1.
+
+    Args:
+        spec: The shard specification
+
+    Returns:
+        The shard number and the number of shards
+    """
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{spec}', expected 'i/N' such as '1/4'")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{spec}', i must be between 1 and N")
+    return index, count
+
+
+def shard_dirname(shard: Tuple[int, int]) -> str:
+    """Name of the directory a shard's results are written to, inside the run directory."""
+    return "shard_{}_of_{}".format(*shard)
+
+
+def row_id(row: PythonicRow) -> str:
+    """
+    Stable identity of a row, the hash of its content.
+
+    The identity does not depend on the row's position or on the dataset format,
+    so it is the same on every machine evaluating the dataset. Rows of an indexed
+    dataset dump the same fields as the PythonicRow they validate to, so a .jsonl
+    dataset and its indexed copy give the same ids.
+    """
+    serialized = json.dumps(row.model_dump(mode="json"), sort_keys=True)
+    digest = hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+    return digest[:ROW_ID_LENGTH]
+
+
+def shard_indices(
+    rows: Sequence[PythonicRow],
+    shard: Tuple[int, int],
+    ids: Optional[Sequence[str]] = None,
+) -> List[int]:
+    """
+    Select the rows of a shard.
+
+    Rows are assigned by their content hash, so the shards are disjoint, cover the
+    dataset together, and a row stays in its shard when rows are added or reordered.
+
+    Args:
+        rows: The dataset
+        shard: The shard number, counting from 1, and the number of shards
+        ids: The `row_id` of every row, if already computed (Optional)
+
+    Returns:
+        Indices of the shard's rows, in dataset order
+    """
+    index, count = shard
+    if ids is None:
+        ids = [row_id(row) for row in rows]
+    return [
+        position
+        for position, identity in enumerate(ids)
+        if int(identity, 16) % count == index - 1
+    ]
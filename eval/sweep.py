@@ -0,0 +1,224 @@
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import itertools
+import json
+import os
+import time
+
+from pydantic import BaseModel
+
+from eval import profiling, transport
+from eval.adaptive import SequentialStop
+from eval.cache import CacheMode, CompletionCache
+from eval.evaluate import EvaluationMode, evaluate_model
+from eval.model import RequestScheduler
+from eval.pythonic.engine import compile_dataset_mock_functions
+from eval.pythonic.sandbox import SandboxPool
+from eval.settings import ADAPTIVE_MAX_WIDTH, PYTHONIC_DATA_PATH, SWEEP_RESULTS_PATH
+from eval.util import atomic_write, load_pythonic_jsonl, setup_logger
+
+logger = setup_logger(__name__)
+
+# Column headers of the modes in the sweep table, as in the README results
+MODE_HEADERS = {EvaluationMode.pythonic: "Pythonic", EvaluationMode.json: "JSON"}
+
+
+class SweepTarget(BaseModel):
+    """A model served by a specific provider."""
+
+    model: str
+    provider: str
+
+
+class SweepConfig(BaseModel):
+    """
+    Matrix of evaluations to run in a single sweep.
+
+    Attributes:
+        models: Models evaluated with every provider of `providers`
+        providers: Providers every model of `models` is evaluated with
+        targets: Further model and provider pairs, for models only some providers serve
+        modes: Evaluation modes every target is evaluated in
+        concurrency: Maximum in-flight requests by provider, shared by all evaluations
+        hedge: Latency percentile after which slow requests are duplicated
+        adaptive: Whether to stop each evaluation once its accuracy is known well enough
+        threshold: Accuracy in percent that adaptive evaluations decide against
+        ci_width: Interval width in accuracy points at which adaptive evaluations stop
+        prefix_cache: Whether to lay out prompts and order rows for provider prefix caching
+        cache_hints: Whether to also mark the static instructions as cacheable
+    """
+
+    models: List[str] = []
+    providers: List[str] = []
+    targets: List[SweepTarget] = []
+    modes: List[EvaluationMode] = [EvaluationMode.pythonic, EvaluationMode.json]
+    data_path: str = PYTHONIC_DATA_PATH
+    strict: bool = False
+    stream: bool = False
+    hedge: Optional[float] = None
+    adaptive: bool = False
+    threshold: Optional[float] = None
+    ci_width: float = ADAPTIVE_MAX_WIDTH
+    prefix_cache: bool = False
+    cache_hints: bool = False
+    cache: CacheMode = CacheMode.use
+    resume: bool = False
+    concurrency: Dict[str, int] = {}
+
+    def cells(self) -> List[Tuple[str, str, EvaluationMode]]:
+        """List the (model, provider, mode) evaluations, without duplicates."""
+        targets = [(t.model, t.provider) for t in self.targets]
+        targets += itertools.product(self.models, self.providers)
+        return [
+            (model, provider, mode)
+            for (model, provider), mode in itertools.product(
+                dict.fromkeys(targets), dict.fromkeys(self.modes)
+            )
+        ]
+
+
+def load_sweep_config(config_file: str) -> SweepConfig:
+    """Load a sweep configuration from a JSON file with the fields of SweepConfig."""
+    with open(config_file, "r") as f:
+        return SweepConfig(**json.load(f))
+
+
+def sweep_table(results: List[Dict[str, Any]], modes: List[EvaluationMode]) -> str:
+    """
+    Format the accuracy of each model and provider in each mode as a Markdown table.
+
+    Adaptive evaluations show the interval on strict accuracy next to the
+    accuracy, and failed evaluations are shown as "error".
+    """
+    header = ["Model Name", "Provider", *(MODE_HEADERS[mode] for mode in modes)]
+    table: Dict[Tuple[str, str], Dict[str, str]] = {}
+    for result in results:
+        if result["error"] is None:
+            cell = f"{result['overall_accuracy']:.0f}"
+            adaptive = result.get("adaptive")
+            if adaptive is not None:
+                cell += " ({:.0f}-{:.0f})".format(
+                    adaptive["lower_bound"], adaptive["upper_bound"]
+                )
+        else:
+            cell = "error"
+        row = table.setdefault((result["model"], result["provider"]), {})
+        row[result["mode"]] = cell
+
+    lines = [header]
+    for (model, provider), cells in table.items():
+        lines.append([model, provider, *(cells.get(mode.value, "") for mode in modes)])
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    formatted = [
+        "| " + " | ".join(value.ljust(w) for value, w in zip(line, widths)) + " |"
+        for line in lines
+    ]
+    formatted.insert(1, "|" + "|".join("-" * (width + 2) for width in widths) + "|")
+    return "\n".join(formatted)
+
+
+async def run_sweep(
+    config: SweepConfig, output_path: Optional[str] = SWEEP_RESULTS_PATH
+) -> List[Dict[str, Any]]:
+    """
+    Evaluate every model, provider and mode of a sweep concurrently.
+
+    The dataset is loaded and its mock functions compiled once. All evaluations
+    share the request scheduler, so the per-provider concurrency limits hold across
+    evaluations, the completion cache and the sandbox workers. Each evaluation
+    writes its results to its usual run directory, and a failed evaluation does not
+    stop the others.
+
+    Args:
+        config: The sweep to run
+        output_path: Directory to write the consolidated results and profile to
+            (Optional, default: SWEEP_RESULTS_PATH, None to not write them)
+
+    Returns:
+        The metrics of each evaluation, with an "error" entry set if it failed
+    """
+    cells = config.cells()
+    if not cells:
+        raise ValueError("The sweep has no model and provider to evaluate")
+    logger.info(
+        "Sweeping {} evaluations ({} model/provider pairs, {} modes)".format(
+            len(cells), len(cells) // len(set(config.modes)), len(set(config.modes))
+        )
+    )
+
+    with profiling.span("load_dataset"):
+        rows = load_pythonic_jsonl(config.data_path)
+    with profiling.span("compile_mock_functions"):
+        compile_dataset_mock_functions(row.mock_functions for row in rows)
+
+    scheduler = RequestScheduler(
+        provider_limits=config.concurrency or None,
+        cache=CompletionCache(mode=config.cache),
+        hedge_percentile=config.hedge,
+        providers={provider for _, provider, _ in cells},
+    )
+    start = time.perf_counter()
+    sandbox = SandboxPool(mock_functions=(row.mock_functions for row in rows))
+    try:
+        with sandbox:
+            outcomes = await asyncio.gather(
+                *(
+                    evaluate_model(
+                        model_name=model,
+                        provider=provider,
+                        mode=mode,
+                        strict=config.strict,
+                        data_path=config.data_path,
+                        resume=config.resume,
+                        stream=config.stream,
+                        stopping=SequentialStop(config.threshold, config.ci_width)
+                        if config.adaptive
+                        else None,
+                        prefix_cache=config.prefix_cache,
+                        cache_hints=config.cache_hints,
+                        rows=rows,
+                        scheduler=scheduler,
+                        sandbox=sandbox,
+                    )
+                    for model, provider, mode in cells
+                ),
+                return_exceptions=True,
+            )
+    finally:
+        await transport.aclose()
+    wall_time = time.perf_counter() - start
+    scheduler.cache.log_stats()
+    scheduler.log_stats()
+
+    results = []
+    for (model, provider, mode), outcome in zip(cells, outcomes):
+        result = {"model": model, "provider": provider, "mode": mode.value}
+        if isinstance(outcome, Exception):
+            logger.error(
+                "Evaluation of '{}' with provider '{}' in {} mode failed: {}".format(
+                    model, provider, mode.value, outcome
+                )
+            )
+            result.update(error=str(outcome))
+        else:
+            result.update(outcome, error=None)
+        results.append(result)
+
+    table = sweep_table(results, list(dict.fromkeys(config.modes)))
+    logger.info(f"Sweep finished in {wall_time:.1f}s:\n{table}")
+    if output_path is not None:
+        os.makedirs(output_path, exist_ok=True)
+        sweep = {
+            "config": config.model_dump(mode="json"),
+            "wall_time": wall_time,
+            "results": results,
+        }
+        atomic_write(
+            os.path.join(output_path, "sweep.json"),
+            json.dumps(sweep, indent=2).encode("utf-8"),
+        )
+        atomic_write(
+            os.path.join(output_path, "sweep.md"), (table + "\n").encode("utf-8")
+        )
+        profiling.export(output_path)
+    return results
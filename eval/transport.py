@@ -0,0 +1,91 @@
+from typing import TYPE_CHECKING, Optional
+import asyncio
+import importlib.util
+
+from eval.settings import HTTP2, HTTP_KEEPALIVE_EXPIRY, HTTP_MAX_CONNECTIONS
+from eval.util import setup_logger
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = setup_logger(__name__)
+
+# Connections kept open for reuse, raised by each scheduler to its concurrency
+_keepalive_connections = 0
+# Connection pool of the running event loop, and that loop
+_client: Optional["httpx.AsyncClient"] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def http2_available() -> bool:
+    """Tell whether HTTP/2 is enabled and its h2 dependency installed."""
+    return HTTP2 and importlib.util.find_spec("h2") is not None
+
+
+def reserve_connections(count: int):
+    """
+    Keep at least `count` idle connections open for reuse.
+
+    Schedulers reserve as many connections as they may have requests in flight,
+    so that no request waits for a new connection once the pool is warm. Pools
+    created afterwards use the largest reservation.
+
+    Args:
+        count: Number of connections to keep alive
+    """
+    global _keepalive_connections
+    _keepalive_connections = max(_keepalive_connections, count)
+
+
+def http_client() -> "httpx.AsyncClient":
+    """
+    Get the HTTP client shared by the provider clients of the running event loop.
+
+    All providers and replicas share one connection pool, whose connections are
+    kept alive between requests. HTTP/2 is negotiated with endpoints that support
+    it if the h2 package is installed. Connections are bound to the event loop
+    that opened them, so each `asyncio.run` gets its own pool.
+
+    Returns:
+        The shared HTTP client
+    """
+    global _client, _loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _loop is not loop:
+        import httpx
+
+        keepalive = _keepalive_connections or None
+        if HTTP_MAX_CONNECTIONS is not None and keepalive is not None:
+            keepalive = min(keepalive, HTTP_MAX_CONNECTIONS)
+        http2 = http2_available()
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=keepalive,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            http2=http2,
+        )
+        _loop = loop
+        logger.debug(
+            "Created HTTP connection pool (keep-alive {}, max {}, HTTP/2 {})".format(
+                keepalive or "unlimited",
+                HTTP_MAX_CONNECTIONS or "unlimited",
+                "on" if http2 else "off",
+            )
+        )
+    return _client
+
+
+async def aclose():
+    """
+    Close the connection pool of the running event loop.
+
+    Called once an evaluation is done sending requests, so that its connections do
+    not outlive it. A later request opens a new pool.
+    """
+    global _client, _loop
+    if _client is not None and _loop is asyncio.get_running_loop():
+        client, _client, _loop = _client, None, None
+        await client.aclose()
+        logger.debug("Closed HTTP connection pool")
@@ -1,24 +1,55 @@
-from typing import List, Callable, Dict, Any, get_type_hints, Union
+from typing import (
+    List,
+    Callable,
+    Dict,
+    Any,
+    Optional,
+    Sequence,
+    TYPE_CHECKING,
+    Tuple,
+    get_type_hints,
+    Union,
+)
+import ast
 import inspect
 import json
+import os
 import re
 import logging
+import tempfile
 
-from eval.schemas import PythonicRow
+if TYPE_CHECKING:
+    from eval.schemas import PythonicRow
 
+# Markers of the functions schema block in the system prompt templates
+SCHEMA_START = "<|functions_schema|>"
+SCHEMA_END = "<|end_functions_schema|>"
+SCHEMA_PLACEHOLDER = "{{functions_schema}}"
+# Left in place of the schema block when it is moved after the instructions
+SCHEMA_POINTER = "(listed at the end of this prompt)"
 
-def load_pythonic_jsonl(file_path: str) -> List[PythonicRow]:
+
+def load_pythonic_jsonl(file_path: str) -> Sequence["PythonicRow"]:
     """
     Load the pythonic.jsonl file and return a list of PythonicRow objects.
 
+    Indexed datasets built by `python -m eval.dataset` are memory-mapped instead,
+    and their rows are deserialized and validated lazily on first access.
+
     Args:
-        file_path: Path to the pythonic.jsonl file
+        file_path: Path to the pythonic.jsonl file or an indexed dataset
 
     Returns:
-        List of PythonicRow objects
+        Sequence of PythonicRow objects
     """
+    from eval.dataset import IndexedDataset, is_indexed_dataset
+    from eval.schemas import PythonicRow
+
     rows = []
     try:
+        if is_indexed_dataset(file_path):
+            return IndexedDataset(file_path)
+
         with open(file_path, "r") as f:
             for line in f:
                 if line.strip():  # Skip empty lines
@@ -44,6 +75,65 @@ def extract_codeblocks(text: str) -> List[str]:
     return "\n".join(code_blocks) if code_blocks else ""
 
 
+def _calls_functions(code: str) -> bool:
+    """Tell whether code calls any function, code that does not parse is assumed to."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return True
+    return any(isinstance(node, ast.Call) for node in ast.walk(tree))
+
+
+class CodeBlockStream:
+    """
+    Incrementally find the end of the first ```python block calling a function.
+
+    Blocks without any call, such as imports or an outline, are kept and reading
+    goes on to the next block, so `extract_codeblocks` merges them with it. Blocks
+    after the first one with calls are not waited for, so a completion spreading
+    its calls over several blocks is scored on its first blocks only when streamed.
+    `feed` is called with the whole completion received so far and only scans the
+    text added since the previous call.
+    """
+
+    OPEN = "```python"
+    CLOSE = "```"
+
+    def __init__(self):
+        self._body: Optional[int] = None  # Start of the code inside the block
+        self._scanned = 0
+        self._start = 0  # End of the last block, where the next one is searched from
+
+    def feed(self, text: str) -> Optional[int]:
+        """
+        Args:
+            text: The completion received so far
+
+        Returns:
+            The offset just past the closing fence once the block is complete, else None
+        """
+        while True:
+            if self._body is None:
+                start = text.find(
+                    self.OPEN, max(self._start, self._scanned - len(self.OPEN) + 1)
+                )
+                if start == -1:
+                    self._scanned = len(text)
+                    return None
+                self._body = self._scanned = start + len(self.OPEN)
+
+            end = text.find(
+                self.CLOSE, max(self._body, self._scanned - len(self.CLOSE) + 1)
+            )
+            if end == -1:
+                self._scanned = len(text)
+                return None
+            if _calls_functions(text[self._body : end]):
+                return end + len(self.CLOSE)
+            self._body = None
+            self._start = self._scanned = end + len(self.CLOSE)
+
+
 def load_system_prompt(file_path: str) -> str:
     """
     Load the system prompt from a given file and return it as a string.
@@ -72,7 +162,59 @@ def insert_functions_schema(system_prompt: str, functions_schema: str) -> str:
     Returns:
         System prompt with the functions schema inserted
     """
-    return system_prompt.replace("{{functions_schema}}", functions_schema)
+    return system_prompt.replace(SCHEMA_PLACEHOLDER, functions_schema)
+
+
+def split_functions_schema(system_prompt: str) -> Tuple[str, str]:
+    """
+    Move the functions schema out of a system prompt template, to after its instructions.
+
+    Prompts sharing a byte-identical leading prefix let servers with prefix caching,
+    such as vLLM, and providers with prompt caching skip processing that prefix again.
+    With the schema moved last, the instructions are the same for every row.
+
+    Args:
+        system_prompt: The system prompt template
+
+    Returns:
+        The static instructions, pointing to the schema at the end, and the template
+        of the schema block that follows them, for `insert_functions_schema`
+    """
+    start = system_prompt.find(SCHEMA_START)
+    end = system_prompt.find(SCHEMA_END)
+    if start < 0 or end < start:
+        start = system_prompt.index(SCHEMA_PLACEHOLDER)
+        end = start + len(SCHEMA_PLACEHOLDER)
+    else:
+        end += len(SCHEMA_END)
+    static = system_prompt[:start] + SCHEMA_POINTER + system_prompt[end:]
+    return static.rstrip() + "\n\n", system_prompt[start:end]
+
+
+def atomic_write(file_path: str, data: bytes):
+    """
+    Write data to a file so that concurrent readers never see a partial file.
+
+    The data is written to a temporary file in the same directory, which is then
+    renamed into place.
+
+    Args:
+        file_path: Path of the file to write
+        data: The bytes to write
+    """
+    directory = os.path.dirname(file_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
 
 
 def setup_logger(logger_name: str) -> logging.Logger:
@@ -1,6 +1,12 @@
 import argparse
 import asyncio
+from eval import profiling
+from eval.cache import CacheMode
 from eval.evaluate import evaluate_model, EvaluationMode
+from eval.settings import ADAPTIVE_MAX_WIDTH, HEDGE_PERCENTILE, PYTHONIC_DATA_PATH
+
+# Modules of the other commands are imported by the commands using them, run.py is
+# started often and only pays for what the command needs
 
 
 # qwen/qwen-2.5-7b-instruct
@@ -11,20 +17,180 @@ def main():
     parser.add_argument("--strict", action="store_true")
     parser.add_argument("--show_completion", action="store_true", default=False)
     parser.add_argument("--mode", choices=["json", "pythonic"], default="pythonic")
+    parser.add_argument("--data", default=PYTHONIC_DATA_PATH)
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument(
+        "--cache", choices=[m.value for m in CacheMode], default=CacheMode.use.value
+    )
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument(
+        "--hedge",
+        nargs="?",
+        type=float,
+        const=HEDGE_PERCENTILE,
+        default=None,
+        metavar="PERCENTILE",
+        help="Duplicate requests slower than this latency percentile",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Stop once the interval on strict accuracy is narrow enough or "
+        "excludes --threshold",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=None,
+        metavar="PERCENT",
+        help="Strict accuracy an adaptive run decides against",
+    )
+    parser.add_argument(
+        "--ci-width",
+        type=float,
+        default=ADAPTIVE_MAX_WIDTH,
+        metavar="PERCENT",
+        help="Interval width at which an adaptive run stops",
+    )
+    parser.add_argument(
+        "--prefix-cache",
+        action="store_true",
+        help="Put the functions schema last and evaluate rows sharing it together",
+    )
+    parser.add_argument(
+        "--cache-hints",
+        action="store_true",
+        help="Mark the static instructions as cacheable, implies --prefix-cache",
+    )
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--rescore", metavar="RUN_DIR", default=None)
+    parser.add_argument(
+        "--shard",
+        default=None,
+        metavar="I/N",
+        help="Evaluate only the I-th of N disjoint slices of the dataset",
+    )
+    parser.add_argument(
+        "--merge",
+        nargs="+",
+        default=None,
+        metavar="SHARD_DIR",
+        help="Combine the results of every shard of a run into one run",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        metavar="RUN_DIR",
+        help="Directory to write the merged run to (default: the run of the shards)",
+    )
+    parser.add_argument(
+        "--sweep",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="CONFIG",
+        help="Evaluate --models x --providers x --modes concurrently, or a JSON config",
+    )
+    parser.add_argument("--models", nargs="+", default=[])
+    parser.add_argument("--providers", nargs="+", default=[])
+    parser.add_argument(
+        "--modes", nargs="+", choices=["json", "pythonic"], default=["pythonic", "json"]
+    )
     args = parser.parse_args()
 
+    if args.profile:
+        profiling.enable()
+
+    if args.merge:
+        from eval.merge import merge_shards
+
+        try:
+            result = merge_shards(args.merge, args.output)
+        except ValueError as e:
+            parser.exit(1, f"Cannot merge the shards: {e}\n")
+        print("Merge:", result)
+        return
+
+    shard = None
+    if args.shard:
+        from eval.shard import parse_shard
+
+        if args.sweep is not None or args.rescore or args.adaptive:
+            parser.error(
+                "--shard cannot be combined with --sweep, --rescore or --adaptive"
+            )
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.rescore:
+        from eval.rescore import rescore_run
+
+        result = asyncio.run(
+            rescore_run(args.rescore, strict=args.strict or None, resume=args.resume)
+        )
+        print("Rescore:", result)
+        return
+
+    if args.sweep is not None:
+        from eval.sweep import SweepConfig, load_sweep_config, run_sweep
+
+        if args.sweep:
+            config = load_sweep_config(args.sweep)
+        else:
+            providers = args.providers or [args.provider]
+            config = SweepConfig(
+                models=args.models or [args.model],
+                providers=providers,
+                modes=args.modes,
+                data_path=args.data,
+                strict=args.strict,
+                stream=args.stream,
+                hedge=args.hedge,
+                adaptive=args.adaptive,
+                threshold=args.threshold,
+                ci_width=args.ci_width,
+                prefix_cache=args.prefix_cache,
+                cache_hints=args.cache_hints,
+                cache=CacheMode(args.cache),
+                resume=args.resume,
+                concurrency=dict.fromkeys(providers, args.concurrency)
+                if args.concurrency
+                else {},
+            )
+        asyncio.run(run_sweep(config))
+        return
+
     if args.mode == "pythonic":
         mode = EvaluationMode.pythonic
     else:
         mode = EvaluationMode.json
 
+    stopping = None
+    if args.adaptive:
+        from eval.adaptive import SequentialStop
+
+        stopping = SequentialStop(args.threshold, args.ci_width)
+
     result = asyncio.run(
         evaluate_model(
             model_name=args.model,
             provider=args.provider,
             mode=mode,
             strict=args.strict,
+            data_path=args.data,
             show_completion=args.show_completion,
+            concurrency=args.concurrency,
+            cache_mode=CacheMode(args.cache),
+            resume=args.resume,
+            stream=args.stream,
+            hedge=args.hedge,
+            stopping=stopping,
+            prefix_cache=args.prefix_cache,
+            cache_hints=args.cache_hints,
+            shard=shard,
         )
     )
 
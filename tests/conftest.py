@@ -0,0 +1,55 @@
+from typing import Any, Callable, Dict, Iterable, Union
+import os
+
+import pytest
+
+from eval.dataset import build_indexed_dataset
+from eval.results import build_manifest
+from eval.schemas import Completion
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "eval_alpha.jsonl")
+
+
+class FakeScheduler:
+    """
+    Stands in for the request scheduler, answering each row with a set completion.
+
+    Rows whose completion is an exception fail as if their request did. The rows
+    requested and their requests are recorded in order.
+    """
+
+    def __init__(self, completion: Callable[[int], Union[str, Exception]]):
+        self.completion = completion
+        self.requested = []
+        self.requests = []
+
+    async def stream(self, requests: Iterable[Dict[str, Any]]):
+        for position, request in enumerate(requests):
+            self.requested.append(request["row_index"])
+            self.requests.append(request)
+            completion = self.completion(request["row_index"])
+            if isinstance(completion, Exception):
+                yield position, completion
+            else:
+                yield position, Completion(text=completion)
+
+
+def pythonic_manifest(data_path: str = DATA_PATH, **settings) -> Dict[str, Any]:
+    """Manifest of a pythonic run of a fake model."""
+    return build_manifest(
+        "pythonic", "fake-model", "fake", False, data_path, "{functions}", **settings
+    )
+
+
+@pytest.fixture
+def data_path() -> str:
+    """The evaluation dataset shipped with the repository."""
+    return DATA_PATH
+
+
+@pytest.fixture
+def indexed_data_path(tmp_path) -> str:
+    """An indexed copy of the evaluation dataset."""
+    output_path = str(tmp_path / "eval_alpha.dpab")
+    build_indexed_dataset(DATA_PATH, output_path)
+    return output_path
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+from eval import model
+from eval.cache import CacheMissError, CacheMode, CompletionCache
+from eval.model import RequestScheduler
+from eval.schemas import Completion
+from eval.util import CodeBlockStream
+
+KEY = CompletionCache.key("model", "openrouter", "system", "query", 0.0)
+
+
+def test_key_is_stable():
+    # Keys address entries written by earlier runs, so they must never change
+    assert KEY == "dc4c38454760bcc280bcfcbdab3f47795abfd86bd732b68c3f5d6d971032a9b9"
+    stopped = CompletionCache.key(
+        "model", "openrouter", "system", "query", 0.0, stop="CodeBlockStream"
+    )
+    assert stopped == "9a9e68645023cabde5403418abd1ad88acc0ead14b4ecc2f95f3dc493ba8bb4e"
+
+
+@pytest.mark.parametrize(
+    "inputs",
+    [
+        ("other", "openrouter", "system", "query", 0.0),
+        ("model", "ollama", "system", "query", 0.0),
+        ("model", "openrouter", "other", "query", 0.0),
+        ("model", "openrouter", "system", "other", 0.0),
+        ("model", "openrouter", "system", "query", 0.7),
+    ],
+)
+def test_key_covers_every_input(inputs):
+    assert CompletionCache.key(*inputs) != KEY
+
+
+def test_streamed_completions_are_cached_apart(tmp_path, monkeypatch):
+    monkeypatch.setattr(model, "reserve_connections", lambda connections: None)
+
+    async def request(self, request):
+        return Completion(text="```python\nx = 1\n```")
+
+    monkeypatch.setattr(RequestScheduler, "_request", request)
+    cache = CompletionCache(str(tmp_path))
+    scheduler = RequestScheduler(cache=cache)
+    asyncio.run(
+        scheduler.submit(
+            {
+                "model_name": "model",
+                "provider": "openrouter",
+                "system_prompt": "system",
+                "user_query": "query",
+                "stream_parser": CodeBlockStream,
+            }
+        )
+    )
+
+    stopped = CompletionCache.key(
+        "model", "openrouter", "system", "query", model.TEMPERATURE, "CodeBlockStream"
+    )
+    full = CompletionCache.key(
+        "model", "openrouter", "system", "query", model.TEMPERATURE
+    )
+    assert cache.get(stopped) == "```python\nx = 1\n```"
+    assert cache.get(full) is None
+
+
+def test_use_mode(tmp_path):
+    cache = CompletionCache(str(tmp_path))
+    assert cache.get(KEY) is None
+    cache.put(KEY, "completion")
+    assert cache.get(KEY) == "completion"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_refresh_mode_overwrites(tmp_path):
+    CompletionCache(str(tmp_path)).put(KEY, "old")
+    cache = CompletionCache(str(tmp_path), mode=CacheMode.refresh)
+    assert cache.get(KEY) is None
+    cache.put(KEY, "new")
+    assert CompletionCache(str(tmp_path)).get(KEY) == "new"
+
+
+def test_bypass_mode_touches_nothing(tmp_path):
+    path = str(tmp_path / "cache")
+    cache = CompletionCache(path, mode=CacheMode.bypass)
+    cache.put(KEY, "completion")
+    assert cache.get(KEY) is None
+    assert not os.path.exists(path)
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_only_mode_fails_on_misses(tmp_path):
+    cache = CompletionCache(str(tmp_path), mode=CacheMode.only)
+    with pytest.raises(CacheMissError):
+        cache.get(KEY)
+    cache.put(KEY, "completion")
+    with pytest.raises(CacheMissError):
+        cache.get(KEY)
+
+    CompletionCache(str(tmp_path)).put(KEY, "completion")
+    assert cache.get(KEY) == "completion"
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "{not json",
+        json.dumps({"completion": "no creation time"}),
+        json.dumps({"created": time.time()}),
+        json.dumps({"created": "yesterday", "completion": "completion"}),
+        json.dumps(["completion"]),
+    ],
+)
+def test_malformed_entries_are_misses(tmp_path, content):
+    cache = CompletionCache(str(tmp_path))
+    entry_path = cache._entry_path(KEY)
+    os.makedirs(os.path.dirname(entry_path))
+    with open(entry_path, "w") as f:
+        f.write(content)
+
+    assert cache.get(KEY) is None
+    assert cache.misses == 1
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = CompletionCache(str(tmp_path), max_age=60)
+    cache.put(KEY, "completion")
+    entry_path = cache._entry_path(KEY)
+    with open(entry_path, "w") as f:
+        json.dump({"created": time.time() - 120, "completion": "completion"}, f)
+
+    assert cache.get(KEY) is None
+
+
+def entry_files(path) -> list:
+    return sorted(name for _, _, files in os.walk(path) for name in files)
+
+
+def test_eviction(tmp_path):
+    cache = CompletionCache(str(tmp_path))
+    now = time.time()
+    keys = [
+        CompletionCache.key("model", "mock", "system", str(i), 0.0) for i in range(4)
+    ]
+    for age, key in zip([3000, 2000, 1000, 0], keys):
+        cache.put(key, "x" * 100)
+        os.utime(cache._entry_path(key), (now - age, now - age))
+    stale = os.path.join(str(tmp_path), "entry.tmp")
+    with open(stale, "w") as f:
+        f.write("partial")
+    os.utime(stale, (now - 7200, now - 7200))
+    size = sum(os.path.getsize(cache._entry_path(key)) for key in keys[2:])
+
+    # The oldest entry is expired, and one more is evicted to fit the newest two
+    CompletionCache(str(tmp_path), max_bytes=size, max_age=2500)
+
+    assert entry_files(tmp_path) == sorted(key + ".json" for key in keys[2:])
@@ -0,0 +1,146 @@
+import asyncio
+from email.utils import formatdate
+import time
+
+import httpx
+import openai
+import pytest
+
+from eval import concurrency, model
+from eval.concurrency import AdaptiveLimiter, classify_error
+from eval.model import RequestScheduler
+
+REQUEST = httpx.Request("POST", "http://127.0.0.1/v1/chat/completions")
+
+
+def status_error(status: int, headers=None) -> openai.APIStatusError:
+    response = httpx.Response(status, headers=headers, request=REQUEST)
+    return openai.APIStatusError("error", response=response, body=None)
+
+
+@pytest.mark.parametrize(
+    "error, retryable, throttled",
+    [
+        (status_error(429), True, True),
+        (status_error(500), True, False),
+        (status_error(503), True, False),
+        (status_error(408), True, False),
+        (status_error(400), False, False),
+        (status_error(401), False, False),
+        (openai.APITimeoutError(REQUEST), True, False),
+        (openai.APIConnectionError(request=REQUEST), True, False),
+        (asyncio.TimeoutError(), True, False),
+        (ValueError("bad completion"), False, False),
+    ],
+)
+def test_classify_error(error, retryable, throttled):
+    assert classify_error(error) == (retryable, throttled, None)
+
+
+def test_retry_after_seconds():
+    assert classify_error(status_error(429, {"Retry-After": "7"}))[2] == 7.0
+    assert classify_error(status_error(429, {"Retry-After-Ms": "250"}))[2] == 0.25
+
+
+def test_retry_after_http_date():
+    date = formatdate(time.time() + 30, usegmt=True)
+    delay = classify_error(status_error(503, {"Retry-After": date}))[2]
+    assert 28 <= delay <= 30
+
+    past = formatdate(time.time() - 30, usegmt=True)
+    assert classify_error(status_error(503, {"Retry-After": past}))[2] == 0.0
+    assert classify_error(status_error(503, {"Retry-After": "soon"}))[2] is None
+
+
+class Clock:
+    """Controllable stand-in for `time.monotonic`."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(concurrency.time, "monotonic", clock)
+    return clock
+
+
+def test_limit_grows_up_to_max():
+    limiter = AdaptiveLimiter(max_limit=6, initial_limit=2)
+    limiter.on_success(1.0)
+    assert limiter.limit == 2.5
+
+    for _ in range(100):
+        limiter.on_success(1.0)
+    assert limiter.limit == 6
+
+
+def test_limit_holds_while_latency_climbs():
+    limiter = AdaptiveLimiter(max_limit=64, initial_limit=4, latency_tolerance=1.5)
+    for _ in range(10):
+        limiter.on_success(1.0)
+    limit = limiter.limit
+
+    for _ in range(10):
+        limiter.on_success(10.0)
+    assert limiter.limit == limit
+
+
+def test_limit_halves_once_per_window(clock):
+    limiter = AdaptiveLimiter(max_limit=64, initial_limit=16)
+    limiter.on_failure(throttled=True)
+    # Failures of requests sent before the decrease do not count again
+    limiter.on_failure(throttled=True)
+    assert limiter.limit == 8
+    assert (limiter.retries, limiter.throttled) == (2, 2)
+
+    for _ in range(10):
+        clock.now += 10
+        limiter.on_failure()
+    assert limiter.limit == 1
+
+
+def test_retry_after_pauses_requests(clock):
+    limiter = AdaptiveLimiter(max_limit=4)
+    limiter.on_failure(retry_after=5.0, throttled=True)
+    assert limiter._paused_until == clock.now + 5.0
+
+
+@pytest.mark.parametrize("max_retries", [0, 2])
+def test_retries_are_exhausted(monkeypatch, max_retries):
+    monkeypatch.setattr(model, "reserve_connections", lambda connections: None)
+    monkeypatch.setattr(model, "backoff_delay", lambda attempt: 0.0)
+    attempts = 0
+
+    async def complete(self, request):
+        nonlocal attempts
+        attempts += 1
+        raise status_error(503)
+
+    monkeypatch.setattr(RequestScheduler, "_complete", complete)
+    scheduler = RequestScheduler(max_retries=max_retries)
+
+    with pytest.raises(openai.APIStatusError):
+        asyncio.run(scheduler.submit({"provider": "mock"}))
+    assert attempts == max_retries + 1
+    assert scheduler._limiters["mock"].retries == max_retries + 1
+
+
+def test_non_retryable_errors_are_raised(monkeypatch):
+    monkeypatch.setattr(model, "reserve_connections", lambda connections: None)
+    attempts = 0
+
+    async def complete(self, request):
+        nonlocal attempts
+        attempts += 1
+        raise status_error(400)
+
+    monkeypatch.setattr(RequestScheduler, "_complete", complete)
+
+    with pytest.raises(openai.APIStatusError):
+        asyncio.run(RequestScheduler().submit({"provider": "mock"}))
+    assert attempts == 1
@@ -0,0 +1,97 @@
+import pytest
+
+from eval.pythonic import engine
+from eval.pythonic.engine import (
+    DANGEROUS_BUILTINS,
+    analyze_code,
+    compile_mock_functions,
+    execute_python_code,
+    import_functions,
+)
+
+MOCK_FUNCTIONS = '''
+def get_weather(city: str) -> dict:
+    return {"city": city, "temperature": 21}
+
+def convert(value: float, unit: str = "F") -> float:
+    return value * 9 / 5 + 32
+
+def convert(value: float, unit: str = "K") -> float:
+    return value + 273.15
+'''
+
+CODE = [
+    'weather = get_weather("Paris")\nkelvin = convert(weather["temperature"])',
+    'report = {"paris": get_weather("Paris"), "rome": get_weather("Rome")}',
+    'temps = [convert(t) for t in (1.0, 2.0)]',
+    "def helper():\n    return get_weather('Oslo')\n\nresult = helper()",
+    'exec("x = 1")\nweather = get_weather("Paris")',
+    "total = eval('1 + 1')",
+    'print("no calls")',
+]
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches(tmp_path, monkeypatch):
+    """Start every test with empty analysis and mock caches."""
+    monkeypatch.setattr(engine, "MOCK_FUNCTIONS_CACHE_PATH", str(tmp_path))
+    analyze_code.cache_clear()
+    compile_mock_functions.cache_clear()
+    yield
+    analyze_code.cache_clear()
+    compile_mock_functions.cache_clear()
+
+
+@pytest.mark.parametrize("code", CODE)
+@pytest.mark.parametrize("dangerous_builtins", [(), tuple(DANGEROUS_BUILTINS)])
+def test_memoized_analysis_matches_fresh_analysis(code, dangerous_builtins):
+    memoized = analyze_code(code, dangerous_builtins)
+
+    assert analyze_code(code, dangerous_builtins) is memoized
+    assert memoized == analyze_code.__wrapped__(code, dangerous_builtins)
+
+
+def test_analysis_depends_on_the_dangerous_builtins():
+    code = 'exec("x = 1")'
+
+    assert analyze_code(code, ("exec",)).violation == "exec"
+    assert analyze_code(code, ()).violation is None
+    assert analyze_code(code, ("exec",)).violation == "exec"
+
+
+def test_dangerous_builtins_take_precedence_over_mapping_errors():
+    # Assigning a call to an attribute cannot be mapped to a variable
+    code = 'self.weather = get_weather("Paris")\nexec("x = 1")'
+
+    for _ in range(2):
+        assert analyze_code(code, ("exec",)).violation == "exec"
+        with pytest.raises(AttributeError):
+            analyze_code(code, ())
+
+
+@pytest.mark.parametrize("code", CODE)
+def test_repeated_executions_match(code):
+    functions = import_functions(MOCK_FUNCTIONS)
+    first = execute_python_code(code, functions)
+    second = execute_python_code(code, functions)
+
+    assert second.model_dump() == first.model_dump()
+
+
+def test_cached_mock_functions_keep_their_precedence():
+    fresh = {f.__name__: f for f in import_functions(MOCK_FUNCTIONS)}
+    # Drop the in-memory copy so the next import loads the marshalled module
+    compile_mock_functions.cache_clear()
+    cached = {f.__name__: f for f in import_functions(MOCK_FUNCTIONS)}
+
+    assert fresh.keys() == cached.keys()
+    # The last definition of a function wins, as when the source is executed
+    assert fresh["convert"](0.0) == cached["convert"](0.0) == 273.15
+
+    # Mock functions take precedence over context variables of the same name
+    results = execute_python_code(
+        "kelvin = convert(0.0)",
+        list(cached.values()),
+        context_variables={"convert": lambda value: "shadowed"},
+    )
+    assert results.variables == {"kelvin": 273.15}
@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import pytest
+
+from eval import model
+from eval.model import RequestScheduler
+from eval.schemas import Completion
+
+
+class Attempts:
+    """Requests that each take the next of a list of latencies, and how they ended."""
+
+    def __init__(self, *latencies: float):
+        self.latencies = list(latencies)
+        self.started = []
+        self.cancelled = []
+
+    def __call__(self):
+        return self._attempt(len(self.started), self.latencies.pop(0))
+
+    async def _attempt(self, number: int, latency: float) -> Completion:
+        self.started.append(time.perf_counter())
+        try:
+            await asyncio.sleep(latency)
+        except asyncio.CancelledError:
+            self.cancelled.append(number)
+            raise
+        return Completion(text=f"attempt {number}", total_time=latency, ttft=latency)
+
+
+@pytest.fixture
+def scheduler(monkeypatch) -> RequestScheduler:
+    monkeypatch.setattr(model, "reserve_connections", lambda connections: None)
+    scheduler = RequestScheduler(hedge_percentile=95, hedge_max_ratio=0.5)
+    scheduler.requests["mock"] = 1
+    return scheduler
+
+
+def hedged(scheduler, attempts, delay):
+    async def run():
+        start = time.perf_counter()
+        completion = await scheduler._hedged(attempts, "mock", delay)
+        elapsed = time.perf_counter() - start
+        # Let the cancelled request handle its cancellation
+        await asyncio.sleep(0)
+        return completion, elapsed, start
+
+    return asyncio.run(run())
+
+
+def test_fast_requests_are_not_hedged(scheduler):
+    attempts = Attempts(0.01, 0.01)
+    completion, _, _ = hedged(scheduler, attempts, delay=0.2)
+
+    assert completion.text == "attempt 0"
+    assert completion.hedge is None
+    assert len(attempts.started) == 1
+    assert scheduler.hedged["mock"] == 0
+
+
+def test_hedge_fires_after_delay_and_wins(scheduler):
+    attempts = Attempts(1.0, 0.01)
+    completion, elapsed, start = hedged(scheduler, attempts, delay=0.05)
+
+    assert attempts.started[1] - start >= 0.05
+    assert completion.text == "attempt 1"
+    assert completion.hedge == "hedge"
+    # Timings count from the first request
+    assert completion.total_time >= 0.06
+    assert elapsed < 0.5
+    assert attempts.cancelled == [0]
+    assert (scheduler.hedged["mock"], scheduler.hedges_won["mock"]) == (1, 1)
+
+
+def test_primary_can_win_after_hedging(scheduler):
+    attempts = Attempts(0.1, 1.0)
+    completion, elapsed, _ = hedged(scheduler, attempts, delay=0.05)
+
+    assert completion.text == "attempt 0"
+    assert completion.hedge == "primary"
+    assert elapsed < 0.5
+    assert attempts.cancelled == [1]
+    assert (scheduler.hedged["mock"], scheduler.hedges_won["mock"]) == (1, 0)
+
+
+def test_hedge_budget_is_enforced(scheduler):
+    # A hedge was already sent for the only request, over the 50% budget
+    scheduler.hedged["mock"] = 1
+    attempts = Attempts(0.2, 0.01)
+    completion, _, _ = hedged(scheduler, attempts, delay=0.05)
+
+    assert completion.text == "attempt 0"
+    assert completion.hedge is None
+    assert len(attempts.started) == 1
+    assert scheduler.hedged["mock"] == 1
+
+
+def test_failed_request_falls_back_to_the_other(scheduler):
+    async def fail():
+        await asyncio.sleep(0.1)
+        raise ConnectionError("replica down")
+
+    attempts = Attempts(0.3)
+    calls = iter([fail, attempts])
+    completion, _, _ = hedged(scheduler, lambda: next(calls)(), delay=0.05)
+
+    assert completion.text == "attempt 0"
+    assert completion.hedge == "hedge"
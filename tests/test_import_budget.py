@@ -0,0 +1,18 @@
+import pytest
+
+from benchmarks.import_budget import SCENARIOS, import_times, measure
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    """Modules imported by the bare interpreter."""
+    return set(import_times(["-c", "pass"]))
+
+
+@pytest.mark.parametrize("scenario", list(SCENARIOS))
+def test_import_budget(scenario, baseline):
+    command, budget, forbidden = SCENARIOS[scenario]
+    elapsed, modules = measure(command, 3, baseline)
+
+    assert elapsed <= budget, f"{elapsed:.1f}ms of imports, budget {budget}ms"
+    assert not modules & set(forbidden)
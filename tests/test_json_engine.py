@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from eval.json_mode.engine import execute_json_function_calls, parse_json_completion
+from eval.pythonic.engine import import_functions
+
+MOCK_FUNCTIONS = '''
+def send_message(recipient: str, text: str) -> dict:
+    return {"recipient": recipient, "text": text}
+
+def spin() -> None:
+    while True:
+        pass
+'''
+
+ARGUMENTS = [
+    {"recipient": "Ana", "text": 'She said "hello" twice'},
+    {"recipient": "C:\\Users\\ana", "text": 'a \\"quoted\\" \\\\ path\n'},
+    {"recipient": "Zoë", "text": "café ☕ 東京 🚀"},
+]
+
+
+@pytest.mark.parametrize("args", ARGUMENTS)
+@pytest.mark.parametrize("fenced", [False, True])
+def test_arguments_reach_functions_unchanged(args, fenced):
+    calls = json.dumps([{"name": "send_message", "args": args}], ensure_ascii=False)
+    completion = f"```json\n{calls}\n```" if fenced else calls
+
+    results = execute_json_function_calls(
+        parse_json_completion(completion), import_functions(MOCK_FUNCTIONS)
+    )
+
+    assert results.errors == []
+    assert results.variables == {"result_0": args}
+    assert results.function_results == {"send_message": ["result_0"]}
+
+
+def test_calls_time_out():
+    calls = [
+        {"name": "send_message", "args": {"recipient": "Ana", "text": "first"}},
+        {"name": "spin", "args": {}},
+        {"name": "send_message", "args": {"recipient": "Ana", "text": "never"}},
+    ]
+
+    results = execute_json_function_calls(
+        calls, import_functions(MOCK_FUNCTIONS), timeout=0.1
+    )
+
+    assert results.variables == {"result_0": {"recipient": "Ana", "text": "first"}}
+    assert len(results.errors) == 1
+    assert results.errors[0].startswith("TimeoutError")
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from conftest import FakeScheduler, pythonic_manifest
+from eval.merge import merge_shards
+from eval.pipeline import run_pipeline
+from eval.results import read_results
+from eval.schemas import FunctionResults
+from eval.shard import shard_dirname
+from eval.util import load_pythonic_jsonl
+
+SHARDS = 3
+
+
+def execute_checklist(row, completion):
+    """Call every expected function, and bind the expected values of "all" rows."""
+    values = row.checklist.values if completion == "all" else []
+    results = FunctionResults(
+        function_results={name: [] for name in row.checklist.functions},
+        variables={f"value_{i}": value for i, value in enumerate(values)},
+        errors=[],
+    )
+    return {"code": completion}, results
+
+
+def evaluate(data_path, results_file, strict=False, shard=None):
+    rows = load_pythonic_jsonl(data_path)
+    return asyncio.run(
+        run_pipeline(
+            rows,
+            lambda row: {"messages": []},
+            execute_checklist,
+            FakeScheduler(lambda index: "all" if index % 3 else "functions"),
+            results_file,
+            {**pythonic_manifest(data_path), "strict": strict},
+            strict=strict,
+            shard=shard,
+        )
+    )
+
+
+def run_shards(run_dir, data_path, strict=False):
+    shard_dirs = []
+    for index in range(1, SHARDS + 1):
+        shard_dir = os.path.join(run_dir, shard_dirname((index, SHARDS)))
+        results_file = os.path.join(shard_dir, "results.jsonl")
+        evaluate(data_path, results_file, strict, (index, SHARDS))
+        shard_dirs.append(shard_dir)
+    return shard_dirs
+
+
+@pytest.mark.parametrize("strict", [False, True])
+def test_merge_matches_a_full_run(tmp_path, data_path, strict):
+    full = evaluate(data_path, str(tmp_path / "full" / "results.jsonl"), strict)
+    shard_dirs = run_shards(str(tmp_path / "run"), data_path, strict)
+
+    merged = merge_shards(shard_dirs)
+
+    assert merged["total_examples"] == full["total_examples"]
+    assert merged["overall_accuracy"] == full["overall_accuracy"]
+    full_scores = {
+        record["index"]: record["score"]
+        for record in read_results(str(tmp_path / "full" / "results.jsonl"))
+    }
+    merged_records = read_results(str(tmp_path / "run" / "results.jsonl"))
+    assert [record["index"] for record in merged_records] == sorted(full_scores)
+    assert {r["index"]: r["score"] for r in merged_records} == full_scores
+    with open(tmp_path / "full" / "eval_missing.json") as f:
+        full_missing = json.load(f)
+    with open(tmp_path / "run" / "eval_missing.json") as f:
+        assert json.load(f) == full_missing
+
+
+def test_merge_keeps_the_shard_scores(tmp_path, data_path):
+    shard_dirs = run_shards(str(tmp_path / "run"), data_path)
+    results_file = os.path.join(shard_dirs[0], "results.jsonl")
+    records = read_results(results_file)
+    # Scores the saved JSON results would not reproduce
+    records[0]["score"] = 0.25
+    with open(results_file, "w") as f:
+        f.writelines(json.dumps(record) + "\n" for record in records)
+
+    merge_shards(shard_dirs)
+
+    merged = read_results(str(tmp_path / "run" / "results.jsonl"))
+    assert {r["index"]: r["score"] for r in merged}[records[0]["index"]] == 0.25
+
+
+def test_merge_fails_on_inconsistent_scores(tmp_path, data_path):
+    shard_dirs = run_shards(str(tmp_path / "run"), data_path, strict=True)
+    results_file = os.path.join(shard_dirs[1], "results.jsonl")
+    records = read_results(results_file)
+    records[0]["score"] = 0.5
+    with open(results_file, "w") as f:
+        f.writelines(json.dumps(record) + "\n" for record in records)
+
+    with pytest.raises(ValueError, match="strict"):
+        merge_shards(shard_dirs)
+
+
+def test_merge_checks_the_shards(tmp_path, data_path):
+    shard_dirs = run_shards(str(tmp_path / "run"), data_path)
+
+    with pytest.raises(ValueError, match="Missing shards 3"):
+        merge_shards(shard_dirs[:2])
+    with pytest.raises(ValueError, match="both in"):
+        merge_shards([shard_dirs[0], shard_dirs[0], shard_dirs[1]])
+
+    results_file = os.path.join(shard_dirs[2], "results.jsonl")
+    records = read_results(results_file)
+    with open(results_file, "w") as f:
+        f.writelines(json.dumps(record) + "\n" for record in records[1:])
+    with pytest.raises(ValueError, match="lacks 1 rows"):
+        merge_shards(shard_dirs)
+
+    records[0]["row_id"] = "0" * 16
+    with open(results_file, "w") as f:
+        f.writelines(json.dumps(record) + "\n" for record in records)
+    with pytest.raises(ValueError, match="differs from the dataset row"):
+        merge_shards(shard_dirs)
+
+
+def test_merge_of_an_indexed_dataset(tmp_path, data_path, indexed_data_path):
+    full = evaluate(data_path, str(tmp_path / "full" / "results.jsonl"))
+    shard_dirs = run_shards(str(tmp_path / "run"), indexed_data_path)
+
+    merged = merge_shards(shard_dirs)
+
+    assert merged["total_examples"] == full["total_examples"]
+    assert merged["overall_accuracy"] == full["overall_accuracy"]
+    full_ids = [r["row_id"] for r in read_results(str(tmp_path / "full/results.jsonl"))]
+    merged_records = read_results(str(tmp_path / "run" / "results.jsonl"))
+    assert sorted(r["row_id"] for r in merged_records) == sorted(full_ids)
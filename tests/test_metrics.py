@@ -0,0 +1,24 @@
+import logging
+
+from eval import metrics
+from eval.metrics import summarize_run
+
+RECORDS = [
+    {"generation_time": 1.0, "prompt_tokens": 1_000_000, "completion_tokens": 100_000}
+]
+
+
+def test_default_model_is_priced():
+    summary = summarize_run(RECORDS, "anthropic/claude-3.5-sonnet", "openrouter", 1.0)
+    assert summary["estimated_cost"] == 3.0 + 1.5
+
+
+def test_missing_prices_are_reported_once(monkeypatch, caplog):
+    monkeypatch.setattr(metrics, "_UNPRICED", set())
+    with caplog.at_level(logging.WARNING, logger="eval.metrics"):
+        for _ in range(3):
+            summary = summarize_run(RECORDS, "unpriced/model", "openrouter", 1.0)
+
+    assert summary["estimated_cost"] is None
+    warnings = [r for r in caplog.records if "openrouter:unpriced/model" in r.message]
+    assert len(warnings) == 1
@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import pytest
+from openai import AsyncOpenAI
+
+from benchmarks.mock_server import MockServer
+from eval import model
+from eval.model import RequestScheduler, _request_completion
+from eval.schemas import Completion
+
+MESSAGES = [
+    {"role": "system", "content": "Write Python code."},
+    {"role": "user", "content": "Add two numbers."},
+]
+COMPLETION = "```python\ntotal = add(1, 2)\n```\n\nThe sum is stored in total."
+
+
+async def complete(stop_at):
+    server = MockServer(completions={("pythonic", "Add two numbers."): COMPLETION})
+    listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    client = AsyncOpenAI(base_url=f"http://127.0.0.1:{port}/v1", api_key="mock")
+    try:
+        async with listener:
+            return await _request_completion(client, "mock", MESSAGES, 0.0, stop_at)
+    finally:
+        await client.close()
+
+
+@pytest.mark.parametrize("stop_at", [None, lambda text: None])
+def test_usage_is_reported(stop_at):
+    completion = asyncio.run(complete(stop_at))
+
+    assert completion.text == COMPLETION
+    assert completion.prompt_tokens == sum(len(m["content"]) for m in MESSAGES) // 4
+    assert completion.completion_tokens == len(COMPLETION.split())
+    assert not completion.stopped_early
+
+
+def test_streams_stop_early():
+    def stop_at(text):
+        end = text.find("```", 3)
+        return end + 3 if end >= 0 else None
+
+    completion = asyncio.run(complete(stop_at))
+
+    assert completion.text == "```python\ntotal = add(1, 2)\n```"
+    assert completion.stopped_early
+    assert completion.ttft is not None
+
+
+def peak_in_flight(monkeypatch, replicas: int) -> int:
+    """Most requests a stream keeps in flight to a provider with some replicas."""
+    urls = [f"http://127.0.0.1:{8100 + i}/v1" for i in range(replicas)]
+    monkeypatch.setitem(model.PROVIDER_URLS, "mock", (urls, "mock"))
+    monkeypatch.setattr(model, "reserve_connections", lambda connections: None)
+    in_flight = peak = 0
+
+    async def complete(self, request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return Completion(text="")
+
+    monkeypatch.setattr(RequestScheduler, "_complete", complete)
+    scheduler = RequestScheduler(max_concurrency=4, provider_limits={"mock": 4})
+    requests = [{"provider": "mock"} for _ in range(48)]
+
+    async def run():
+        async for _ in scheduler.stream(requests):
+            pass
+
+    asyncio.run(run())
+    return peak
+
+
+def test_window_grows_with_replicas(monkeypatch):
+    assert peak_in_flight(monkeypatch, 1) == 4
+    assert peak_in_flight(monkeypatch, 3) == 12
+
+
+def test_window_refills_as_each_request_completes(monkeypatch):
+    monkeypatch.setitem(model.PROVIDER_URLS, "mock", (["http://127.0.0.1/v1"], "mock"))
+    monkeypatch.setattr(model, "reserve_connections", lambda connections: None)
+    latencies = [0.4, 0.05, 0.05, 0.05, 0.05]
+    started = {}
+
+    async def complete(self, request):
+        started[request["row_index"]] = time.perf_counter()
+        await asyncio.sleep(latencies[request["row_index"]])
+        return Completion(text="")
+
+    monkeypatch.setattr(RequestScheduler, "_complete", complete)
+    scheduler = RequestScheduler(max_concurrency=2, provider_limits={"mock": 2})
+    requests = [{"provider": "mock", "row_index": i} for i in range(len(latencies))]
+
+    async def run():
+        start = time.perf_counter()
+        order = [index async for index, _ in scheduler.stream(requests)]
+        return start, order
+
+    start, order = asyncio.run(run())
+
+    # The slow request holds one slot while the others go through the second one
+    assert order == [1, 2, 3, 4, 0]
+    assert all(started[i] - start < 0.3 for i in range(1, 5))
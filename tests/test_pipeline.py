@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+import pytest
+
+from conftest import FakeScheduler, pythonic_manifest
+from eval.adaptive import SequentialStop
+from eval.pipeline import run_pipeline
+from eval.results import read_results
+from eval.schemas import FunctionResults
+from eval.util import load_pythonic_jsonl
+
+
+class Incomparable:
+    """A value that cannot be compared with the expected values."""
+
+    __hash__ = None
+
+    def __eq__(self, other):
+        raise RuntimeError("cannot compare")
+
+
+def execute_variables(row, completion):
+    """Execute a completion naming the value to bind to a variable."""
+    values = {
+        "range": range(3),
+        "bytes": b"\xff\xfe",
+        "incomparable": Incomparable(),
+        "none": None,
+    }
+    results = FunctionResults(
+        function_results={}, variables={"x": values[completion]}, errors=[]
+    )
+    return {"code": completion}, results
+
+
+def error_record(row, completion, error):
+    return {"score": 0.0, "results": f"Error processing row: {error}"}
+
+
+def test_unscorable_results_only_fail_their_row(tmp_path, data_path):
+    rows = load_pythonic_jsonl(data_path)[:4]
+    completions = ["range", "bytes", "incomparable", "none"]
+    results_file = str(tmp_path / "results.jsonl")
+
+    metrics = asyncio.run(
+        run_pipeline(
+            rows,
+            lambda row: {"messages": []},
+            execute_variables,
+            FakeScheduler(lambda index: completions[index]),
+            results_file,
+            pythonic_manifest(data_path),
+            on_error=error_record,
+        )
+    )
+
+    assert metrics["total_examples"] == 4
+    assert len(metrics["errors"]) == 3
+    records = {record["index"]: record for record in read_results(results_file)}
+    assert sorted(records) == [0, 1, 2, 3]
+    assert all(records[index]["score"] == 0 for index in range(3))
+    assert json.loads(records[3]["results"])["variables"] == {"x": None}
+
+
+def execute_expected(row, completion):
+    """Bind every expected value, so that each executed row is fully correct."""
+    results = FunctionResults(
+        function_results={name: [] for name in row.checklist.functions},
+        variables={f"value_{i}": v for i, v in enumerate(row.checklist.values)},
+        errors=[],
+    )
+    return {"code": completion}, results
+
+
+@pytest.mark.parametrize("stopping", [None, SequentialStop(min_rows=1000)])
+def test_failed_requests_count_as_wrong_rows(tmp_path, data_path, stopping):
+    rows = load_pythonic_jsonl(data_path)[:20]
+
+    def completion(index):
+        return ConnectionError("provider down") if index % 4 == 0 else "all"
+
+    metrics = asyncio.run(
+        run_pipeline(
+            rows,
+            lambda row: {"messages": []},
+            execute_expected,
+            FakeScheduler(completion),
+            str(tmp_path / "results.jsonl"),
+            pythonic_manifest(data_path),
+            stopping=stopping,
+        )
+    )
+
+    assert metrics["total_examples"] == 20
+    assert metrics["overall_accuracy"] == 75.0
+    if stopping is not None:
+        assert metrics["adaptive"]["strict_accuracy"] == 75.0
@@ -0,0 +1,98 @@
+import asyncio
+import os
+
+import pytest
+
+from conftest import FakeScheduler
+from eval.json_mode import eval as json_mode
+from eval.pythonic import eval as pythonic
+from eval.pythonic.sandbox import SandboxPool
+from eval.results import read_results
+from eval.util import load_pythonic_jsonl, split_functions_schema
+
+MODES = [
+    (pythonic.evaluate_model_pythonic, pythonic, "PYTHONIC_RESULTS_PATH", "```\n```"),
+    (json_mode.evaluate_model_json, json_mode, "JSON_RESULTS_PATH", "[]"),
+]
+
+
+@pytest.fixture(scope="module")
+def sandbox():
+    with SandboxPool(workers=1) as sandbox:
+        yield sandbox
+
+
+@pytest.fixture
+def rows(data_path):
+    """Rows 8 and 9 ask other questions about the functions of rows 0 and 1."""
+    rows = load_pythonic_jsonl(data_path)[:8]
+    return rows + [
+        rows[i].model_copy(update={"user_query": f"Another question {i}"})
+        for i in range(2)
+    ]
+
+
+@pytest.mark.parametrize("evaluate, module, results_path, completion", MODES)
+def test_prompts_share_prefix_and_keep_rows(
+    tmp_path,
+    monkeypatch,
+    sandbox,
+    rows,
+    data_path,
+    evaluate,
+    module,
+    results_path,
+    completion,
+):
+    monkeypatch.setattr(module, results_path, str(tmp_path))
+    scheduler = FakeScheduler(lambda index: completion)
+
+    asyncio.run(
+        evaluate(
+            "fake-model",
+            "fake",
+            data_path=data_path,
+            prefix_cache=True,
+            cache_hints=True,
+            rows=rows,
+            scheduler=scheduler,
+            sandbox=sandbox,
+        )
+    )
+
+    # Rows sharing a schema are requested one after the other, in dataset order
+    assert scheduler.requested == [0, 8, 1, 9, 2, 3, 4, 5, 6, 7]
+    prompts = {
+        request["row_index"]: request["system_prompt"].encode("utf-8")
+        for request in scheduler.requests
+    }
+    prefixes = {
+        prompts[request["row_index"]][: request["cache_prefix"]]
+        for request in scheduler.requests
+    }
+    assert len(prefixes) == 1
+    assert prompts[8] == prompts[0] and prompts[9] == prompts[1]
+    assert len(set(prompts.values())) == 8
+
+    # Records keep the index of the row they were evaluated from
+    (results_dir,) = os.listdir(tmp_path)
+    records = list(read_results(str(tmp_path / results_dir / "results.jsonl")))
+    assert [record["index"] for record in records] == scheduler.requested
+    for record in records:
+        assert record["user_query"] == rows[record["index"]].user_query
+
+
+@pytest.mark.parametrize(
+    "path", ["eval/pythonic/system_prompt.txt", "eval/json_mode/system_prompt.txt"]
+)
+def test_schema_moves_after_instructions(path):
+    with open(os.path.join(os.path.dirname(__file__), "..", path)) as f:
+        system_prompt = f.read()
+
+    static, row_prompt = split_functions_schema(system_prompt)
+
+    # The instructions before the schema stay first, the schema block moves last
+    before, _, _ = system_prompt.partition(row_prompt)
+    assert static.startswith(before)
+    assert "{{functions_schema}}" not in static
+    assert "{{functions_schema}}" in row_prompt
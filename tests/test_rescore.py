@@ -0,0 +1,57 @@
+import asyncio
+import os
+from functools import partial
+
+from benchmarks.bench_engine import reference_completions
+from conftest import FakeScheduler, pythonic_manifest
+from eval.adaptive import SequentialStop
+from eval.pipeline import run_pipeline
+from eval.pythonic import eval as pythonic
+from eval.pythonic.sandbox import SandboxPool
+from eval.rescore import rescore_run
+from eval.results import read_results
+from eval.util import load_pythonic_jsonl
+
+
+def evaluate(data_path, run_dir, stopping=None):
+    rows = load_pythonic_jsonl(data_path)
+    completions = [reference_completions(row)["pythonic"] for row in rows]
+    with SandboxPool(workers=2) as sandbox:
+        return asyncio.run(
+            run_pipeline(
+                rows,
+                lambda row: {"messages": []},
+                partial(pythonic.execute_completion, sandbox),
+                FakeScheduler(lambda index: completions[index]),
+                os.path.join(run_dir, "results.jsonl"),
+                pythonic_manifest(data_path),
+                on_error=pythonic.error_record,
+                stopping=stopping,
+            )
+        )
+
+
+def test_rescore_matches_the_run(tmp_path, data_path):
+    run_dir = str(tmp_path / "run")
+    metrics = evaluate(data_path, run_dir)
+
+    rescored = asyncio.run(rescore_run(run_dir))
+
+    assert rescored["total_examples"] == metrics["total_examples"] == 100
+    assert rescored["overall_accuracy"] == metrics["overall_accuracy"] > 0
+    scores = {r["index"]: r["score"] for r in read_results(f"{run_dir}/results.jsonl")}
+    rescores = read_results(f"{run_dir}/rescore/results.jsonl")
+    assert {r["index"]: r["score"] for r in rescores} == scores
+
+
+def test_rescore_of_a_run_stopped_early(tmp_path, data_path):
+    run_dir = str(tmp_path / "run")
+    metrics = evaluate(data_path, run_dir, SequentialStop(max_width=60, min_rows=20))
+    assert metrics["adaptive"]["decision"] == "precise"
+    assert metrics["total_examples"] < 100
+
+    rescored = asyncio.run(rescore_run(run_dir))
+
+    assert rescored["total_examples"] == metrics["total_examples"]
+    assert rescored["overall_accuracy"] == metrics["overall_accuracy"]
+    assert rescored["errors"] == []
@@ -0,0 +1,110 @@
+import asyncio
+import json
+
+import pytest
+
+from conftest import FakeScheduler, pythonic_manifest
+from eval.pipeline import run_pipeline
+from eval.results import build_manifest, read_results
+from eval.schemas import FunctionResults
+from eval.util import load_pythonic_jsonl
+
+ROWS = 12
+
+
+def execute_checklist(row, completion):
+    """Call every expected function, and bind the expected values of "all" rows."""
+    values = row.checklist.values if completion == "all" else []
+    results = FunctionResults(
+        function_results={name: [] for name in row.checklist.functions},
+        variables={f"value_{i}": value for i, value in enumerate(values)},
+        errors=[],
+    )
+    return {"code": completion}, results
+
+
+def evaluate(data_path, results_file, scheduler, manifest=None, resume=False):
+    rows = load_pythonic_jsonl(data_path)[:ROWS]
+    return asyncio.run(
+        run_pipeline(
+            rows,
+            lambda row: {"messages": []},
+            execute_checklist,
+            scheduler,
+            results_file,
+            manifest or pythonic_manifest(data_path),
+            resume=resume,
+        )
+    )
+
+
+def completion(index):
+    return "all" if index % 3 else "functions"
+
+
+def test_resume_evaluates_the_missing_rows(tmp_path, data_path):
+    full = evaluate(data_path, str(tmp_path / "full.jsonl"), FakeScheduler(completion))
+
+    results_file = str(tmp_path / "run" / "results.jsonl")
+    failing = FakeScheduler(
+        lambda index: ConnectionError("down") if index % 2 else completion(index)
+    )
+    interrupted = evaluate(data_path, results_file, failing)
+    assert len(interrupted["errors"]) == ROWS // 2
+    # A row cut short while being written
+    with open(results_file, "a") as f:
+        f.write('{"index": 1, "score"')
+
+    scheduler = FakeScheduler(completion)
+    resumed = evaluate(data_path, results_file, scheduler, resume=True)
+
+    assert sorted(scheduler.requested) == list(range(1, ROWS, 2))
+    assert resumed == full
+    records = read_results(results_file)
+    assert sorted(record["index"] for record in records) == list(range(ROWS))
+
+
+def test_resume_requires_a_matching_run(tmp_path, data_path):
+    results_file = str(tmp_path / "results.jsonl")
+    evaluate(data_path, results_file, FakeScheduler(completion))
+    manifest = pythonic_manifest(data_path)
+    streamed = pythonic_manifest(data_path, stream=True)
+
+    for changed, changes in [
+        ("strict", {"strict": True}),
+        ("model_name", {"model_name": "other"}),
+        ("prompt_hash", {"prompt_hash": "0" * 64}),
+        ("settings", {"settings": streamed["settings"]}),
+    ]:
+        with pytest.raises(ValueError, match=f"{changed} changed"):
+            scheduler = FakeScheduler(completion)
+            evaluate(
+                data_path, results_file, scheduler, {**manifest, **changes}, resume=True
+            )
+
+
+def test_runs_start_over_without_resume(tmp_path, data_path):
+    results_file = str(tmp_path / "results.jsonl")
+    evaluate(data_path, results_file, FakeScheduler(completion))
+
+    scheduler = FakeScheduler(completion)
+    evaluate(data_path, results_file, scheduler)
+
+    assert scheduler.requested == list(range(ROWS))
+    assert len(read_results(results_file)) == ROWS
+    with open(tmp_path / "manifest.json") as f:
+        assert json.load(f) == pythonic_manifest(data_path)
+
+
+def test_manifest_describes_the_run(data_path):
+    manifest = pythonic_manifest(data_path)
+    assert manifest["mode"] == "pythonic"
+    assert manifest["settings"]["stream"] is False
+    # Options added later are only recorded when enabled, so older runs still resume
+    assert "prefix_cache" not in manifest["settings"]
+    assert pythonic_manifest(data_path, prefix_cache=True)["settings"]["prefix_cache"]
+    first, second = (
+        build_manifest("pythonic", "m", "p", False, data_path, prompt)
+        for prompt in ["a", "b"]
+    )
+    assert first["prompt_hash"] != second["prompt_hash"]
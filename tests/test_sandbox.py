@@ -0,0 +1,91 @@
+import asyncio
+from functools import partial
+
+import pytest
+
+from conftest import FakeScheduler, pythonic_manifest
+from eval.json_mode import eval as json_mode
+from eval.pipeline import run_pipeline
+from eval.pythonic import eval as pythonic
+from eval.pythonic.sandbox import SandboxPool
+from eval.util import load_pythonic_jsonl
+
+MOCK_FUNCTIONS = '''
+def add(a: int, b: int) -> int:
+    return a + b
+
+def fail() -> None:
+    raise ValueError("mock failure")
+'''
+
+
+@pytest.fixture(scope="module")
+def sandbox():
+    with SandboxPool(workers=1) as sandbox:
+        yield sandbox
+
+
+def test_executes_code(sandbox):
+    results = sandbox.execute("total = add(1, 2)", MOCK_FUNCTIONS)
+    assert results.variables == {"total": 3}
+    assert results.function_results == {"add": ["total"]}
+    assert results.errors == []
+
+
+def test_mock_function_errors_are_results(sandbox):
+    results = sandbox.execute("total = add(1, 2)\nfail()", MOCK_FUNCTIONS)
+    assert results.variables == {"total": 3}
+    assert len(results.errors) == 1
+    assert results.errors[0].startswith("ValueError: mock failure")
+
+
+def test_harness_errors_are_raised(sandbox):
+    with pytest.raises(SyntaxError):
+        sandbox.execute("total = add(1,", MOCK_FUNCTIONS)
+    with pytest.raises(TypeError):
+        sandbox.execute_json(None, MOCK_FUNCTIONS)
+    # The worker keeps serving executions
+    assert sandbox.execute("total = add(2, 2)", MOCK_FUNCTIONS).variables == {
+        "total": 4
+    }
+
+
+@pytest.mark.parametrize(
+    "module, completion",
+    [(pythonic, "```python\nresult = (\n```"), (json_mode, "no function calls")],
+)
+def test_bad_completions_are_run_errors(tmp_path, data_path, module, completion):
+    rows = load_pythonic_jsonl(data_path)[:2]
+    results_file = str(tmp_path / "results.jsonl")
+
+    with SandboxPool(workers=1) as sandbox:
+        metrics = asyncio.run(
+            run_pipeline(
+                rows,
+                lambda row: {"messages": []},
+                partial(module.execute_completion, sandbox),
+                FakeScheduler(lambda index: completion),
+                results_file,
+                pythonic_manifest(data_path),
+                on_error=module.error_record,
+            )
+        )
+
+    assert metrics["total_examples"] == 2
+    assert metrics["overall_accuracy"] == 0
+    assert len(metrics["errors"]) == 2
+    assert all(error.startswith("Error processing row") for error in metrics["errors"])
+
+
+def test_preload_stops_at_limit(monkeypatch):
+    monkeypatch.setattr("eval.pythonic.sandbox.SANDBOX_PRELOAD_LIMIT", 2)
+    read = []
+
+    def sources():
+        for source in ["a = 1", "a = 1", "b = 2", "c = 3", "d = 4"]:
+            read.append(source)
+            yield source
+
+    with SandboxPool(workers=0, mock_functions=sources()) as pool:
+        assert pool._worker_args[0] == ["a = 1", "b = 2"]
+    assert len(read) == 4
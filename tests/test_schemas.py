@@ -0,0 +1,96 @@
+import math
+
+import pytest
+
+from eval.schemas import FunctionResults, ValueIndex, values_match
+from eval.settings import FLOAT_TOLERANCE
+from eval.util import load_pythonic_jsonl
+
+
+class Unhashable:
+    __hash__ = None
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, Unhashable) and other.value == self.value
+
+
+VALUES = [
+    1,
+    1.0,
+    True,
+    0,
+    False,
+    None,
+    0.3,
+    0.1 + 0.2,
+    0.3 + FLOAT_TOLERANCE / 2,
+    0.3 + FLOAT_TOLERANCE * 2,
+    math.nan,
+    math.inf,
+    "1",
+    "",
+    "example",
+    [1, 2],
+    (1, 2),
+    [0.3],
+    {"a": [1, 2], "b": {"c": None}},
+    {"a": [1, 2], "b": {"c": 0}},
+    {1, 2},
+    frozenset({1, 2}),
+    [[1, {"a": 2}]],
+    Unhashable(1),
+    [Unhashable(1)],
+]
+
+
+@pytest.mark.parametrize("expected", VALUES, ids=repr)
+def test_value_index_matches_linear_search(expected):
+    index = ValueIndex(VALUES)
+    assert index.contains(expected) == any(
+        values_match(expected, value) for value in VALUES
+    )
+    for value in VALUES:
+        single = ValueIndex([value])
+        assert single.contains(expected) == values_match(expected, value)
+
+
+def linear_score(results, values, functions):
+    """Score of a row as computed before the value index."""
+    variables = list(results.variables.values())
+    matched = [v for v in values if any(values_match(v, x) for x in variables)]
+    values_score = 0.5 * (len(matched) / len(values) if values else 1.0)
+    called = [f for f in functions if f in results.function_results]
+    functions_score = 0.5 * (len(called) / len(functions) if functions else 1.0)
+    return values_score + functions_score
+
+
+def test_scores_match_linear_search(data_path):
+    for position, row in enumerate(load_pythonic_jsonl(data_path)):
+        values = row.checklist.values
+        functions = row.checklist.functions
+        # Keep every other expected value and function, and add unrelated ones
+        called = functions[position % 2 :: 2]
+        results = FunctionResults(
+            function_results={name: [] for name in called},
+            variables={
+                **{f"value_{i}": value for i, value in enumerate(values[::2])},
+                "noise": [position],
+                "other": position + 0.5,
+            },
+            errors=[],
+        )
+        score, missing_values, missing_functions = results.score_with_missing(
+            values, functions
+        )
+        assert score == linear_score(results, values, functions)
+        assert missing_functions == [name for name in functions if name not in called]
+        assert all(value in values[1::2] for value in missing_values)
+
+
+def test_score_without_expectations():
+    results = FunctionResults(function_results={}, variables={}, errors=[])
+    assert results.check_score([], []) == 1.0
+    assert results.score_with_missing([1], ["add"]) == (0.0, [1], ["add"])
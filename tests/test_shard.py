@@ -0,0 +1,28 @@
+import pytest
+
+from eval.shard import parse_shard, row_id, shard_indices
+from eval.util import load_pythonic_jsonl
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+    for spec in ["0/4", "5/4", "1/0", "1", "a/b"]:
+        with pytest.raises(ValueError):
+            parse_shard(spec)
+
+
+def test_indexed_rows_have_the_same_ids(data_path, indexed_data_path):
+    rows = load_pythonic_jsonl(data_path)
+    indexed_rows = load_pythonic_jsonl(indexed_data_path)
+
+    assert [row_id(row) for row in indexed_rows] == [row_id(row) for row in rows]
+    for shard in [(1, 3), (2, 3), (3, 3)]:
+        assert shard_indices(indexed_rows, shard) == shard_indices(rows, shard)
+
+
+def test_shards_partition_the_dataset(data_path):
+    rows = load_pythonic_jsonl(data_path)
+    shards = [shard_indices(rows, (index, 4)) for index in range(1, 5)]
+
+    assert sorted(sum(shards, [])) == list(range(len(rows)))
+    assert all(shards)
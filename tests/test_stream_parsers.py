@@ -0,0 +1,75 @@
+import pytest
+
+from eval.json_mode.engine import JsonArrayStream, parse_json_completion
+from eval.util import CodeBlockStream, extract_codeblocks
+
+
+def stream(parser, completion, chunk_size):
+    """Feed a completion in chunks, and return the text kept once the parser stops."""
+    feed = parser().feed
+    text = ""
+    for start in range(0, len(completion), chunk_size):
+        text += completion[start : start + chunk_size]
+        end = feed(text)
+        if end is not None:
+            return text[:end]
+    return text
+
+
+CODE_COMPLETIONS = [
+    # A single block followed by chatter
+    "Calling it:\n```python\nresult = add(1, 2)\n```\nThe result is 3.",
+    # Imports in their own block, then the calls
+    "```python\nimport math\n```\nNow:\n```python\nresult = add(1, 2)\n```\nDone.",
+    # An outline without calls, then the calls
+    "```python\n# Add the numbers\n```\n```python\nresult = add(1, 2)\n```",
+    # No code block at all
+    "I cannot help with that.",
+]
+
+
+@pytest.mark.parametrize("completion", CODE_COMPLETIONS)
+@pytest.mark.parametrize("chunk_size", [1, 3, 1000])
+def test_code_block_stream_matches_the_full_parse(completion, chunk_size):
+    kept = stream(CodeBlockStream, completion, chunk_size)
+    assert extract_codeblocks(kept) == extract_codeblocks(completion)
+
+
+def test_code_block_stream_stops_after_the_first_block_with_calls():
+    completion = (
+        "```python\nimport math\n```\n```python\nx = add(1, 2)\n```\n"
+        "Also:\n```python\ny = add(3, 4)\n```"
+    )
+    kept = stream(CodeBlockStream, completion, 1)
+    assert kept == "```python\nimport math\n```\n```python\nx = add(1, 2)\n```"
+    assert extract_codeblocks(kept) == "\nimport math\n\n\nx = add(1, 2)\n"
+    # Unlike the full parse, later blocks are not read
+    assert "y = add(3, 4)" in extract_codeblocks(completion)
+
+
+def test_code_block_stream_needs_a_closed_block():
+    parser = CodeBlockStream()
+    assert parser.feed("```python\nx = add(1, 2)\n") is None
+    assert parser.feed("```python\nx = add(1, 2)\n``") is None
+    assert parser.feed("```python\nx = add(1, 2)\n```") == len(
+        "```python\nx = add(1, 2)\n```"
+    )
+
+
+CALLS = [{"name": "add", "args": {"a": 1, "b": 2}}]
+JSON_COMPLETIONS = [
+    ('[{"name": "add", "args": {"a": 1, "b": 2}}] That is all.', CALLS),
+    ('```json\n[{"name": "add", "args": {"a": 1, "b": 2}}]\n```\nDone.', CALLS),
+    # Brackets and quotes inside strings do not end the array
+    (
+        '[{"name": "say", "args": {"text": "a ] \\" ["}}]\nThat is all.',
+        [{"name": "say", "args": {"text": 'a ] " ['}}],
+    ),
+]
+
+
+@pytest.mark.parametrize("completion, calls", JSON_COMPLETIONS)
+@pytest.mark.parametrize("chunk_size", [1, 4, 1000])
+def test_json_array_stream_keeps_the_calls(completion, calls, chunk_size):
+    kept = stream(JsonArrayStream, completion, chunk_size)
+    assert parse_json_completion(kept) == calls == parse_json_completion(completion)
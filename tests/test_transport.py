@@ -0,0 +1,41 @@
+import asyncio
+
+from eval import transport
+from eval.model import RequestScheduler
+
+
+def test_connections_are_reserved_for_the_providers_used(monkeypatch):
+    monkeypatch.setattr(transport, "_keepalive_connections", 0)
+
+    scheduler = RequestScheduler(provider_limits={"mock": 8}, providers=["mock"])
+    assert transport._keepalive_connections == 8
+
+    # Providers first used later add their own connections
+    scheduler._limiter("ollama")
+    assert transport._keepalive_connections == 8 + scheduler.provider_limits["ollama"]
+
+
+def test_hedging_reserves_headroom(monkeypatch):
+    monkeypatch.setattr(transport, "_keepalive_connections", 0)
+
+    RequestScheduler(
+        provider_limits={"mock": 10},
+        hedge_percentile=95,
+        hedge_max_ratio=0.2,
+        providers=["mock"],
+    )
+    assert transport._keepalive_connections == 10 + 2 + 1
+
+
+def test_pool_is_closed():
+    async def run():
+        client = transport.http_client()
+        assert transport.http_client() is client
+        await transport.aclose()
+        assert client.is_closed
+        reopened = transport.http_client()
+        assert reopened is not client
+        await transport.aclose()
+        return reopened
+
+    assert asyncio.run(run()).is_closed